@@ -11,7 +11,10 @@ import os
 from dotenv import load_dotenv
 from concurrent.futures import ThreadPoolExecutor
 import json
-import redis
+import contextvars
+import threading
+
+import tracing
 
 # 加载环境变量
 load_dotenv()
@@ -30,11 +33,36 @@ REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
 
-# 创建Redis连接
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+EMAIL_EXECUTOR_WORKERS = 5  # 发送邮件的线程数
+
+# Redis 连接和发送邮件的线程池在第一次使用时创建，导入 auth 的工具脚本和 worker 启动时不创建
+_redis_client = None
+_email_executor: Optional[ThreadPoolExecutor] = None
+_lazy_lock = threading.Lock()
+
+
+def get_redis_client():
+    """获取全局 Redis 客户端"""
+    global _redis_client
+    if _redis_client is None:
+        with _lazy_lock:
+            if _redis_client is None:
+                import redis
+                _redis_client = tracing.instrument_redis(
+                    redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+                )
+    return _redis_client
+
 
-# 创建全局线程池
-email_executor = ThreadPoolExecutor(max_workers=5)
+def _get_email_executor() -> ThreadPoolExecutor:
+    """获取发送邮件的全局线程池"""
+    global _email_executor
+    if _email_executor is None:
+        with _lazy_lock:
+            if _email_executor is None:
+                _email_executor = ThreadPoolExecutor(max_workers=EMAIL_EXECUTOR_WORKERS,
+                                                     thread_name_prefix="email")
+    return _email_executor
 
 
 def generate_verification_code(length: int = 6) -> str:
@@ -45,11 +73,12 @@ def generate_verification_code(length: int = 6) -> str:
 def _send_email_sync(email: str, msg: MIMEMultipart) -> bool:
     """同步发送邮件的辅助函数"""
     try:
-        server = smtplib.SMTP_SSL('smtp.qq.com', 465)
-        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_ADDRESS, email, text)
-        server.quit()
+        with tracing.span("smtp.send", "CLIENT", **{"smtp.host": "smtp.qq.com"}):
+            server = smtplib.SMTP_SSL('smtp.qq.com', 465)
+            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+            text = msg.as_string()
+            server.sendmail(EMAIL_ADDRESS, email, text)
+            server.quit()
         return True
     except Exception as e:
         print(f"发送邮件失败: {e}")
@@ -63,7 +92,7 @@ def send_verification_code(email: str) -> bool:
 
         # 存储到Redis，设置5分钟过期时间
         redis_key = f"verification_code:{email}"
-        redis_client.setex(redis_key, 2 * 60, code)  # 直接存储验证码，5分钟后自动过期
+        get_redis_client().setex(redis_key, 2 * 60, code)  # 直接存储验证码，5分钟后自动过期
 
         # 创建邮件
         msg = MIMEMultipart()
@@ -74,8 +103,8 @@ def send_verification_code(email: str) -> bool:
         body = f"您的验证码是: 【{code}】，2分钟内有效，请勿泄露给他人"
         msg.attach(MIMEText(body, 'plain', 'utf-8'))
 
-        # 在线程池中执行发送邮件操作
-        email_executor.submit(_send_email_sync, email, msg)
+        # 在线程池中执行发送邮件操作（带上当前上下文，发送邮件的 span 属于当前请求的 trace）
+        _get_email_executor().submit(contextvars.copy_context().run, _send_email_sync, email, msg)
 
         return True
     except Exception as e:
@@ -85,13 +114,13 @@ def send_verification_code(email: str) -> bool:
 def is_code_expired(email: str) -> bool:
     """检查验证码是否过期"""
     redis_key = f"verification_code:{email}"
-    return not redis_client.exists(redis_key)
+    return not get_redis_client().exists(redis_key)
 
 
 def verify_code(email: str, code: str) -> bool:
     """验证邮箱验证码"""
     redis_key = f"verification_code:{email}"
-    stored_code = redis_client.get(redis_key)
+    stored_code = get_redis_client().get(redis_key)
 
     if not stored_code:
         return False
@@ -101,7 +130,7 @@ def verify_code(email: str, code: str) -> bool:
         return False
 
     # 验证成功后删除验证码
-    # redis_client.delete(redis_key)
+    # get_redis_client().delete(redis_key)
     return True
 
 
@@ -0,0 +1,301 @@
+# backup.py
+"""music.db 在线备份与恢复
+
+使用 SQLite 的在线备份 API（sqlite3.Connection.backup）分步复制数据库页，每步只复制
+BACKUP_PAGES_PER_STEP 页并短暂让出锁，备份期间写操作不会被长时间阻塞；
+如果备份过程中数据库被修改，SQLite 会自动重新复制，得到的快照始终是一致的；
+写入过于频繁导致反复重新复制时，等待一段时间后重试，多次重试仍失败则放弃本次备份（见 _copy_database）。
+
+每次备份生成：
+- music-<时间>.db.gz（或 .db）：数据库快照，生成后先执行 integrity_check
+- music-<时间>.manifest.json：快照的 sha256，以及快照中引用的所有上传文件（本地存储时包含文件大小）
+
+恢复时先校验 sha256 和 integrity_check，再用备份 API 把快照写回目标数据库。
+
+只备份 DATABASE_URL 指向的单个数据库文件。开启分片（SHARD_COUNT > 1）后用户、歌单和歌单歌曲保存在各分片中，
+快照会缺少这些数据，因此备份、恢复和定时备份都拒绝执行。
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+import sharding
+from database import engine
+from storage import LocalStorage, get_storage, key_from_url
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger("music_server.backup")
+
+# 备份配置
+BACKUP_ENABLED = os.getenv("BACKUP_ENABLED", "false").lower() == "true"  # 是否在应用内定时备份
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL_SECONDS = int(os.getenv("BACKUP_INTERVAL_SECONDS", 86400))  # 定时备份间隔
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", 7))  # 保留最近几份备份
+BACKUP_COMPRESS = os.getenv("BACKUP_COMPRESS", "true").lower() == "true"
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", 256))  # 每步复制的页数
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", 0.005))  # 每步之间让出锁的时间
+BACKUP_MAX_RESTARTS = int(os.getenv("BACKUP_MAX_RESTARTS", 3))  # 分步复制被写操作打断的最大次数
+BACKUP_MAX_RETRIES = int(os.getenv("BACKUP_MAX_RETRIES", 3))  # 被打断次数过多时重试的次数
+BACKUP_RETRY_DELAY = float(os.getenv("BACKUP_RETRY_DELAY", 5))  # 第一次重试前等待的秒数（之后每次翻倍）
+
+# 快照中保存上传文件地址的列
+UPLOAD_URL_COLUMNS = [
+    ("users", "avatar_url"),
+    ("musics", "music_url"),
+    ("musics", "cover_url"),
+    ("musics", "lyric_url"),
+    ("playlists", "cover_url"),
+]
+
+
+class BackupError(Exception):
+    """备份或恢复失败"""
+
+
+class _BackupRestarted(Exception):
+    """分步复制期间数据库被频繁修改"""
+
+
+def _check_not_sharded():
+    if sharding.is_enabled():
+        raise BackupError("分片部署（SHARD_COUNT > 1）不支持单库备份和恢复，请分别备份 catalog 和各分片数据库")
+
+
+def database_path() -> str:
+    return os.path.abspath(engine.url.database)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _integrity_check(path: str) -> str:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _copy_database(src_path: str, dst_path: str, pages: int, sleep: float,
+                   max_restarts: int = BACKUP_MAX_RESTARTS, max_retries: int = BACKUP_MAX_RETRIES,
+                   retry_delay: float = BACKUP_RETRY_DELAY) -> int:
+    """使用在线备份 API 分步复制数据库，返回复制的总页数
+
+    其他连接每次写入都会让分步复制从头开始，写入频繁时可能永远无法完成；
+    重新开始超过 max_restarts 次后等待 retry_delay 秒（每次翻倍）再重试，重试 max_retries 次仍失败时抛出 BackupError。
+    不退回一步复制：一步复制在整个复制期间持有读锁，默认的回滚日志模式下会一直阻塞写入。
+    """
+    for attempt in range(max_retries + 1):
+        total = 0
+        restarts = 0
+        last_remaining = None
+
+        def progress(status, remaining, count):
+            nonlocal total, restarts, last_remaining
+            total = count
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+                if restarts > max_restarts:
+                    raise _BackupRestarted()
+            last_remaining = remaining
+
+        src = sqlite3.connect(src_path)
+        dst = sqlite3.connect(dst_path)
+        try:
+            src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+            return total
+        except _BackupRestarted:
+            pass
+        finally:
+            dst.close()
+            src.close()
+
+        if attempt < max_retries:
+            delay = retry_delay * 2 ** attempt
+            logger.warning("分步备份被写操作打断 %d 次，%.1f 秒后重试", restarts, delay)
+            time.sleep(delay)
+    raise BackupError(f"数据库写入过于频繁，分步备份重试 {max_retries} 次后仍未完成")
+
+
+def uploads_manifest(snapshot_path: str) -> List[Dict[str, Any]]:
+    """列出快照中引用的上传文件"""
+    conn = sqlite3.connect(snapshot_path)
+    try:
+        keys = set()
+        for table, column in UPLOAD_URL_COLUMNS:
+            for (url,) in conn.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL"):
+                key = key_from_url(url)
+                if key:
+                    keys.add(key)
+    finally:
+        conn.close()
+
+    storage = get_storage()
+    files = []
+    for key in sorted(keys):
+        item: Dict[str, Any] = {"key": key}
+        if isinstance(storage, LocalStorage):
+            path = storage.path(key)
+            item["size"] = os.path.getsize(path) if os.path.isfile(path) else None
+        files.append(item)
+    return files
+
+
+def create_backup(backup_dir: str = BACKUP_DIR, compress: bool = BACKUP_COMPRESS,
+                  pages: int = BACKUP_PAGES_PER_STEP, sleep: float = BACKUP_STEP_SLEEP) -> Dict[str, Any]:
+    """生成一份数据库快照和上传文件清单，返回清单内容"""
+    _check_not_sharded()
+    started = time.perf_counter()
+    os.makedirs(backup_dir, exist_ok=True)
+    name = "music-" + datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+
+    with tempfile.TemporaryDirectory(dir=backup_dir) as workdir:
+        snapshot = os.path.join(workdir, "music.db")
+        page_count = _copy_database(database_path(), snapshot, pages, sleep)
+
+        integrity = _integrity_check(snapshot)
+        if integrity != "ok":
+            raise BackupError(f"快照完整性检查失败: {integrity}")
+        files = uploads_manifest(snapshot)
+
+        filename = f"{name}.db.gz" if compress else f"{name}.db"
+        target = os.path.join(backup_dir, filename)
+        tmp_target = os.path.join(workdir, filename)
+        if compress:
+            with open(snapshot, "rb") as src, gzip.open(tmp_target, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        else:
+            os.replace(snapshot, tmp_target)
+
+        manifest = {
+            "snapshot": filename,
+            "created_at": datetime.utcnow().isoformat(),
+            "database_bytes": os.path.getsize(snapshot) if compress else os.path.getsize(tmp_target),
+            "snapshot_bytes": os.path.getsize(tmp_target),
+            "pages": page_count,
+            "sha256": _sha256(tmp_target),
+            "storage_backend": get_storage().name,
+            "uploads": files,
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+        }
+        os.replace(tmp_target, target)
+
+    with open(os.path.join(backup_dir, f"{name}.manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def list_backups(backup_dir: str = BACKUP_DIR) -> List[str]:
+    """按时间从旧到新列出备份的清单文件"""
+    if not os.path.isdir(backup_dir):
+        return []
+    return sorted(os.path.join(backup_dir, name) for name in os.listdir(backup_dir)
+                  if name.startswith("music-") and name.endswith(".manifest.json"))
+
+
+def prune_backups(backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP) -> int:
+    """只保留最近 keep 份备份，返回删除的份数"""
+    manifests = list_backups(backup_dir)
+    removed = 0
+    for manifest_path in manifests[:max(len(manifests) - keep, 0)]:
+        with open(manifest_path, encoding="utf-8") as f:
+            snapshot = json.load(f)["snapshot"]
+        for path in (os.path.join(backup_dir, snapshot), manifest_path):
+            if os.path.exists(path):
+                os.remove(path)
+        removed += 1
+    return removed
+
+
+def restore_backup(manifest_path: str, target_path: Optional[str] = None) -> Dict[str, Any]:
+    """校验快照后恢复到目标数据库（默认为当前数据库），返回校验结果
+
+    使用备份 API 写入目标数据库，会等待其他连接释放锁；恢复期间应停止写入。
+    """
+    _check_not_sharded()
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    snapshot_path = os.path.join(os.path.dirname(manifest_path), manifest["snapshot"])
+    if _sha256(snapshot_path) != manifest["sha256"]:
+        raise BackupError(f"快照校验和不一致: {snapshot_path}")
+
+    target_path = target_path or database_path()
+    with tempfile.TemporaryDirectory() as workdir:
+        snapshot = os.path.join(workdir, "music.db")
+        if snapshot_path.endswith(".gz"):
+            with gzip.open(snapshot_path, "rb") as src, open(snapshot, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        else:
+            shutil.copyfile(snapshot_path, snapshot)
+
+        integrity = _integrity_check(snapshot)
+        if integrity != "ok":
+            raise BackupError(f"快照完整性检查失败: {integrity}")
+        _copy_database(snapshot, target_path, pages=-1, sleep=0)
+
+    integrity = _integrity_check(target_path)
+    if integrity != "ok":
+        raise BackupError(f"恢复后的数据库完整性检查失败: {integrity}")
+
+    # 检查快照引用的上传文件是否仍然存在
+    storage = get_storage()
+    missing = [item["key"] for item in manifest["uploads"] if not storage.exists(item["key"])]
+    return {"snapshot": manifest["snapshot"], "target": target_path, "integrity": integrity,
+            "uploads": len(manifest["uploads"]), "missing_uploads": missing}
+
+
+class BackupScheduler:
+    """在后台线程中定时备份"""
+
+    def __init__(self, interval_seconds: int = BACKUP_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_backup: Optional[Dict[str, Any]] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if sharding.is_enabled():
+            logger.error("分片部署（SHARD_COUNT > 1）不支持单库备份，定时备份未启动")
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                manifest = create_backup()
+                prune_backups()
+                self.last_backup = {key: manifest[key] for key in ("snapshot", "created_at", "snapshot_bytes")}
+                logger.info("数据库备份完成: %s（%d 字节）", manifest["snapshot"], manifest["snapshot_bytes"])
+            except Exception:
+                logger.exception("数据库备份失败")
+
+
+backup_scheduler = BackupScheduler()
@@ -0,0 +1,275 @@
+# benchmarks/bench_crud.py
+"""crud.py 微基准测试
+
+对每种数据库（内存 SQLite / 文件 SQLite）和每个数据规模，在独立子进程中用 tools.seed 生成数据，
+然后直接调用 crud 中的查询和写操作函数，记录：
+
+- 每个函数的平均耗时与 p50/p95
+- 函数执行的每条 SELECT / UPDATE / DELETE 语句的查询计划（EXPLAIN QUERY PLAN）
+- 全表扫描：查询计划中出现不带索引的 SCAN <表>。分页列表按主键顺序扫描、遇到 LIMIT 即停止，
+  关键字搜索（LIKE '%关键字%'）无法使用索引，这些在 ALLOWED_SCANS 中列出，其余全表扫描视为失败
+
+与基线结果对比时，任一函数的 p50 耗时变慢超过 --max-regression 百分比（且至少慢 --min-delta-ms 毫秒，
+避免亚毫秒级的抖动误报）或出现新的全表扫描，以非零状态退出。
+
+用法（在 music_server 目录下执行）：
+    python -m benchmarks.bench_crud --sizes 1000,10000,100000 --output before.json
+    python -m benchmarks.bench_crud --sizes 1000,10000,100000 --compare before.json --max-regression 25
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.bench_load import _git_commit, percentile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DATABASES = {
+    "memory": "sqlite://",
+    "disk": "sqlite:///./music.db",
+}
+
+# 允许出现全表扫描的函数和表
+ALLOWED_SCANS = {
+    "get_musics": {"musics"},
+    "get_playlists": {"playlists"},
+    "search_musics": {"musics"},
+}
+
+SEARCH_KEYWORD = "星"
+
+
+def _data_sizes(musics: int) -> dict:
+    """按音乐数推算其他表的规模"""
+    return {"users": max(musics // 20, 10), "musics": musics, "playlists": max(musics // 10, 10), "tracks": 20}
+
+
+def _pick_targets(db, count: int) -> dict:
+    """选取热门的用户、歌单和音乐作为测试参数（数据量最大的情况）"""
+    from sqlalchemy import func
+
+    from models import Music, Playlist, PlaylistMusic
+
+    creator_id = db.query(Playlist.creator_id).filter(Playlist.is_deleted == False).group_by(
+        Playlist.creator_id).order_by(func.count(Playlist.id).desc()).limit(1).scalar()
+    playlist_id = db.query(Playlist.id).filter(Playlist.is_deleted == False).order_by(
+        Playlist.music_count.desc()).limit(1).scalar()
+    music_id = db.query(PlaylistMusic.music_id).filter(PlaylistMusic.is_deleted == False).group_by(
+        PlaylistMusic.music_id).order_by(func.count(PlaylistMusic.id).desc()).limit(1).scalar()
+    uploader_id = db.query(Music.uploader_id).filter(Music.is_deleted == False).group_by(
+        Music.uploader_id).order_by(func.count(Music.id).desc()).limit(1).scalar()
+    # 添加到歌单时使用不在该歌单中的音乐（每次执行使用一首）
+    in_playlist = {row.music_id for row in db.query(PlaylistMusic.music_id).filter(
+        PlaylistMusic.playlist_id == playlist_id)}
+    free_musics = [row.id for row in db.query(Music.id).filter(Music.is_deleted == False).order_by(
+        Music.id.desc()).limit(len(in_playlist) + count) if row.id not in in_playlist]
+    return {"creator_id": creator_id, "playlist_id": playlist_id, "music_id": music_id,
+            "uploader_id": uploader_id, "free_musics": free_musics}
+
+
+def _cases(targets: dict) -> Dict[str, Callable]:
+    """被测函数（参数为数据库会话）"""
+    import crud
+
+    free_musics = iter(targets["free_musics"])
+    added: List[int] = []
+    playlist_id = targets["playlist_id"]
+
+    def add_music(db):
+        music_id = next(free_musics)
+        added.append(music_id)
+        crud.add_music_to_playlist(db, playlist_id, music_id)
+
+    def remove_music(db):
+        crud.remove_music_from_playlist(db, playlist_id, added.pop())
+
+    return {
+        "get_music": lambda db: crud.get_music(db, targets["music_id"]),
+        "get_musics": lambda db: crud.get_musics(db, skip=1000, limit=100),
+        "get_musics_by_uploader": lambda db: crud.get_musics_by_uploader(db, targets["uploader_id"], limit=100),
+        "search_musics": lambda db: crud.search_musics(db, SEARCH_KEYWORD, limit=100),
+        "get_playlist": lambda db: crud.get_playlist(db, playlist_id),
+        "get_playlists": lambda db: crud.get_playlists(db, skip=100, limit=100),
+        "get_playlists_by_creator_with_pagination":
+            lambda db: crud.get_playlists_by_creator_with_pagination(db, targets["creator_id"], limit=100),
+        "get_playlists_version": lambda db: crud.get_playlists_version(db, targets["creator_id"]),
+        "get_playlist_musics_with_pagination":
+            lambda db: crud.get_playlist_musics_with_pagination(db, playlist_id, limit=100),
+        "get_music_playlists": lambda db: crud.get_music_playlists(db, targets["music_id"], limit=100),
+        "add_music_to_playlist": add_music,
+        "remove_music_from_playlist": remove_music,
+    }
+
+
+def _full_scans(plan: List[str]) -> List[str]:
+    """查询计划中不使用索引的全表扫描，返回表名"""
+    tables = []
+    for detail in plan:
+        parts = detail.split()
+        if len(parts) >= 2 and parts[0] == "SCAN" and "USING" not in parts:
+            tables.append(parts[1])
+    return tables
+
+
+def explain(engine, case: Callable, db) -> List[dict]:
+    """执行一次被测函数，记录其中每条语句的查询计划"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        case(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    plans = []
+    seen = set()
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+            plans.append({"sql": " ".join(statement.split()), "plan": [row[-1] for row in rows]})
+    return plans
+
+
+def run_worker(musics: int, repeat: int, seed_value: int) -> dict:
+    """在子进程中生成数据并测试各函数"""
+    from database import SessionLocal, engine
+    from tools.seed import seed
+
+    sizes = _data_sizes(musics)
+    seed_report = seed(deleted_fraction=0.05, seed_value=seed_value, **sizes)
+
+    db = SessionLocal()
+    try:
+        targets = _pick_targets(db, repeat + 4)
+        results = {}
+        for name, case in _cases(targets).items():
+            plans = explain(engine, case, db)
+            # 预热
+            for _ in range(3):
+                case(db)
+                db.rollback()
+
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                case(db)
+                timings.append((time.perf_counter() - start) * 1000)
+                db.rollback()
+
+            allowed = ALLOWED_SCANS.get(name, set())
+            scans = sorted({table for plan in plans for table in _full_scans(plan["plan"])})
+            results[name] = {
+                "mean_ms": round(statistics.mean(timings), 4),
+                "p50_ms": round(percentile(timings, 50), 4),
+                "p95_ms": round(percentile(timings, 95), 4),
+                "full_scans": [table for table in scans if table not in allowed],
+                "allowed_scans": [table for table in scans if table in allowed],
+                "plans": plans,
+            }
+    finally:
+        db.close()
+    return {"rows": seed_report["tables"], "functions": results}
+
+
+def compare(report: dict, baseline: dict, min_delta_ms: float) -> dict:
+    """与基线结果对比，返回各函数 p50 耗时的变化百分比（变化小于 min_delta_ms 的记为 0）"""
+    changes = {}
+    for key, current in report["results"].items():
+        previous = baseline.get("results", {}).get(key)
+        if not previous:
+            continue
+        changes[key] = {}
+        for name, result in current["functions"].items():
+            before = previous["functions"].get(name)
+            if not before or not before["p50_ms"]:
+                continue
+            delta = result["p50_ms"] - before["p50_ms"]
+            changes[key][name] = round(delta / before["p50_ms"] * 100, 1) if abs(delta) >= min_delta_ms else 0.0
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="crud.py 微基准测试")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="逗号分隔的音乐数量（其他表按比例生成）")
+    parser.add_argument("--databases", default="memory,disk", help="逗号分隔的数据库类型：memory / disk")
+    parser.add_argument("--repeat", type=int, default=50, help="每个函数的执行次数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--output", help="结果保存路径（JSON）")
+    parser.add_argument("--compare", help="对比的基线结果（JSON）")
+    parser.add_argument("--max-regression", type=float, help="任一函数 p50 耗时变慢超过该百分比时返回非零退出码")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="小于该毫秒数的变化不计为退化")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_worker(args.worker, args.repeat, args.seed), ensure_ascii=False))
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    databases = [name.strip() for name in args.databases.split(",") if name.strip()]
+    for name in databases:
+        if name not in DATABASES:
+            parser.error(f"未知数据库类型: {name}")
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"sizes": sizes, "databases": databases, "repeat": args.repeat, "seed": args.seed},
+        "results": {},
+    }
+    for database in databases:
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as workdir:
+                env = {**os.environ, "PYTHONPATH": SERVER_DIR, "DATABASE_URL": DATABASES[database],
+                       "SHARD_COUNT": "1", "DATABASE_REPLICA_URLS": "", "CACHE_ENABLED": "false"}
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_crud", "--worker", str(size),
+                     "--repeat", str(args.repeat), "--seed", str(args.seed)],
+                    cwd=workdir, env=env, check=True, stdout=subprocess.PIPE, text=True
+                ).stdout
+            report["results"][f"{database}/{size}"] = json.loads(output.splitlines()[-1])
+
+    full_scans = {f"{key}/{name}": result["full_scans"]
+                  for key, run in report["results"].items()
+                  for name, result in run["functions"].items() if result["full_scans"]}
+    report["full_scans"] = full_scans
+    exit_code = 1 if full_scans else 0
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["baseline_commit"] = baseline.get("commit")
+        report["change_pct"] = compare(report, baseline, args.min_delta_ms)
+        if args.max_regression is not None:
+            regressed = [f"{key}/{name}" for key, changes in report["change_pct"].items()
+                         for name, change in changes.items() if change > args.max_regression]
+            report["regressed"] = regressed
+            exit_code = 1 if regressed or full_scans else 0
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
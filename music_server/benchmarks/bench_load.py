@@ -0,0 +1,338 @@
+# benchmarks/bench_load.py
+"""热点接口压力测试
+
+在临时目录中用 tools.seed 生成测试数据（不包含已删除的记录），用 uvicorn 子进程启动应用，然后以固定并发数按比例混合请求以下场景，
+输出每个接口的吞吐量和延迟分位数（JSON），可以保存下来与其他提交的结果对比：
+
+- login：验证码登录（需要 Redis，Redis 不可用时跳过该场景）
+- me：GET /users/me
+- list_musics / search_musics：音乐列表和搜索
+- playlist_tracks：歌单歌曲分页
+- upload：上传音乐文件
+
+用法（在 music_server 目录下执行）：
+    python -m benchmarks.bench_load --concurrency 8 --duration 20 --output before.json
+    python -m benchmarks.bench_load --concurrency 8 --duration 20 --compare before.json --max-regression 20
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 场景及默认权重
+DEFAULT_MIX = {
+    "login": 2,
+    "me": 15,
+    "list_musics": 20,
+    "search_musics": 15,
+    "playlist_tracks": 40,
+    "upload": 3,
+}
+# 取自 tools.seed 的词表，命中数量不同
+SEARCH_KEYWORDS = ["夜", "Love", "星", "Night", "雨", "Taylor"]
+UPLOAD_BYTES = 64 * 1024
+
+
+def percentile(values: List[float], pct: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _multipart(fields: Dict[str, str], file_field: str, filename: str, content: bytes, content_type: str):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                 f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Client:
+    """每个并发线程一个保持连接的 HTTP 客户端"""
+
+    def __init__(self, port: int, users: int, playlists: int, rng: random.Random):
+        import auth
+        from tools.seed import seed_email
+
+        self.port = port
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        self.rng = rng
+        self.users = users
+        self.playlists = playlists
+        self.auth = auth
+        self.seed_email = seed_email
+        self.user_id = rng.randint(1, users)
+        self.headers = {"Authorization": "Bearer " + auth.create_access_token(
+            {"user_id": self.user_id, "email": seed_email(self.user_id)})}
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None, headers: Optional[dict] = None):
+        try:
+            self.conn.request(method, path, body=body, headers={**self.headers, **(headers or {})})
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+            raise
+        # 业务错误也以 200 返回，code 字段才是真正的结果
+        return response.status == 200 and json.loads(data).get("code") == 200
+
+    def _json(self, method: str, path: str, payload) -> bool:
+        return self.request(method, path, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+
+    def login(self) -> bool:
+        email = self.seed_email(self.rng.randint(1, self.users))
+        code = self.auth.generate_verification_code()
+        self.auth.get_redis_client().setex(f"verification_code:{email}", 120, code)
+        return self._json("POST", "/users/login", {"email": email, "code": code})
+
+    def me(self) -> bool:
+        return self.request("GET", "/users/me")
+
+    def list_musics(self) -> bool:
+        return self.request("GET", f"/musics/?skip={self.rng.randint(0, 20) * 50}&limit=50")
+
+    def search_musics(self) -> bool:
+        return self._json("POST", "/musics/search?limit=50", {"keyword": self.rng.choice(SEARCH_KEYWORDS)})
+
+    def playlist_tracks(self) -> bool:
+        # 少数热门歌单承担大部分请求
+        playlist_id = min(int(self.rng.paretovariate(1.2)), self.playlists)
+        return self.request("GET", f"/playlists/{playlist_id}/musics?limit=50")
+
+    def upload(self) -> bool:
+        body, content_type = _multipart({"title": f"bench {uuid.uuid4().hex[:6]}", "artist": "bench"},
+                                        "music_file", "bench.mp3", os.urandom(UPLOAD_BYTES), "audio/mpeg")
+        return self.request("POST", "/musics/", body, {"Content-Type": content_type})
+
+
+def redis_available() -> bool:
+    import auth
+    import redis
+
+    try:
+        return bool(auth.get_redis_client().ping())
+    except redis.RedisError:
+        return False
+
+
+def run_load(port: int, mix: Dict[str, int], concurrency: int, duration: float, warmup: float,
+             users: int, playlists: int, seed_value: int) -> dict:
+    """以固定并发数持续请求，返回各场景的统计"""
+    scenarios = list(mix)
+    weights = [mix[name] for name in scenarios]
+    timings: Dict[str, List[float]] = {name: [] for name in scenarios}
+    errors: Dict[str, int] = {name: 0 for name in scenarios}
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def worker(index: int):
+        rng = random.Random(seed_value + index)
+        client = Client(port, users, playlists, rng)
+        local_timings: Dict[str, List[float]] = {name: [] for name in scenarios}
+        local_errors: Dict[str, int] = {name: 0 for name in scenarios}
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            name = rng.choices(scenarios, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = getattr(client, name)()
+            except Exception:
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            # 预热阶段的请求不计入结果
+            if started >= start_at:
+                local_timings[name].append(elapsed)
+                if not ok:
+                    local_errors[name] += 1
+        with lock:
+            for name in scenarios:
+                timings[name].extend(local_timings[name])
+                errors[name] += local_errors[name]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    endpoints = {}
+    for name in scenarios:
+        values = timings[name]
+        if not values:
+            continue
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "throughput_rps": round(len(values) / duration, 2),
+            "mean_ms": round(sum(values) / len(values), 3),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p90_ms": round(percentile(values, 90), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+            "max_ms": round(max(values), 3),
+        }
+    all_values = [value for values in timings.values() for value in values]
+    total = {
+        "requests": len(all_values),
+        "errors": sum(errors.values()),
+        "throughput_rps": round(len(all_values) / duration, 2),
+        "p50_ms": round(percentile(all_values, 50), 3) if all_values else None,
+        "p99_ms": round(percentile(all_values, 99), 3) if all_values else None,
+    }
+    return {"endpoints": endpoints, "total": total}
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """与基线结果对比，返回各场景 p50/p99/吞吐量的变化百分比"""
+    changes = {}
+    for name, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        changes[name] = {
+            key: round((current[key] - previous[key]) / previous[key] * 100, 1) if previous[key] else None
+            for key in ("p50_ms", "p99_ms", "throughput_rps")
+        }
+    return changes
+
+
+def _wait_for_server(port: int, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("应用启动失败")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("等待应用启动超时")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点接口压力测试")
+    parser.add_argument("--users", type=int, default=200, help="用户数")
+    parser.add_argument("--musics", type=int, default=5000, help="音乐数")
+    parser.add_argument("--playlists", type=int, default=500, help="默认歌单之外的歌单数")
+    parser.add_argument("--tracks", type=int, default=50, help="每个歌单的平均歌曲数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发数")
+    parser.add_argument("--duration", type=float, default=20, help="计入结果的压测时长（秒）")
+    parser.add_argument("--warmup", type=float, default=3, help="预热时长（秒）")
+    parser.add_argument("--mix", default="", help="场景权重，例如 me=10,playlist_tracks=50（未列出的使用默认值，0 表示不请求）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--output", help="结果保存路径（JSON）")
+    parser.add_argument("--compare", help="对比的基线结果（JSON）")
+    parser.add_argument("--max-regression", type=float, help="任一场景 p99 变慢超过该百分比时返回非零退出码")
+    args = parser.parse_args()
+
+    mix = dict(DEFAULT_MIX)
+    for item in filter(None, (part.strip() for part in args.mix.split(","))):
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_MIX:
+            parser.error(f"未知场景: {name}")
+        mix[name] = int(weight)
+
+    output_path = os.path.abspath(args.output) if args.output else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    original_cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {**os.environ, "PYTHONPATH": SERVER_DIR, "DATABASE_URL": "sqlite:///./music.db",
+               "DELETE_WORKER_ENABLED": "false", "BACKUP_ENABLED": "false"}
+        subprocess.run([sys.executable, "-c",
+                        f"from tools.seed import seed; "
+                        f"seed(users={args.users}, musics={args.musics}, playlists={args.playlists}, "
+                        f"tracks={args.tracks}, deleted_fraction=0, seed_value={args.seed})"],
+                       cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL)
+
+        # 压测客户端与应用使用同一个 SECRET_KEY 和 Redis
+        os.chdir(workdir)
+        sys.path.insert(0, SERVER_DIR)
+        skipped = []
+        if mix.get("login") and not redis_available():
+            mix["login"] = 0
+            skipped.append("login (redis unavailable)")
+        mix = {name: weight for name, weight in mix.items() if weight > 0}
+
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=workdir, env=env
+        )
+        try:
+            _wait_for_server(port, server)
+            result = run_load(port, mix, args.concurrency, args.duration, args.warmup,
+                              args.users, args.users + args.playlists, args.seed)
+        finally:
+            server.terminate()
+            server.wait(10)
+            os.chdir(original_cwd)
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"users": args.users, "musics": args.musics, "playlists": args.playlists, "tracks": args.tracks,
+                   "concurrency": args.concurrency, "duration": args.duration, "mix": mix, "seed": args.seed},
+        "skipped": skipped,
+        **result,
+    }
+
+    exit_code = 0
+    if compare_path:
+        with open(compare_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["baseline_commit"] = baseline.get("commit")
+        report["change_pct"] = compare(report, baseline)
+        if args.max_regression is not None:
+            regressed = [name for name, change in report["change_pct"].items()
+                         if change["p99_ms"] is not None and change["p99_ms"] > args.max_regression]
+            report["regressed"] = regressed
+            exit_code = 1 if regressed else 0
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# benchmarks/bench_serialization.py
+"""列表接口序列化基准测试：对比默认路径与 FAST_JSON 快速路径
+
+在临时目录中创建数据库并写入测试数据，然后分别以 FAST_JSON=false / true 启动应用（独立子进程），
+用 TestClient 请求列表接口，输出每个接口的平均耗时与 p50/p99。
+
+用法（在 music_server 目录下执行）：
+    python -m benchmarks.bench_serialization --rows 1000 --requests 200
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = [
+    ("GET", "/musics/?limit=100", None),
+    ("GET", "/musics/uploader/1?limit=100", None),
+    ("POST", "/musics/search?limit=100", {"keyword": "歌"}),
+    ("GET", "/playlists/?limit=100", None),
+    ("GET", "/users/1/playlists?limit=100", None),
+]
+
+
+def seed(rows: int):
+    """在当前目录的 music.db 中写入测试数据"""
+    from database import SessionLocal, init_db
+    from models import User, Music, Playlist
+
+    init_db()
+    db = SessionLocal()
+    try:
+        db.add(User(id=1, email="bench@qq.com", nickname="bench"))
+        db.bulk_insert_mappings(Music, [
+            {"title": f"测试歌曲{i}", "artist": f"Artist {i % 50}", "music_url": f"/uploads/music/{i:08x}.mp3",
+             "cover_url": f"/uploads/cover/{i:08x}.jpg", "lyric_url": None, "uploader_id": 1}
+            for i in range(rows)
+        ])
+        db.bulk_insert_mappings(Playlist, [
+            {"name": f"歌单{i}", "description": "benchmark", "cover_url": "/uploads/cover/loveSongs.png",
+             "creator_id": 1, "music_count": 0}
+            for i in range(min(rows, 200))
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def percentile(values, pct: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run_worker(requests: int) -> dict:
+    """在子进程中启动应用并请求各列表接口"""
+    from fastapi.testclient import TestClient
+    import auth
+    import main
+
+    token = auth.create_access_token({"user_id": 1, "email": "bench@qq.com"})
+    headers = {"Authorization": f"Bearer {token}"}
+    results = {}
+    with TestClient(main.app) as client:
+        for method, url, body in ENDPOINTS:
+            # 预热
+            for _ in range(10):
+                client.request(method, url, json=body, headers=headers)
+
+            timings = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = client.request(method, url, json=body, headers=headers)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert response.json()["code"] == 200, response.text
+
+            results[f"{method} {url}"] = {
+                "mean_ms": round(statistics.mean(timings), 3),
+                "p50_ms": round(percentile(timings, 50), 3),
+                "p99_ms": round(percentile(timings, 99), 3),
+                "bytes": len(response.content),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表接口序列化基准测试")
+    parser.add_argument("--rows", type=int, default=1000, help="写入的音乐数量")
+    parser.add_argument("--requests", type=int, default=200, help="每个接口的请求次数")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.requests)))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {**os.environ, "PYTHONPATH": SERVER_DIR, "CACHE_ENABLED": "false"}
+        subprocess.run([sys.executable, "-c", f"import benchmarks.bench_serialization as b; b.seed({args.rows})"],
+                       cwd=workdir, env=env, check=True)
+
+        report = {"rows": args.rows, "requests": args.requests, "modes": {}}
+        for fast_json in ("false", "true"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_serialization", "--worker", "--requests", str(args.requests)],
+                cwd=workdir, env={**env, "FAST_JSON": fast_json}, check=True, capture_output=True, text=True
+            ).stdout
+            report["modes"]["fast_json" if fast_json == "true" else "default"] = json.loads(output.splitlines()[-1])
+
+    # 计算加速比
+    default, fast = report["modes"]["default"], report["modes"]["fast_json"]
+    report["speedup"] = {name: round(default[name]["mean_ms"] / fast[name]["mean_ms"], 2) for name in default}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# benchmarks/bench_startup.py
+"""启动耗时基准测试
+
+worker 启动和热重载的耗时主要来自导入模块和应用初始化。这个基准在临时目录中以独立子进程多次测量（取中位数）：
+
+- 各阶段耗时：导入 main（包括 create_app）、lifespan 启动、第一个请求（/health）、第一次生成 OpenAPI 文档
+- 导入耗时报告：用 python -X importtime 统计每个模块自身的导入耗时，按顶层包汇总，
+  并列出自身耗时最多的模块（本项目的模块单独汇总为 app）
+
+用法（在 music_server 目录下执行）：
+    python -m benchmarks.bench_startup --runs 5 --output before.json
+    python -m benchmarks.bench_startup --runs 5 --compare before.json --max-regression 20
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.bench_load import _git_commit
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def _app_packages() -> set:
+    """本项目的顶层模块和包"""
+    names = set()
+    for entry in os.listdir(SERVER_DIR):
+        path = os.path.join(SERVER_DIR, entry)
+        if entry.endswith(".py"):
+            names.add(entry[:-3])
+        elif os.path.isdir(path) and not entry.startswith((".", "__")):
+            names.add(entry)
+    return names
+
+
+def run_worker() -> dict:
+    """在子进程中测量启动各阶段的耗时（毫秒）"""
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+
+    from fastapi.testclient import TestClient
+
+    phases = {"import_ms": (imported - started) * 1000}
+    # TestClient 的导入不计入 lifespan 启动
+    start = time.perf_counter()
+    with TestClient(main.app) as client:
+        phases["lifespan_ms"] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        assert client.get("/health").status_code == 200
+        phases["first_request_ms"] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        assert client.get("/openapi.json").status_code == 200
+        phases["openapi_ms"] = (time.perf_counter() - start) * 1000
+    phases["total_ms"] = sum(phases.values())
+    return phases
+
+
+def parse_import_times(output: str) -> Dict[str, dict]:
+    """解析 -X importtime 的输出，返回 {模块: {"self_us", "cumulative_us"}}"""
+    modules = {}
+    for line in output.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match:
+            modules[match.group(4)] = {"self_us": int(match.group(1)), "cumulative_us": int(match.group(2))}
+    return modules
+
+
+def import_report(runs: List[Dict[str, dict]], top: int) -> dict:
+    """汇总多次导入的耗时：按顶层包合计自身耗时，并列出自身耗时最多的模块（各取中位数）"""
+    app_packages = _app_packages()
+    modules = {name: statistics.median(run[name]["self_us"] for run in runs if name in run)
+               for name in set().union(*runs)}
+    packages: Dict[str, float] = {}
+    for name, self_us in modules.items():
+        package = name.split(".")[0]
+        package = "app" if package in app_packages or package == "__main__" else package
+        packages[package] = packages.get(package, 0) + self_us
+
+    main_cumulative = [run["main"]["cumulative_us"] for run in runs if "main" in run]
+    return {
+        "main_cumulative_ms": round(statistics.median(main_cumulative) / 1000, 2) if main_cumulative else None,
+        "modules_imported": len(modules),
+        "packages_ms": {name: round(us / 1000, 2)
+                        for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]},
+        "top_modules_ms": {name: round(us / 1000, 2)
+                           for name, us in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]},
+    }
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """与基线结果对比，返回各阶段耗时的变化百分比"""
+    previous = baseline.get("phases", {})
+    return {name: round((value - previous[name]) / previous[name] * 100, 1) if previous.get(name) else None
+            for name, value in report["phases"].items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="测量次数（取中位数）")
+    parser.add_argument("--top", type=int, default=20, help="导入耗时报告中列出的包和模块数")
+    parser.add_argument("--output", help="结果保存路径（JSON）")
+    parser.add_argument("--compare", help="对比的基线结果（JSON）")
+    parser.add_argument("--max-regression", type=float, help="总启动耗时变慢超过该百分比时返回非零退出码")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker()))
+        return
+
+    phase_runs = []
+    import_runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {**os.environ, "PYTHONPATH": SERVER_DIR, "DATABASE_URL": "sqlite:///./music.db",
+               "DELETE_WORKER_ENABLED": "false", "BACKUP_ENABLED": "false"}
+        # 先初始化一次数据库，之后的测量不包含建表
+        subprocess.run([sys.executable, "-c", "import models, database; database.init_db()"],
+                       cwd=workdir, env=env, check=True, capture_output=True)
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_startup", "--worker"],
+                cwd=workdir, env=env, check=True, capture_output=True, text=True
+            ).stdout
+            phase_runs.append(json.loads(output.splitlines()[-1]))
+            # -X importtime 本身有开销，单独运行
+            stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                                    cwd=workdir, env=env, check=True, capture_output=True, text=True).stderr
+            import_runs.append(parse_import_times(stderr))
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"runs": args.runs},
+        "phases": {name: round(statistics.median(run[name] for run in phase_runs), 2) for name in phase_runs[0]},
+        "imports": import_report(import_runs, args.top),
+    }
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["baseline_commit"] = baseline.get("commit")
+        report["change_pct"] = compare(report, baseline)
+        if args.max_regression is not None:
+            change = report["change_pct"].get("total_ms")
+            report["regressed"] = change is not None and change > args.max_regression
+            exit_code = 1 if report["regressed"] else 0
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
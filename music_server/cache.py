@@ -0,0 +1,361 @@
+# cache.py
+"""热点数据读穿透缓存
+
+优先使用 auth.py 中的 Redis 客户端，Redis 不可用时自动回退到进程内 LRU 缓存，
+过一段时间后再重新尝试 Redis（回退期间有失效操作时，恢复后先清除 Redis 中的缓存）。缓存值为紧凑 JSON（只保存数据库列，不保存签名地址等派生数据）。
+
+列表类数据（例如歌单歌曲分页）不逐条删除，而是把版本号拼进缓存键，写操作只需要递增版本号，
+旧版本的分页数据自然失效，并由 TTL 清理。
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import redis
+from dotenv import load_dotenv
+
+from auth import get_redis_client
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger("music_server.cache")
+
+# 缓存配置
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", 300))  # 缓存存活时间
+CACHE_LOCAL_MAX_ITEMS = int(os.getenv("CACHE_LOCAL_MAX_ITEMS", 10000))  # 进程内缓存最大条数
+CACHE_REDIS_RETRY_SECONDS = 30  # Redis 出错后多久再重试
+CACHE_KEY_PREFIX = "cache:"
+
+
+class LocalCache:
+    """进程内 LRU 缓存（Redis 不可用时使用）"""
+
+    def __init__(self, max_items: int = CACHE_LOCAL_MAX_ITEMS):
+        self.max_items = max_items
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expire_at = item
+            if expire_at is not None and expire_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None, nx: bool = False) -> bool:
+        with self._lock:
+            if nx and key in self._data:
+                return False
+            expire_at = time.monotonic() + ttl if ttl else None
+            self._data[key] = (value, expire_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+            return True
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value, expire_at = self._data.get(key, ("0", None))
+            value = str(int(value) + 1)
+            self._data[key] = (value, expire_at)
+            return int(value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CacheStats:
+    """缓存命中统计"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+local_cache = LocalCache()
+cache_stats = CacheStats()
+_redis_retry_at = 0.0
+_redis_down = False  # 是否已回退到进程内缓存
+_missed_invalidations = False  # 回退期间是否有删除或递增版本号的操作没有写入 Redis
+_resync_lock = threading.Lock()
+
+
+def _use_redis() -> bool:
+    if time.monotonic() < _redis_retry_at:
+        return False
+    return not _redis_down or _resync_redis()
+
+
+def _redis_failed(e: Exception):
+    """Redis 出错时回退到进程内缓存"""
+    global _redis_retry_at, _redis_down
+    cache_stats.errors += 1
+    if time.monotonic() >= _redis_retry_at:
+        logger.warning("Redis缓存不可用，回退到进程内缓存: %s", e)
+    _redis_retry_at = time.monotonic() + CACHE_REDIS_RETRY_SECONDS
+    _redis_down = True
+
+
+def _resync_redis() -> bool:
+    """Redis 恢复后重新启用前的同步，返回 Redis 是否可用
+
+    回退期间的删除和版本号递增只写入了进程内缓存，Redis 中仍是旧数据和旧版本号，
+    因此先清除 Redis 中的所有缓存键（版本号之后以当前时间重新初始化，不会与旧版本冲突）。
+    进程内缓存也一并清空，否则下次回退时会读到这次回退期间留下的数据。
+    """
+    global _redis_down, _missed_invalidations
+    with _resync_lock:
+        if not _redis_down:
+            return True
+        try:
+            client = get_redis_client()
+            if _missed_invalidations:
+                keys = []
+                for key in client.scan_iter(match=CACHE_KEY_PREFIX + "*", count=1000):
+                    keys.append(key)
+                    if len(keys) >= 1000:
+                        client.delete(*keys)
+                        keys = []
+                if keys:
+                    client.delete(*keys)
+            else:
+                client.ping()
+        except redis.RedisError as e:
+            _redis_failed(e)
+            return False
+        local_cache.clear()
+        _redis_down = False
+        _missed_invalidations = False
+        logger.info("Redis缓存已恢复")
+        return True
+
+
+def _get(key: str) -> Optional[str]:
+    if _use_redis():
+        try:
+            return get_redis_client().get(key)
+        except redis.RedisError as e:
+            _redis_failed(e)
+    return local_cache.get(key)
+
+
+def _set(key: str, value: str, ttl: Optional[int] = CACHE_TTL_SECONDS, nx: bool = False):
+    if _use_redis():
+        try:
+            get_redis_client().set(key, value, ex=ttl, nx=nx)
+            return
+        except redis.RedisError as e:
+            _redis_failed(e)
+    local_cache.set(key, value, ttl, nx=nx)
+
+
+def _mget(keys) -> list:
+    if _use_redis():
+        try:
+            return get_redis_client().mget(keys)
+        except redis.RedisError as e:
+            _redis_failed(e)
+    return [local_cache.get(key) for key in keys]
+
+
+def _mset(mapping: Dict[str, str], ttl: Optional[int] = CACHE_TTL_SECONDS):
+    if _use_redis():
+        try:
+            pipe = get_redis_client().pipeline(transaction=False)
+            for key, value in mapping.items():
+                pipe.set(key, value, ex=ttl)
+            pipe.execute()
+            return
+        except redis.RedisError as e:
+            _redis_failed(e)
+    for key, value in mapping.items():
+        local_cache.set(key, value, ttl)
+
+
+def _delete(*keys: str):
+    global _missed_invalidations
+    # 进程内缓存也一并删除，避免 Redis 恢复前写入的旧数据残留
+    local_cache.delete(*keys)
+    if _use_redis():
+        try:
+            get_redis_client().delete(*keys)
+            return
+        except redis.RedisError as e:
+            _redis_failed(e)
+    _missed_invalidations = True
+
+
+def _incr(key: str) -> int:
+    global _missed_invalidations
+    if _use_redis():
+        try:
+            return get_redis_client().incr(key)
+        except redis.RedisError as e:
+            _redis_failed(e)
+    _missed_invalidations = True
+    return local_cache.incr(key)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"无法序列化的类型: {type(value)}")
+
+
+def dumps(value: Any) -> str:
+    """紧凑 JSON 序列化"""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=_json_default)
+
+
+def row_to_dict(row, exclude=("is_deleted",)) -> Dict[str, Any]:
+    """把 ORM 对象的列转换为字典"""
+    return {c.key: getattr(row, c.key) for c in row.__table__.columns if c.key not in exclude}
+
+
+def cache_key(*parts) -> str:
+    return CACHE_KEY_PREFIX + ":".join(str(p) for p in parts)
+
+
+def get_or_load(key: str, loader: Callable[[], Optional[Any]], ttl: int = CACHE_TTL_SECONDS,
+                store: bool = True) -> Optional[Any]:
+    """读穿透：命中则直接返回，否则调用 loader 并写入缓存（None 不缓存；store 为 False 时只读不写）"""
+    if not CACHE_ENABLED:
+        return loader()
+
+    raw = _get(key)
+    if raw is not None:
+        cache_stats.hits += 1
+        return json.loads(raw)
+
+    cache_stats.misses += 1
+    value = loader()
+    if value is not None:
+        if store:
+            _set(key, dumps(value), ttl)
+        # 返回与命中时相同的结构，避免两条路径的数据类型不一致
+        value = json.loads(dumps(value))
+    return value
+
+
+def get_many_or_load(keys: Dict[Any, str], loader: Callable[[list], Dict[Any, Any]],
+                     ttl: int = CACHE_TTL_SECONDS, store: bool = True) -> Dict[Any, Any]:
+    """批量读穿透：keys 为 {id: 缓存键}，loader 接收未命中的 id 列表并返回 {id: 值}（store 为 False 时只读不写）"""
+    if not CACHE_ENABLED or not keys:
+        return loader(list(keys))
+
+    ids = list(keys)
+    result = {}
+    for item_id, raw in zip(ids, _mget([keys[item_id] for item_id in ids])):
+        if raw is not None:
+            result[item_id] = json.loads(raw)
+    cache_stats.hits += len(result)
+
+    missing = [item_id for item_id in ids if item_id not in result]
+    cache_stats.misses += len(missing)
+    if missing:
+        loaded = {item_id: json.loads(dumps(value)) for item_id, value in loader(missing).items()}
+        if loaded and store:
+            _mset({keys[item_id]: dumps(value) for item_id, value in loaded.items()}, ttl)
+        result.update(loaded)
+    return result
+
+
+def version(name: str) -> int:
+    """获取版本号，第一次使用时以当前时间初始化，避免缓存被清空后与旧版本冲突"""
+    key = cache_key("version", name)
+    value = _get(key)
+    if value is None:
+        _set(key, str(time.time_ns()), ttl=None, nx=True)
+        value = _get(key) or 0
+    return int(value)
+
+
+def bump_version(name: str):
+    """递增版本号，使该版本下的所有缓存失效（关闭缓存时也要递增，ETag 依赖版本号）"""
+    cache_stats.invalidations += 1
+    _incr(cache_key("version", name))
+
+
+def set_flag(key: str, ttl: int):
+    """设置一个带过期时间的标记（不受 CACHE_ENABLED 影响）"""
+    _set(key, "1", ttl=ttl)
+
+
+def has_flag(key: str) -> bool:
+    """标记是否存在且未过期"""
+    return _get(key) is not None
+
+
+def invalidate(*keys: str):
+    """删除指定缓存"""
+    if not CACHE_ENABLED or not keys:
+        return
+    cache_stats.invalidations += len(keys)
+    _delete(*keys)
+
+
+# ==================== 业务缓存键 ====================
+
+def music_key(music_id: int) -> str:
+    return cache_key("music", music_id)
+
+
+def playlist_key(playlist_id: int) -> str:
+    return cache_key("playlist", playlist_id)
+
+
+def playlist_musics_key(playlist_id: int, skip: int, limit: int, fields=None) -> str:
+    # 歌单歌曲分页同时依赖歌单版本（增删歌曲）和全局音乐版本（歌曲信息修改、删除）
+    return cache_key("playlist_musics", playlist_id, version(f"playlist:{playlist_id}"),
+                     version("musics"), skip, limit, ",".join(fields) if fields else "*")
+
+
+def invalidate_music(*music_ids: int):
+    """音乐信息变化：删除单曲缓存并使所有歌单歌曲分页失效"""
+    invalidate(*(music_key(music_id) for music_id in music_ids))
+    bump_version("musics")
+
+
+def invalidate_playlist(*playlist_ids: int):
+    """歌单信息或歌曲列表变化"""
+    invalidate(*(playlist_key(playlist_id) for playlist_id in playlist_ids))
+    for playlist_id in playlist_ids:
+        bump_version(f"playlist:{playlist_id}")
+
+
+def stats() -> Dict[str, Any]:
+    """缓存命中统计"""
+    result = cache_stats.as_dict()
+    result["enabled"] = CACHE_ENABLED
+    result["backend"] = "local" if _redis_down else "redis"
+    return result
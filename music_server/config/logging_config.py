@@ -1,44 +1,209 @@
 # config/logging_config.py
+"""日志配置
+
+请求线程只把日志记录放入有界队列（QueueHandler），由后台线程（QueueListener）格式化并写入文件和控制台，
+写磁盘不会阻塞事件循环或线程池：
+
+- 日志格式：LOG_FORMAT=json 时每行一条 JSON 记录（包含 request_id 和 extra 传入的字段），text 为原来的文本格式
+- 请求ID：RequestLoggingMiddleware 为每个请求设置 request_id_var，同一请求中的所有日志都会带上它
+- 采样：LOG_SAMPLE_RATES=music_server.request=0.1 表示该日志记录器（及其子记录器）只保留 10% 的 INFO 及以下日志，
+  WARNING 及以上始终保留
+- 队列满时直接丢弃记录并计数（见 stats()），不会阻塞调用方
+"""
+import contextvars
+import copy
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
-from pathlib import Path
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
 
 # 创建日志目录
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json 或 text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # 队列中最多等待写入的记录数
+LOG_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, _, rate in (item.partition("=") for item in os.getenv("LOG_SAMPLE_RATES", "").split(","))
+    if name.strip() and rate.strip()
+}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 当前请求的ID，由 RequestLoggingMiddleware 设置
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# LogRecord 自带的属性，其余属性视为 extra 字段
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录格式化为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            data["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        if record.stack_info:
+            data["stack_info"] = record.stack_info
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """在调用方的上下文中读取请求ID（后台线程中读取不到）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """按日志记录器名称前缀采样 WARNING 以下的日志"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # 名称越长越具体，优先匹配
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        for name, rate in self.rates:
+            if record.name == name or record.name.startswith(name + "."):
+                if random.random() < rate:
+                    return True
+                self.sampled_out += 1
+                return False
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """队列满时丢弃记录而不是阻塞或报错"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.queued = 0
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 在调用线程中合并消息参数并格式化异常，保留 extra 字段供后台线程按 JSON 输出
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            self.queued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+_sampling_filter: Optional[SamplingFilter] = None
+_setup_lock = threading.Lock()
+
 
 # 日志配置
 def setup_logging():
-    """设置日志配置"""
-    # 创建格式器
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-
-    # 创建旋转文件处理器（500MB大小限制）
-    file_handler = RotatingFileHandler(
-        filename=os.path.join(LOG_DIR, "music_server.log"),
-        maxBytes=500 * 1024 * 1024,  # 500MB
-        backupCount=5,  # 保留5个备份文件
-        encoding='utf-8'
-    )
-    file_handler.setFormatter(formatter)
-    file_handler.setLevel(logging.INFO)
-
-    # 创建控制台处理器
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    console_handler.setLevel(logging.WARNING)
-
-    # 配置根日志记录器
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
-
-    # 配置特定模块的日志记录器
-    logging.getLogger("uvicorn").setLevel(logging.INFO)
-    logging.getLogger("fastapi").setLevel(logging.INFO)
-    logging.getLogger("sqlalchemy").setLevel(logging.WARNING)
+    """设置日志配置（重复调用时只配置一次）"""
+    global _listener, _queue_handler, _sampling_filter
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        # 创建格式器
+        text_formatter = logging.Formatter(TEXT_FORMAT)
+        file_formatter = JsonFormatter() if LOG_FORMAT == "json" else text_formatter
+
+        # 创建旋转文件处理器（500MB大小限制）
+        file_handler = RotatingFileHandler(
+            filename=os.path.join(LOG_DIR, "music_server.log"),
+            maxBytes=500 * 1024 * 1024,  # 500MB
+            backupCount=5,  # 保留5个备份文件
+            encoding='utf-8'
+        )
+        file_handler.setFormatter(file_formatter)
+        file_handler.setLevel(logging.INFO)
+
+        # 创建控制台处理器
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(text_formatter)
+        console_handler.setLevel(logging.WARNING)
+
+        # 根日志记录器只挂载队列处理器，文件和控制台由后台线程写入
+        _sampling_filter = SamplingFilter(LOG_SAMPLE_RATES)
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(_sampling_filter)
+        _queue_handler.addFilter(RequestIdFilter())
+        _listener = QueueListener(_queue_handler.queue, file_handler, console_handler,
+                                  respect_handler_level=True)
+        _listener.start()
+
+        # 配置根日志记录器
+        root_logger = logging.getLogger()
+        root_logger.setLevel(logging.INFO)
+        root_logger.addHandler(_queue_handler)
+
+        # 配置特定模块的日志记录器
+        logging.getLogger("uvicorn").setLevel(logging.INFO)
+        logging.getLogger("fastapi").setLevel(logging.INFO)
+        logging.getLogger("sqlalchemy").setLevel(logging.WARNING)
+
+
+def shutdown_logging():
+    """写完队列中剩余的记录并停止后台线程"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _queue_handler = None
+
+
+def stats() -> Dict[str, Any]:
+    """日志队列统计"""
+    if _queue_handler is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "format": LOG_FORMAT,
+        "queued": _queue_handler.queued,
+        "dropped": _queue_handler.dropped,
+        "pending": _queue_handler.queue.qsize(),
+        "sampled_out": _sampling_filter.sampled_out,
+    }
@@ -1,12 +1,18 @@
 from schemas import MusicUpdate
-from sqlalchemy.orm import Session
-from models import User, Music, Playlist, PlaylistMusic
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy import bindparam, func, insert, select, update, case
+from models import User, Music, Playlist, PlaylistMusic, DeleteJob
 from schemas import UserCreate, UserUpdate, MusicCreate, PlaylistCreate, PlaylistUpdate
-from datetime import datetime
+from datetime import datetime, timedelta
 import random
 import string
-from typing import Optional, List
+from typing import Optional, List, Sequence
 from sqlalchemy.exc import SQLAlchemyError
+import cache
+import sharding
+import tracing
+from database import is_replica
+from sharding import scatter_gather
 
 
 
@@ -23,8 +29,9 @@ def get_user(db: Session, user_id: int) -> Optional[User]:
     return db.query(User).filter(User.id == user_id, User.is_deleted == False).first()
 
 def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[User]:
-    """获取用户列表（分页）"""
-    return db.query(User).filter(User.is_deleted == False).offset(skip).limit(limit).all()
+    """获取用户列表（分页，分库时合并各分片的结果）"""
+    query = db.query(User).filter(User.is_deleted == False).order_by(User.id)
+    return scatter_gather(query, skip, limit, key=lambda user: user.id)
 
 
 def get_user_by_email(db: Session, email: str) -> Optional[User]:
@@ -87,18 +94,12 @@ def update_user(db: Session, user_id: int, user_update: UserUpdate):
 
 
 def delete_user(db: Session, user_id: int):
-    """逻辑删除用户及其相关内容"""
+    """逻辑删除用户，用户上传的音乐和创建的歌单由后台任务分批删除"""
     try:
-        # 逻辑删除用户上传的音乐
-        db.query(Music).filter(Music.uploader_id == user_id).update({"is_deleted": True})
-
-        # 逻辑删除用户创建的歌单
-        db.query(Playlist).filter(Playlist.creator_id == user_id).update({"is_deleted": True})
-
-        # 逻辑删除用户
         db_user = db.query(User).filter(User.id == user_id).first()
         if db_user:
             db_user.is_deleted = True
+            enqueue_delete_job(db, "user", user_id)
             db.commit()
             db.refresh(db_user)
         return db_user
@@ -115,18 +116,62 @@ def get_music(db: Session, music_id: int):
     return db.query(Music).filter(Music.id == music_id, Music.is_deleted == False).first()
 
 
-def get_musics(db: Session, skip: int = 0, limit: int = 100):
+def get_music_cached(db: Session, music_id: int) -> Optional[dict]:
+    """根据音乐ID获取音乐信息（优先读缓存，返回字典）
+
+    从只读副本读取时不写入缓存：副本可能落后于主库，写入后会以刚递增的版本号缓存旧数据，
+    在 TTL 内连写入者本人也会读到旧数据。以下 *_cached 函数相同。
+    """
+    def load():
+        db_music = get_music(db, music_id)
+        return cache.row_to_dict(db_music) if db_music else None
+
+    return cache.get_or_load(cache.music_key(music_id), load, store=not is_replica(db))
+
+
+def _only(query, model, fields: Optional[Sequence[str]]):
+    """只加载指定的列（fields为空时加载全部列）"""
+    if not fields:
+        return query
+    return query.options(load_only(*(getattr(model, name) for name in fields)))
+
+
+def get_musics_by_ids(db: Session, music_ids: Sequence[int]) -> List[Music]:
+    """根据ID列表批量获取音乐（一次IN查询，不保证顺序）"""
+    if not music_ids:
+        return []
+    return db.query(Music).filter(Music.id.in_(music_ids), Music.is_deleted == False).all()
+
+
+def get_musics_by_ids_cached(db: Session, music_ids: Sequence[int]) -> dict:
+    """批量获取音乐（优先读缓存），按请求顺序返回并列出不存在或已删除的ID"""
+    # 去重并保持请求顺序
+    ordered_ids = list(dict.fromkeys(music_ids))
+
+    def load(missing_ids):
+        return {music.id: cache.row_to_dict(music) for music in get_musics_by_ids(db, missing_ids)}
+
+    found = cache.get_many_or_load({music_id: cache.music_key(music_id) for music_id in ordered_ids}, load,
+                                 store=not is_replica(db))
+    return {
+        "musics": [found[music_id] for music_id in ordered_ids if music_id in found],
+        "missing_ids": [music_id for music_id in ordered_ids if music_id not in found],
+    }
+
+
+def get_musics(db: Session, skip: int = 0, limit: int = 100, fields: Optional[Sequence[str]] = None):
     """获取音乐列表（分页）"""
-    return db.query(Music).filter(Music.is_deleted == False).offset(skip).limit(limit).all()
+    return _only(db.query(Music), Music, fields).filter(Music.is_deleted == False).offset(skip).limit(limit).all()
 
 
-def get_musics_by_uploader(db: Session, uploader_id: int, skip: int = 0, limit: int = 100):
+def get_musics_by_uploader(db: Session, uploader_id: int, skip: int = 0, limit: int = 100,
+                           fields: Optional[Sequence[str]] = None):
     """根据上传者ID获取音乐列表（分页）"""
-    return db.query(Music).filter(Music.uploader_id == uploader_id, Music.is_deleted == False).offset(skip).limit(
-        limit).all()
+    return _only(db.query(Music), Music, fields).filter(
+        Music.uploader_id == uploader_id, Music.is_deleted == False).offset(skip).limit(limit).all()
 
 
-def search_musics(db: Session, keyword: str, skip: int = 0, limit: int = 100):
+def search_musics(db: Session, keyword: str, skip: int = 0, limit: int = 100, fields: Optional[Sequence[str]] = None):
     """搜索音乐并返回分页信息"""
     # 查询符合条件的音乐总数
     total_count = db.query(Music).filter(
@@ -138,7 +183,7 @@ def search_musics(db: Session, keyword: str, skip: int = 0, limit: int = 100):
     total_pages = (total_count + limit - 1) // limit if limit > 0 else 0
 
     # 查询当前页的音乐列表
-    musics = db.query(Music).filter(
+    musics = _only(db.query(Music), Music, fields).filter(
         (Music.title.contains(keyword)) | (Music.artist.contains(keyword)),
         Music.is_deleted == False
     ).offset(skip).limit(limit).all()
@@ -153,6 +198,7 @@ def search_musics(db: Session, keyword: str, skip: int = 0, limit: int = 100):
     }
 
 
+@tracing.traced("crud.create_music")
 def create_music(db: Session, music: MusicCreate, music_url:str,cover_url:str,lyric_url:str,uploader_id: int):
     """创建新音乐"""
     try:
@@ -187,6 +233,7 @@ def update_music(db: Session, music_id: int, music_update: MusicUpdate):
                 db_music.artist = music_update.artist
             db.commit()
             db.refresh(db_music)
+            cache.invalidate_music(music_id)
         return db_music
     except Exception as e:
         db.rollback()
@@ -194,17 +241,15 @@ def update_music(db: Session, music_id: int, music_update: MusicUpdate):
 
 
 def delete_music(db: Session, music_id: int, user_id: int):
-    """逻辑删除音乐（只有上传者才能删除）"""
+    """逻辑删除音乐（只有上传者才能删除），歌单中的关联由后台任务分批删除"""
     try:
         db_music = db.query(Music).filter(Music.id == music_id).first()
         if db_music and db_music.uploader_id == user_id:
             db_music.is_deleted = True
-
-            # +++ 新增部分：同时逻辑删除该音乐在所有歌单中的关联 +++
-            db.query(PlaylistMusic).filter(PlaylistMusic.music_id == music_id).update({"is_deleted": True})
-
+            enqueue_delete_job(db, "music", music_id)
             db.commit()
             db.refresh(db_music)
+            cache.invalidate_music(music_id)
             return db_music
         return None
     except Exception as e:
@@ -220,9 +265,19 @@ def get_playlist(db: Session, playlist_id: int):
     return db.query(Playlist).filter(Playlist.id == playlist_id, Playlist.is_deleted == False).first()
 
 
-def get_playlists(db: Session, skip: int = 0, limit: int = 100):
-    """获取歌单列表（分页）"""
-    return db.query(Playlist).filter(Playlist.is_deleted == False).offset(skip).limit(limit).all()
+def get_playlist_cached(db: Session, playlist_id: int) -> Optional[dict]:
+    """根据歌单ID获取歌单信息（优先读缓存，返回字典）"""
+    def load():
+        db_playlist = get_playlist(db, playlist_id)
+        return cache.row_to_dict(db_playlist) if db_playlist else None
+
+    return cache.get_or_load(cache.playlist_key(playlist_id), load, store=not is_replica(db))
+
+
+def get_playlists(db: Session, skip: int = 0, limit: int = 100, fields: Optional[Sequence[str]] = None):
+    """获取歌单列表（分页，分库时合并各分片的结果）"""
+    query = _only(db.query(Playlist), Playlist, fields).filter(Playlist.is_deleted == False).order_by(Playlist.id)
+    return scatter_gather(query, skip, limit, key=lambda playlist: playlist.id)
 
 
 def get_playlists_by_creator(db: Session, creator_id: int, skip: int = 0, limit: int = 100):
@@ -262,6 +317,7 @@ def update_playlist(db: Session, playlist_id: int, playlist_update: PlaylistUpda
             db_playlist.updated_at = datetime.utcnow()
             db.commit()
             db.refresh(db_playlist)
+            cache.invalidate_playlist(playlist_id)
         return db_playlist
     except Exception as e:
         db.rollback()
@@ -280,6 +336,7 @@ def delete_playlist(db: Session, playlist_id: int, user_id: int):
             db_playlist.is_deleted = True
             db.commit()
             db.refresh(db_playlist)
+            cache.invalidate_playlist(playlist_id)
             return db_playlist
         return None
     except Exception as e:
@@ -287,7 +344,25 @@ def delete_playlist(db: Session, playlist_id: int, user_id: int):
         raise e
 
 
-def get_playlists_by_creator_with_pagination(db: Session, creator_id: int, skip: int = 0, limit: int = 100):
+def get_playlists_version(db: Session, creator_id: int) -> tuple:
+    """获取用户歌单列表的版本信息（只做聚合查询，不读取完整数据）"""
+    # updated_at 统计包含已删除的歌单，删除歌单时版本同样会变化
+    return db.query(
+        func.count(Playlist.id).filter(Playlist.is_deleted == False),
+        func.max(Playlist.updated_at),
+        func.sum(Playlist.music_count).filter(Playlist.is_deleted == False)
+    ).filter(Playlist.creator_id == creator_id).one()
+
+
+def get_playlist_version(db: Session, playlist_id: int) -> Optional[tuple]:
+    """获取歌单的版本信息，歌单不存在时返回None"""
+    return db.query(Playlist.updated_at, Playlist.music_count).filter(
+        Playlist.id == playlist_id, Playlist.is_deleted == False
+    ).first()
+
+
+def get_playlists_by_creator_with_pagination(db: Session, creator_id: int, skip: int = 0, limit: int = 100,
+                                             fields: Optional[Sequence[str]] = None):
     """根据创建者ID获取歌单列表（分页）并返回分页信息"""
     # 查询符合条件的歌单总数
     total_count = db.query(Playlist).filter(
@@ -299,7 +374,7 @@ def get_playlists_by_creator_with_pagination(db: Session, creator_id: int, skip:
     total_pages = (total_count + limit - 1) // limit if limit > 0 else 0
 
     # 查询当前页的歌单列表
-    playlists = db.query(Playlist).filter(
+    playlists = _only(db.query(Playlist), Playlist, fields).filter(
         Playlist.creator_id == creator_id,
         Playlist.is_deleted == False
     ).offset(skip).limit(limit).all()
@@ -314,6 +389,24 @@ def get_playlists_by_creator_with_pagination(db: Session, creator_id: int, skip:
 
 
 # ==================== 歌单音乐关联操作 ====================
+def _adjust_music_count(db: Session, playlist_id: int, delta: int):
+    """在数据库中原子地增减歌单的歌曲计数（不在 Python 中读取再写回，避免并发时丢失更新）"""
+    if not delta:
+        return
+    count = Playlist.music_count + delta
+    db.execute(
+        update(Playlist).where(Playlist.id == playlist_id)
+        .values(music_count=case((count > 0, count), else_=0), updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _next_position(db: Session, playlist_id: int) -> float:
+    """歌单末尾的排序位置"""
+    max_position = db.query(func.max(PlaylistMusic.position)).filter(PlaylistMusic.playlist_id == playlist_id).scalar()
+    return (max_position or 0) + 1
+
+
 def add_music_to_playlist(db: Session, playlist_id: int, music_id: int):
     """向歌单添加音乐"""
     try:
@@ -327,31 +420,32 @@ def add_music_to_playlist(db: Session, playlist_id: int, music_id: int):
             return existing
 
         if existing and existing.is_deleted:
-            # 如果已存在但被标记为删除，则恢复
-            existing.is_deleted = False
-            # 增加歌单的歌曲计数
-            db_playlist = db.query(Playlist).filter(Playlist.id == playlist_id, Playlist.is_deleted == False).first()
-            if db_playlist:
-                db_playlist.music_count += 1
+            # 如果已存在但被标记为删除，则恢复并放到歌单末尾
+            # 只有确实由删除状态恢复的那一次请求才增加计数（并发恢复时只有一个 UPDATE 命中）
+            restored = db.query(PlaylistMusic).filter(
+                PlaylistMusic.id == existing.id,
+                PlaylistMusic.is_deleted == True
+            ).update({"is_deleted": False, "deleted_at": None, "position": _next_position(db, playlist_id)},
+                     synchronize_session=False)
+            _adjust_music_count(db, playlist_id, restored)
             db.commit()
             db.refresh(existing)
+            cache.invalidate_playlist(playlist_id)
             return existing
 
         db_playlist_music = PlaylistMusic(
             playlist_id=playlist_id,
-            music_id=music_id
+            music_id=music_id,
+            position=_next_position(db, playlist_id)
         )
         db.add(db_playlist_music)
 
         # 增加歌单的歌曲计数
-        db_playlist = db.query(Playlist).filter(Playlist.id == playlist_id, Playlist.is_deleted == False).first()
-        if db_playlist:
-            db_playlist.music_count += 1
+        _adjust_music_count(db, playlist_id, 1)
 
         db.commit()
         db.refresh(db_playlist_music)
-        if db_playlist:
-            db.refresh(db_playlist)
+        cache.invalidate_playlist(playlist_id)
         return db_playlist_music
     except Exception as e:
         db.rollback()
@@ -367,15 +461,15 @@ def remove_music_from_playlist(db: Session, playlist_id: int, music_id: int):
         ).first()
 
         if db_playlist_music and not db_playlist_music.is_deleted:
-            db_playlist_music.is_deleted = True
-            # 减少歌单的歌曲计数
-            db_playlist = db.query(Playlist).filter(Playlist.id == playlist_id, Playlist.is_deleted == False).first()
-            if db_playlist and db_playlist.music_count > 0:
-                db_playlist.music_count -= 1
+            # 按实际删除的行数减少歌单的歌曲计数（并发删除时只有一个 UPDATE 命中）
+            removed = db.query(PlaylistMusic).filter(
+                PlaylistMusic.id == db_playlist_music.id,
+                PlaylistMusic.is_deleted == False
+            ).update({"is_deleted": True}, synchronize_session=False)
+            _adjust_music_count(db, playlist_id, -removed)
             db.commit()
             db.refresh(db_playlist_music)
-            if db_playlist:
-                db.refresh(db_playlist)
+            cache.invalidate_playlist(playlist_id)
         return db_playlist_music
     except Exception as e:
         db.rollback()
@@ -384,6 +478,228 @@ def remove_music_from_playlist(db: Session, playlist_id: int, music_id: int):
 
 
 
+def add_musics_to_playlist(db: Session, playlist_id: int, music_ids: Sequence[int]) -> dict:
+    """批量向歌单添加音乐（按顺序追加到末尾，单个事务，歌曲计数只更新一次）"""
+    try:
+        ordered_ids = list(dict.fromkeys(music_ids))
+
+        # 只添加存在且未删除的音乐
+        valid_ids = {row.id for row in db.query(Music.id).filter(Music.id.in_(ordered_ids), Music.is_deleted == False)}
+
+        # 已有的关联记录：未删除的跳过，已删除的恢复
+        existing = {
+            row.music_id: row for row in db.query(PlaylistMusic.id, PlaylistMusic.music_id, PlaylistMusic.is_deleted)
+            .filter(PlaylistMusic.playlist_id == playlist_id, PlaylistMusic.music_id.in_(ordered_ids))
+        }
+
+        position = _next_position(db, playlist_id)
+        added, skipped, inserts, restores = [], [], [], {}
+        for music_id in ordered_ids:
+            if music_id not in valid_ids:
+                continue
+            row = existing.get(music_id)
+            if row is not None and not row.is_deleted:
+                skipped.append(music_id)
+                continue
+            if row is not None:
+                restores[row.id] = position
+            else:
+                inserts.append({"playlist_id": playlist_id, "music_id": music_id, "position": position,
+                                "added_at": datetime.utcnow(), "is_deleted": False})
+            added.append(music_id)
+            position += 1
+
+        if inserts:
+            # 使用表级 INSERT（ORM 批量插入不支持分库会话），分库时由 ShardRouter 分配ID
+            db.execute(insert(PlaylistMusic.__table__), inserts)
+        restored = 0
+        if restores:
+            # 只恢复仍处于删除状态的记录，按实际恢复的行数增加计数
+            restored = db.query(PlaylistMusic).filter(
+                PlaylistMusic.id.in_(restores),
+                PlaylistMusic.is_deleted == True
+            ).update({
+                "is_deleted": False,
+                "deleted_at": None,
+                "position": case(restores, value=PlaylistMusic.id)
+            }, synchronize_session=False)
+        _adjust_music_count(db, playlist_id, len(inserts) + restored)
+        db.commit()
+        if added:
+            cache.invalidate_playlist(playlist_id)
+
+        return {
+            "music_ids": added,
+            "skipped_ids": skipped,
+            "missing_ids": [music_id for music_id in ordered_ids if music_id not in valid_ids],
+        }
+    except Exception as e:
+        db.rollback()
+        raise e
+
+
+def remove_musics_from_playlist(db: Session, playlist_id: int, music_ids: Sequence[int]) -> dict:
+    """批量从歌单移除音乐（逻辑删除，单个事务，歌曲计数只更新一次）"""
+    try:
+        ordered_ids = list(dict.fromkeys(music_ids))
+        active = {
+            row.music_id for row in db.query(PlaylistMusic.music_id).filter(
+                PlaylistMusic.playlist_id == playlist_id,
+                PlaylistMusic.music_id.in_(ordered_ids),
+                PlaylistMusic.is_deleted == False
+            )
+        }
+        removed = [music_id for music_id in ordered_ids if music_id in active]
+
+        if removed:
+            # 按实际更新的行数减少计数，并发删除同一批歌曲时不会重复扣减
+            count = db.query(PlaylistMusic).filter(
+                PlaylistMusic.playlist_id == playlist_id,
+                PlaylistMusic.music_id.in_(removed),
+                PlaylistMusic.is_deleted == False
+            ).update({"is_deleted": True}, synchronize_session=False)
+            _adjust_music_count(db, playlist_id, -count)
+        db.commit()
+        if removed:
+            cache.invalidate_playlist(playlist_id)
+
+        return {
+            "music_ids": removed,
+            "skipped_ids": [],
+            "missing_ids": [music_id for music_id in ordered_ids if music_id not in active],
+        }
+    except Exception as e:
+        db.rollback()
+        raise e
+
+
+# 相邻位置的最小间隔，小于该值时重新均匀分配整个歌单的位置
+POSITION_MIN_GAP = 1e-9
+
+
+def _update_positions(db: Session, playlist_id: int, positions: Sequence[tuple]):
+    """按主键批量更新歌单歌曲的位置（executemany，只需要一条语句）
+
+    使用表级 UPDATE（ORM 按主键批量更新不支持分库会话），条件中带上歌单ID，分库时路由到歌单所在的分片。
+    """
+    if not positions:
+        return
+    table = PlaylistMusic.__table__
+    db.execute(
+        update(table)
+        .where(table.c.id == bindparam("row_id"), table.c.playlist_id == playlist_id)
+        .values(position=bindparam("new_position")),
+        [{"row_id": row_id, "new_position": position} for row_id, position in positions]
+    )
+
+
+def _rebalance_positions(db: Session, playlist_id: int):
+    """把歌单中所有歌曲的位置重新分配为 1, 2, 3...（只在间隔耗尽时执行）"""
+    rows = db.query(PlaylistMusic.id).filter(
+        PlaylistMusic.playlist_id == playlist_id,
+        PlaylistMusic.is_deleted == False
+    ).order_by(PlaylistMusic.position, PlaylistMusic.id).all()
+    _update_positions(db, playlist_id, [(row.id, float(index + 1)) for index, row in enumerate(rows)])
+
+
+def _neighbor_position(db: Session, playlist_id: int, position: float, after: bool,
+                       exclude_music_id: int) -> Optional[float]:
+    """查找指定位置之后（或之前）最近的一首歌曲的位置"""
+    query = db.query(PlaylistMusic.position).filter(
+        PlaylistMusic.playlist_id == playlist_id,
+        PlaylistMusic.music_id != exclude_music_id,
+        PlaylistMusic.is_deleted == False
+    )
+    if after:
+        row = query.filter(PlaylistMusic.position > position).order_by(PlaylistMusic.position).first()
+    else:
+        row = query.filter(PlaylistMusic.position < position).order_by(PlaylistMusic.position.desc()).first()
+    return row.position if row else None
+
+
+def _move_position(db: Session, playlist_id: int, music_id: int, after_music_id: Optional[int],
+                   before_music_id: Optional[int]) -> tuple:
+    """计算移动后的位置，返回 (位置, 间隔是否已耗尽)，锚点歌曲不存在时位置为None"""
+    after = after_music_id is not None
+    anchor = db.query(PlaylistMusic.position).filter(
+        PlaylistMusic.playlist_id == playlist_id,
+        PlaylistMusic.music_id == (after_music_id if after else before_music_id),
+        PlaylistMusic.is_deleted == False
+    ).first()
+    if anchor is None:
+        return None, False
+
+    neighbor = _neighbor_position(db, playlist_id, anchor.position, after=after, exclude_music_id=music_id)
+    if neighbor is None:
+        # 锚点是第一首或最后一首
+        return (anchor.position + 1 if after else anchor.position - 1), False
+    return (anchor.position + neighbor) / 2, abs(neighbor - anchor.position) < POSITION_MIN_GAP
+
+
+def move_playlist_music(db: Session, playlist_id: int, music_id: int, after_music_id: Optional[int] = None,
+                        before_music_id: Optional[int] = None):
+    """移动歌单中的一首歌曲到另一首之后（或之前），通常只更新一行"""
+    try:
+        db_playlist_music = db.query(PlaylistMusic).filter(
+            PlaylistMusic.playlist_id == playlist_id,
+            PlaylistMusic.music_id == music_id,
+            PlaylistMusic.is_deleted == False
+        ).first()
+        if db_playlist_music is None or music_id in (after_music_id, before_music_id):
+            return None
+
+        position, exhausted = _move_position(db, playlist_id, music_id, after_music_id, before_music_id)
+        if position is None:
+            return None
+        if exhausted:
+            # 多次在同一位置插入后间隔会耗尽，此时重新分配整个歌单的位置后再计算
+            _rebalance_positions(db, playlist_id)
+            position, _ = _move_position(db, playlist_id, music_id, after_music_id, before_music_id)
+
+        db_playlist_music.position = position
+        db.query(Playlist).filter(Playlist.id == playlist_id).update(
+            {"updated_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        db.refresh(db_playlist_music)
+        cache.invalidate_playlist(playlist_id)
+        return db_playlist_music
+    except Exception as e:
+        db.rollback()
+        raise e
+
+
+def reorder_playlist_musics(db: Session, playlist_id: int, music_ids: Sequence[int]) -> dict:
+    """按给定顺序重排歌单（列出的歌曲排在最前，其余歌曲保持原有相对顺序）"""
+    try:
+        ordered_ids = list(dict.fromkeys(music_ids))
+        rows = db.query(PlaylistMusic.id, PlaylistMusic.music_id).filter(
+            PlaylistMusic.playlist_id == playlist_id,
+            PlaylistMusic.is_deleted == False
+        ).order_by(PlaylistMusic.position, PlaylistMusic.id).all()
+
+        row_ids = {row.music_id: row.id for row in rows}
+        listed = [music_id for music_id in ordered_ids if music_id in row_ids]
+        listed_set = set(listed)
+        new_order = listed + [row.music_id for row in rows if row.music_id not in listed_set]
+
+        if new_order:
+            _update_positions(db, playlist_id,
+                              [(row_ids[music_id], float(index + 1)) for index, music_id in enumerate(new_order)])
+            db.execute(update(Playlist).where(Playlist.id == playlist_id).values(updated_at=datetime.utcnow()))
+        db.commit()
+        if new_order:
+            cache.invalidate_playlist(playlist_id)
+
+        return {
+            "music_ids": listed,
+            "skipped_ids": [],
+            "missing_ids": [music_id for music_id in ordered_ids if music_id not in row_ids],
+        }
+    except Exception as e:
+        db.rollback()
+        raise e
+
+
 def get_playlist_musics(db: Session, playlist_id: int, skip: int = 0, limit: int = 100):
     """获取歌单中的所有音乐（分页）"""
     return db.query(PlaylistMusic).filter(
@@ -392,11 +708,266 @@ def get_playlist_musics(db: Session, playlist_id: int, skip: int = 0, limit: int
     ).offset(skip).limit(limit).all()
 
 
+def get_playlist_musics_with_pagination(db: Session, playlist_id: int, skip: int = 0, limit: int = 100,
+                                        fields: Optional[Sequence[str]] = None):
+    """获取歌单中的音乐详情（分页）并返回分页信息"""
+    if sharding.is_enabled():
+        return _get_playlist_musics_from_shard(db, playlist_id, skip, limit, fields)
+
+    # 计算总记录数
+    total_count = db.query(PlaylistMusic).join(
+        Music, PlaylistMusic.music_id == Music.id
+    ).filter(
+        PlaylistMusic.playlist_id == playlist_id,
+        PlaylistMusic.is_deleted == False,
+        Music.is_deleted == False
+    ).count()
+
+    # 计算总页数
+    total_pages = (total_count + limit - 1) // limit if limit > 0 else 0
+
+    # 获取当前页数据
+    musics = _only(db.query(Music), Music, fields).join(
+        PlaylistMusic, PlaylistMusic.music_id == Music.id
+    ).filter(
+        PlaylistMusic.playlist_id == playlist_id,
+        PlaylistMusic.is_deleted == False,
+        Music.is_deleted == False
+    ).order_by(PlaylistMusic.position, PlaylistMusic.id).offset(skip).limit(limit).all()
+
+    return {
+        "musics": musics,
+        "total_count": total_count,
+        "total_pages": total_pages,
+        "current_page": skip // limit + 1 if limit > 0 else 1,
+        "page_size": limit
+    }
+
+
+def _get_playlist_musics_from_shard(db: Session, playlist_id: int, skip: int, limit: int,
+                                    fields: Optional[Sequence[str]]):
+    """分库时 musics 与 playlist_musics 不在同一个数据库，先从分片查出当前页的歌曲ID，再到 catalog 查询歌曲
+
+    已删除但级联任务尚未处理的歌曲会计入总数，但不会出现在当前页中。
+    """
+    query = db.query(PlaylistMusic.music_id).filter(
+        PlaylistMusic.playlist_id == playlist_id,
+        PlaylistMusic.is_deleted == False
+    )
+    total_count = query.count()
+    music_ids = [row.music_id for row in
+                 query.order_by(PlaylistMusic.position, PlaylistMusic.id).offset(skip).limit(limit)]
+
+    found = {}
+    if music_ids:
+        found = {music.id: music for music in _only(db.query(Music), Music, fields).filter(
+            Music.id.in_(music_ids), Music.is_deleted == False)}
+
+    return {
+        "musics": [found[music_id] for music_id in music_ids if music_id in found],
+        "total_count": total_count,
+        "total_pages": (total_count + limit - 1) // limit if limit > 0 else 0,
+        "current_page": skip // limit + 1 if limit > 0 else 1,
+        "page_size": limit
+    }
+
+
+def get_playlist_musics_cached(db: Session, playlist_id: int, skip: int = 0, limit: int = 100,
+                               fields: Optional[Sequence[str]] = None) -> dict:
+    """获取歌单中的音乐详情（分页，优先读缓存）"""
+    music_fields = fields or ("id", "title", "artist", "music_url", "cover_url", "lyric_url", "created_at")
+
+    def load():
+        result = get_playlist_musics_with_pagination(db, playlist_id, skip=skip, limit=limit, fields=music_fields)
+        result["musics"] = [{field: getattr(music, field) for field in music_fields} for music in result["musics"]]
+        return result
+
+    return cache.get_or_load(cache.playlist_musics_key(playlist_id, skip, limit, fields), load,
+                             store=not is_replica(db))
+
+
 def get_music_playlists(db: Session, music_id: int, skip: int = 0, limit: int = 100):
-    """获取包含指定音乐的所有歌单（分页）"""
-    return db.query(PlaylistMusic).filter(
+    """获取包含指定音乐的所有歌单（分页，分库时合并各分片的结果）"""
+    query = db.query(PlaylistMusic).filter(
         PlaylistMusic.music_id == music_id,
         PlaylistMusic.is_deleted == False
-    ).offset(skip).limit(limit).all()
+    ).order_by(PlaylistMusic.id)
+    return scatter_gather(query, skip, limit, key=lambda playlist_music: playlist_music.id)
+
+
+# ==================== 数据维护 ====================
+
+def reconcile_music_counts(db: Session, fix: bool = True, batch_size: int = 500) -> dict:
+    """用一次 GROUP BY 重新统计所有歌单的歌曲数量，返回 music_count 与实际数量不一致的歌单
+
+    fix 为 True 时修正计数。修正语句在 UPDATE 时重新统计，不会覆盖统计之后并发写入的结果。
+    """
+    try:
+        actual = (
+            select(PlaylistMusic.playlist_id, func.count(PlaylistMusic.id).label("actual"))
+            .where(PlaylistMusic.is_deleted == False)
+            .group_by(PlaylistMusic.playlist_id)
+            .subquery()
+        )
+        actual_count = func.coalesce(actual.c.actual, 0)
+        rows = db.execute(
+            select(Playlist.id, Playlist.music_count, actual_count)
+            .outerjoin(actual, actual.c.playlist_id == Playlist.id)
+            .where(func.coalesce(Playlist.music_count, -1) != actual_count)
+            .order_by(Playlist.id)
+        ).all()
+        drifted = [
+            {"playlist_id": playlist_id, "music_count": music_count, "actual": count}
+            for playlist_id, music_count, count in rows
+        ]
+
+        if fix and drifted:
+            recount = (
+                select(func.count(PlaylistMusic.id))
+                .where(PlaylistMusic.playlist_id == Playlist.id, PlaylistMusic.is_deleted == False)
+                .scalar_subquery()
+            )
+            playlist_ids = [item["playlist_id"] for item in drifted]
+            for start in range(0, len(playlist_ids), batch_size):
+                db.execute(
+                    update(Playlist).where(Playlist.id.in_(playlist_ids[start:start + batch_size]))
+                    .values(music_count=recount, updated_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+            cache.invalidate_playlist(*playlist_ids)
+
+        return {
+            # 分库时每个分片返回一行计数
+            "checked": sum(count for (count,) in db.query(func.count(Playlist.id)).all()),
+            "drifted": len(drifted),
+            "fixed": bool(fix and drifted),
+            "playlists": drifted,
+        }
+    except Exception as e:
+        db.rollback()
+        raise e
+
 
+# ==================== 后台级联删除 ====================
 
+def enqueue_delete_job(db: Session, kind: str, target_id: int) -> DeleteJob:
+    """创建级联删除任务（与删除操作在同一个事务中提交）"""
+    db_job = DeleteJob(kind=kind, target_id=target_id, status="pending", run_at=datetime.utcnow())
+    db.add(db_job)
+    return db_job
+
+
+def _cascade_music_batch(db: Session, music_id: int, batch_size: int) -> int:
+    """逻辑删除一批包含该音乐的歌单关联，并减少对应歌单的歌曲计数"""
+    rows = db.query(PlaylistMusic.id, PlaylistMusic.playlist_id).filter(
+        PlaylistMusic.music_id == music_id,
+        PlaylistMusic.is_deleted == False
+    ).limit(batch_size).all()
+    if not rows:
+        return 0
+
+    row_ids = [row.id for row in rows]
+    removed = db.query(PlaylistMusic).filter(
+        PlaylistMusic.id.in_(row_ids),
+        PlaylistMusic.is_deleted == False
+    ).update({"is_deleted": True}, synchronize_session=False)
+
+    # 同一个歌单可能有多条关联，按歌单汇总后原子地减少计数
+    deltas = {}
+    for row in rows:
+        deltas[row.playlist_id] = deltas.get(row.playlist_id, 0) + 1
+    for playlist_id, delta in deltas.items():
+        _adjust_music_count(db, playlist_id, -delta)
+    db.commit()
+    cache.invalidate_playlist(*deltas)
+    return removed
+
+
+def _cascade_user_batch(db: Session, user_id: int, batch_size: int) -> int:
+    """逻辑删除一批用户上传的音乐（并为其创建级联任务）和用户创建的歌单"""
+    music_ids = [row.id for row in db.query(Music.id).filter(
+        Music.uploader_id == user_id,
+        Music.is_deleted == False
+    ).limit(batch_size)]
+    if music_ids:
+        db.query(Music).filter(Music.id.in_(music_ids)).update({"is_deleted": True}, synchronize_session=False)
+        for music_id in music_ids:
+            enqueue_delete_job(db, "music", music_id)
+        db.commit()
+        cache.invalidate_music(*music_ids)
+        return len(music_ids)
+
+    playlist_ids = [row.id for row in db.query(Playlist.id).filter(
+        Playlist.creator_id == user_id,
+        Playlist.is_deleted == False
+    ).limit(batch_size)]
+    if playlist_ids:
+        db.query(Playlist).filter(Playlist.id.in_(playlist_ids)).update(
+            {"is_deleted": True, "updated_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        cache.invalidate_playlist(*playlist_ids)
+    return len(playlist_ids)
+
+
+CASCADE_STEPS = {
+    "music": _cascade_music_batch,
+    "user": _cascade_user_batch,
+}
+
+
+def claim_delete_job(db: Session, lease_seconds: int) -> Optional[DeleteJob]:
+    """领取一个到期的任务（多个进程同时领取时只有一个 UPDATE 命中）
+
+    运行中但超过 lease_seconds 未更新的任务视为进程已退出，可以重新领取。
+    """
+    now = datetime.utcnow()
+    candidates = db.query(DeleteJob.id).filter(
+        ((DeleteJob.status == "pending") & (DeleteJob.run_at <= now)) |
+        ((DeleteJob.status == "running") & (DeleteJob.updated_at < now - timedelta(seconds=lease_seconds)))
+    ).order_by(DeleteJob.run_at, DeleteJob.id).limit(10).all()
+
+    for candidate in candidates:
+        claimed = db.query(DeleteJob).filter(
+            DeleteJob.id == candidate.id,
+            DeleteJob.status.in_(("pending", "running")),
+            ((DeleteJob.status == "pending") | (DeleteJob.updated_at < now - timedelta(seconds=lease_seconds)))
+        ).update({"status": "running", "updated_at": now}, synchronize_session=False)
+        db.commit()
+        if claimed:
+            return db.query(DeleteJob).filter(DeleteJob.id == candidate.id).first()
+    return None
+
+
+def run_delete_job_batch(db: Session, job: DeleteJob, batch_size: int) -> bool:
+    """处理任务的一批数据并记录进度，全部处理完成时返回 True"""
+    processed = CASCADE_STEPS[job.kind](db, job.target_id, batch_size)
+    if processed:
+        job.processed += processed
+    else:
+        job.status = "done"
+    job.updated_at = datetime.utcnow()
+    db.commit()
+    return job.status == "done"
+
+
+def fail_delete_job(db: Session, job_id: int, error: str, max_attempts: int, retry_seconds: float):
+    """记录失败原因，按指数退避延迟重试，超过最大次数后标记为失败"""
+    db.rollback()
+    db_job = db.query(DeleteJob).filter(DeleteJob.id == job_id).first()
+    if db_job is None:
+        return
+    db_job.attempts += 1
+    db_job.last_error = error[:500]
+    if db_job.attempts >= max_attempts:
+        db_job.status = "failed"
+    else:
+        db_job.status = "pending"
+        db_job.run_at = datetime.utcnow() + timedelta(seconds=retry_seconds * 2 ** (db_job.attempts - 1))
+    db.commit()
+
+
+def get_delete_job_stats(db: Session) -> dict:
+    """按状态统计任务数量"""
+    rows = db.query(DeleteJob.status, func.count(DeleteJob.id)).group_by(DeleteJob.status).all()
+    return {status: count for status, count in rows}
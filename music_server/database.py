@@ -1,20 +1,211 @@
 # database.py
-from sqlalchemy import create_engine
+"""数据库连接与会话
+
+写操作使用主库（SessionLocal / get_db），只读路由使用 get_read_db：配置了 DATABASE_REPLICA_URLS 时
+按轮询从只读副本中选择一个，否则仍使用主库。
+
+副本存在复制延迟，用户自己写入后的 READ_YOUR_WRITES_SECONDS 秒内，该用户的读请求仍然使用主库，
+保证能读到自己刚写入的数据（标记保存在缓存中，多个进程之间共享）。
+"""
+import itertools
+import math
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from fastapi import Request
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.horizontal_shard import ShardedSession
 from sqlalchemy.orm import sessionmaker, Session
 
-DATABASE_URL = "sqlite:///./music.db"
+import cache
+import metrics
+import query_stats
+import tracing
+import sharding
+from auth import verify_token
+
+# 加载环境变量
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./music.db")
+# 逗号分隔的只读副本地址，例如 sqlite:///./music_replica.db 或 postgresql://reader@replica/music
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))  # 写入后读主库的时间窗口
+
+
+def _create_engine(url: str, **kwargs):
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    db_engine = create_engine(url, connect_args=connect_args, **kwargs)
+    _instrument_engine(db_engine)
+    metrics.instrument_pool(db_engine)
+    return db_engine
+
+
+def _instrument_engine(db_engine):
+    """为引擎注册一组语句钩子：每条语句只计时一次，再分别交给指标、请求语句统计和追踪"""
+    database = metrics.database_label(db_engine)
+    system = db_engine.url.get_backend_name()
+
+    @event.listens_for(db_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = tracing.start_query_span(system, database, statement)
+        conn.info.setdefault("query_start", []).append((time.perf_counter(), span))
+
+    @event.listens_for(db_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started, span = conn.info["query_start"].pop()
+        duration = time.perf_counter() - started
+        metrics.observe_query(database, statement, duration)
+        query_stats.record_query(statement, parameters, duration)
+        if span is not None:
+            span.finish(duration)
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    @event.listens_for(db_engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            _, span = starts.pop()
+            if span is not None:
+                span.set_tag("error", type(context.original_exception).__name__)
+                span.finish()
+
+
+engine = _create_engine(DATABASE_URL)
+replica_engines = [_create_engine(url) for url in DATABASE_REPLICA_URLS]
+
+if sharding.is_enabled():
+    # 按用户分库：主库作为 catalog 保存全局数据，用户数据路由到各分片（见 sharding.py）
+    shard_engines = {sharding.CATALOG_SHARD: engine,
+                     **{shard_id: _create_engine(url) for shard_id, url in sharding.shard_urls().items()}}
+    shard_router = sharding.ShardRouter(sharding.IdAllocator(engine))
+    SessionLocal = sessionmaker(
+        class_=ShardedSession, autocommit=False, autoflush=False, shards=shard_engines,
+        shard_chooser=shard_router.shard_chooser, identity_chooser=shard_router.identity_chooser,
+        execute_chooser=shard_router.execute_chooser
+    )
+    # 分库与只读副本暂不同时使用
+    replica_engines = []
+else:
+    shard_engines = {sharding.CATALOG_SHARD: engine}
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+_replica_cycle = itertools.cycle(replica_engines)
+_replica_lock = threading.Lock()
+
+
+def _next_replica():
+    with _replica_lock:
+        return next(_replica_cycle)
+
+
+def ReadSessionLocal() -> Session:
+    """创建只读会话（没有配置副本时使用主库）"""
+    if not replica_engines:
+        return SessionLocal()
+    db = SessionLocal(bind=_next_replica())
+    db.info["replica"] = True
+    return db
+
+
+def is_replica(db: Session) -> bool:
+    """会话是否读取只读副本（副本可能落后于主库）"""
+    return db.info.get("replica", False)
+
+
+# ==================== 写后读主库 ====================
+
+def _recent_write_key(user_id) -> str:
+    return cache.cache_key("recent_write", user_id)
+
+
+def mark_recent_write(user_id):
+    """记录用户刚刚写入过数据"""
+    cache.set_flag(_recent_write_key(user_id), ttl=max(1, math.ceil(READ_YOUR_WRITES_SECONDS)))
+
+
+def has_recent_write(user_id) -> bool:
+    return cache.has_flag(_recent_write_key(user_id))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _after_flush(session, flush_context):
+    session.info["has_writes"] = True
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _do_orm_execute(orm_execute_state):
+    # 批量 insert / update / delete 语句不经过 flush
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["has_writes"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _after_commit(session):
+    has_writes = session.info.pop("has_writes", False)
+    user_id = session.info.get("user_id")
+    if replica_engines and has_writes and user_id is not None:
+        mark_recent_write(user_id)
+
+
+def _request_user_id(request: Request):
+    """当前请求的用户ID（未登录时为 None）"""
+    payload = getattr(request.state, "user_payload", None)
+    if payload is None:
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            return None
+        payload = verify_token(auth_header.split(" ")[1]) or {}
+    return payload.get("user_id")
+
+
+def get_db(request: Request):
+    """主库会话依赖（写操作）"""
+    db = SessionLocal()
+    db.info["user_id"] = _request_user_id(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request):
+    """只读会话依赖：使用副本，当前用户刚写入过数据时使用主库"""
+    user_id = _request_user_id(request)
+    if replica_engines and user_id is not None and has_recent_write(user_id):
+        db = SessionLocal()
+    else:
+        db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 # 添加这行来创建所有表
 def init_db():
-    # 初始化数据库
-    Base.metadata.create_all(bind=engine)
+    # 初始化数据库（分库时每个分片使用相同的表结构）
+    for db_engine in shard_engines.values():
+        Base.metadata.create_all(bind=db_engine)
+        migrate_db(db_engine)
+
 
+def migrate_db(engine=engine):
+    """为已有数据库补充新增的列和索引（create_all 不会修改已存在的表）"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
+        # 旧数据没有排序位置，按添加顺序补齐
+        conn.execute(text("UPDATE playlist_musics SET position = id WHERE position IS NULL"))
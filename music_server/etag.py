@@ -0,0 +1,57 @@
+# etag.py
+"""基于版本号的 ETag / If-None-Match 条件响应
+
+ETag 由资源的版本信息（updated_at、music_count、缓存版本号等）计算，
+而不是对响应体做哈希，所以资源未变化时可以在查询完整数据和序列化之前直接返回 304。
+"""
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Request, Response
+
+from media_delivery import signature_epoch
+
+
+def make_etag(*parts) -> str:
+    """根据版本信息生成弱 ETag"""
+    # 开启签名地址时，签名过期时间变化后响应体也会变化
+    raw = "|".join(str(part) for part in (*parts, signature_epoch()))
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:20]}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """判断客户端缓存的版本是否仍然有效"""
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    # 弱比较：忽略 W/ 前缀
+    def opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+
+    return opaque(etag) in {opaque(tag) for tag in if_none_match.split(",")}
+
+
+def set_etag(response: Response, etag: str):
+    """在响应头中添加 ETag，要求客户端每次使用前重新验证"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+
+
+def with_etag(result: Any, response: Response, etag: Optional[str]) -> Any:
+    """为成功的返回值加上 ETag，必须在响应体生成之后调用
+
+    出错时返回的 code=500 不能带 ETag，否则客户端用 If-None-Match 重新验证时会得到 304，一直使用错误结果。
+    返回值是 Response（FAST_JSON、fields= 路径）时直接设置在它上面，否则设置在注入的 response 上由 FastAPI 合并。
+    """
+    if etag is not None:
+        set_etag(result if isinstance(result, Response) else response, etag)
+    return result
+
+
+def not_modified(etag: str) -> Response:
+    """返回 304 响应"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
@@ -0,0 +1,65 @@
+# fieldsets.py
+"""列表接口的稀疏字段集（fields= 查询参数）
+
+例如 GET /musics/?fields=title,artist,cover_url 只查询并返回这几列（id 始终返回）。
+SQL 层通过 load_only 只加载所需列（见 crud._only），序列化层使用只包含这些字段的动态模型，
+所以 MediaUrl 签名等序列化规则与完整响应保持一致。
+"""
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Type
+
+from fastapi import Query
+from pydantic import BaseModel, TypeAdapter, create_model
+from responses import envelope
+
+# fields 查询参数
+FieldsQuery = Query(None, description="逗号分隔的返回字段，例如 title,artist,cover_url（id 始终返回）")
+
+ANY = TypeAdapter(Any)
+
+
+class FieldsError(ValueError):
+    """请求了不支持的字段"""
+
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel], exclude=("musics",)) -> Optional[Tuple[str, ...]]:
+    """解析 fields 参数，未指定时返回None（返回全部字段）"""
+    if not fields:
+        return None
+
+    allowed = [name for name in schema.model_fields if name not in exclude]
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise FieldsError(f"不支持的字段: {','.join(sorted(unknown))}，可选字段: {','.join(allowed)}")
+
+    # 保持 schema 中的字段顺序，id 始终返回
+    names.add("id")
+    return tuple(name for name in allowed if name in names)
+
+
+@lru_cache(maxsize=256)
+def _partial_adapter(schema: Type[BaseModel], fields: Tuple[str, ...]) -> TypeAdapter:
+    """为字段子集创建模型（复用原字段定义，包括序列化器）"""
+    partial = create_model(
+        f"{schema.__name__}Fields",
+        __config__={"from_attributes": True},
+        **{name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in fields}
+    )
+    return TypeAdapter(List[partial])
+
+
+def sparse_response(schema: Type[BaseModel], fields: Tuple[str, ...], data: Any, list_key: Optional[str] = None,
+                    code: int = 200, msg: str = "success", headers: Optional[Mapping[str, str]] = None):
+    """序列化只包含指定字段的列表（list_key 不为空时 data 为带分页信息的字典）
+
+    返回的是 Response，注入的 response 上设置的响应头（例如 ETag）需要通过 headers 传入。
+    """
+    adapter = _partial_adapter(schema, fields)
+    if list_key is None:
+        return envelope(adapter.dump_json(adapter.validate_python(data, from_attributes=True)), code=code, msg=msg,
+                        headers=headers)
+
+    page: Dict[str, Any] = dict(data)
+    page[list_key] = adapter.validate_python(page[list_key], from_attributes=True)
+    return envelope(ANY.dump_json(page), code=code, msg=msg, headers=headers)
@@ -0,0 +1,108 @@
+# jobs.py
+"""后台级联删除任务
+
+删除用户或音乐时，请求内只标记根记录并写入一条 delete_jobs 任务，
+关联数据（用户的音乐和歌单、音乐在各歌单中的关联及歌曲计数）由这里的后台线程分批处理：
+
+- 每批最多处理 DELETE_JOB_BATCH_SIZE 条记录，每批单独提交，不会长时间占用 SQLite 写锁
+- 每批完成后记录进度（processed），进程退出后任务会在租约到期后被重新领取并继续处理
+- 失败时按指数退避重试，超过 DELETE_JOB_MAX_ATTEMPTS 次后标记为 failed
+"""
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+import crud
+from database import SessionLocal
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger("music_server.jobs")
+
+# 后台任务配置
+DELETE_WORKER_ENABLED = os.getenv("DELETE_WORKER_ENABLED", "true").lower() == "true"
+DELETE_JOB_BATCH_SIZE = int(os.getenv("DELETE_JOB_BATCH_SIZE", 500))  # 每批处理的记录数
+DELETE_JOB_POLL_SECONDS = float(os.getenv("DELETE_JOB_POLL_SECONDS", 2))  # 没有任务时的轮询间隔
+DELETE_JOB_MAX_ATTEMPTS = int(os.getenv("DELETE_JOB_MAX_ATTEMPTS", 5))  # 最大失败次数
+DELETE_JOB_RETRY_SECONDS = float(os.getenv("DELETE_JOB_RETRY_SECONDS", 10))  # 第一次重试的延迟
+DELETE_JOB_LEASE_SECONDS = int(os.getenv("DELETE_JOB_LEASE_SECONDS", 300))  # 运行中任务多久未更新视为中断
+
+
+def run_next_job(batch_size: int = DELETE_JOB_BATCH_SIZE) -> Optional[Dict[str, Any]]:
+    """领取并处理完一个任务，没有到期任务时返回 None"""
+    db = SessionLocal()
+    try:
+        job = crud.claim_delete_job(db, lease_seconds=DELETE_JOB_LEASE_SECONDS)
+        if job is None:
+            return None
+
+        job_id = job.id
+        try:
+            while not crud.run_delete_job_batch(db, job, batch_size):
+                pass
+            logger.info("级联删除完成: %s %s，共处理 %d 条记录", job.kind, job.target_id, job.processed)
+        except Exception as e:
+            logger.exception("级联删除失败: job=%s", job_id)
+            crud.fail_delete_job(db, job_id, str(e), max_attempts=DELETE_JOB_MAX_ATTEMPTS,
+                                 retry_seconds=DELETE_JOB_RETRY_SECONDS)
+        return {"id": job_id, "kind": job.kind, "target_id": job.target_id, "status": job.status}
+    finally:
+        db.close()
+
+
+def run_pending_jobs(batch_size: int = DELETE_JOB_BATCH_SIZE) -> int:
+    """处理所有到期任务，返回处理的任务数（供命令行或测试使用）"""
+    count = 0
+    while run_next_job(batch_size) is not None:
+        count += 1
+    return count
+
+
+class DeleteWorker:
+    """在后台线程中轮询并处理级联删除任务"""
+
+    def __init__(self, poll_seconds: float = DELETE_JOB_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="delete-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = run_next_job()
+            except Exception:
+                logger.exception("领取级联删除任务失败")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_seconds)
+
+
+delete_worker = DeleteWorker()
+
+
+def stats() -> Dict[str, Any]:
+    """各状态的任务数量"""
+    db = SessionLocal()
+    try:
+        result: Dict[str, Any] = crud.get_delete_job_stats(db)
+    finally:
+        db.close()
+    result["worker"] = DELETE_WORKER_ENABLED
+    return result
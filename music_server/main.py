@@ -1,28 +1,49 @@
-from urllib.request import Request
-
-import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
 from fastapi.exceptions import RequestValidationError
+from fastapi.encoders import jsonable_encoder
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response, PlainTextResponse
 
 # 导入中间件
 from middleware.auth_middleware import AuthenticationMiddleware, TokenRefreshMiddleware
 from middleware.logging_middleware import RequestLoggingMiddleware
+from middleware.metrics_middleware import MetricsMiddleware
+from middleware.profiling_middleware import ProfilingMiddleware
 
 # 导入数据库初始化函数
 from database import init_db
 
 # 导入路由
-from routes import user, music, playlist
+from routes import user, music, playlist, media
+
+# 导入存储后端
+from storage import get_storage, LocalStorage, UPLOAD_URL_PREFIX
+from media_delivery import needs_media_router
 
 # 导入日志配置
 from config import logging_config
 
+# 导入快速 JSON 响应
+from responses import FAST_JSON, FastJSONResponse
+
+# 导入缓存和请求合并
+import cache
+from singleflight import single_flight
+
+# 导入运行指标、采样分析器和追踪
+import metrics
+import profiler
+import tracing
+from tracing import trace_middleware
+
+# 导入后台级联删除任务和定时备份
+import jobs
+from backup import BACKUP_ENABLED, backup_scheduler
+
 
 
 @asynccontextmanager
@@ -30,18 +51,25 @@ async def lifespan(app: FastAPI):
     # 应用启动时的初始化操作
     logging_config.setup_logging()
     init_db()
-    # 设置安全方案
-    app.openapi_schema = app.openapi()
-    app.openapi_schema["components"] = app.openapi_schema.get("components", {})
-    app.openapi_schema["components"]["securitySchemes"] = {
-        "BearerAuth": {
-            "type": "http",
-            "scheme": "bearer",
-            "bearerFormat": "JWT"
-        }
-    }
+    # 启动后台级联删除线程
+    if jobs.DELETE_WORKER_ENABLED:
+        jobs.delete_worker.start()
+    # 启动定时备份线程
+    if BACKUP_ENABLED:
+        backup_scheduler.start()
+    # 启动持续采样分析
+    if profiler.PROFILER_CONTINUOUS:
+        profiler.continuous_sampler.start()
+    # 启动追踪数据导出线程
+    if tracing.TRACING_ENABLED:
+        tracing.exporter.start()
     yield
-    # 应用关闭时的清理操作（如果需要）
+    # 应用关闭时的清理操作
+    jobs.delete_worker.stop()
+    backup_scheduler.stop()
+    profiler.continuous_sampler.stop()
+    tracing.exporter.stop()
+    logging_config.shutdown_logging()
 
 def create_app():
     # 创建FastAPI应用实例，使用 lifespan 参数
@@ -49,27 +77,40 @@ def create_app():
         title="Music Server API",
         description="音乐服务器API",
         version="1.0.0",
-        lifespan=lifespan
+        lifespan=lifespan,
+        default_response_class=FastJSONResponse if FAST_JSON else JSONResponse
     )
 
     # 注册中间件
-    app.add_middleware(RequestLoggingMiddleware)  # 日志中间件
-    app.add_middleware(AuthenticationMiddleware)  # 认证中间件
-    app.add_middleware(TokenRefreshMiddleware)  # Token刷新中间件
+    # 启用追踪时 trace_middleware 为每个中间件创建 span
+    app.add_middleware(trace_middleware(AuthenticationMiddleware))  # 认证中间件
+    app.add_middleware(trace_middleware(TokenRefreshMiddleware))  # Token刷新中间件
+    app.add_middleware(trace_middleware(ProfilingMiddleware))  # 按需采样分析中间件
+    app.add_middleware(trace_middleware(RequestLoggingMiddleware))  # 日志中间件（在认证中间件外层，请求ID和SQL统计覆盖它们）
 
     app.add_middleware(
-        CORSMiddleware,
+        trace_middleware(CORSMiddleware),
         allow_origins=["*"],
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["Authorization", "Content-Type"],  # 明确指定允许的头部
     )
-
-    # 挂载静态文件目录
-    os.makedirs("uploads/music", exist_ok=True)
-    os.makedirs("uploads/cover", exist_ok=True)
-    os.makedirs("uploads/lyrics", exist_ok=True)
-    app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+    if metrics.METRICS_ENABLED:
+        app.add_middleware(trace_middleware(MetricsMiddleware))  # 指标中间件（统计完整耗时）
+    if tracing.TRACING_ENABLED:
+        app.add_middleware(tracing.TracingMiddleware)  # 追踪中间件（最外层，创建根 span）
+
+    # 挂载静态文件目录（需要签名校验、代理分发或非本地存储时由 media 路由接管）
+    storage = get_storage()
+    is_local = isinstance(storage, LocalStorage)
+    if is_local:
+        os.makedirs(os.path.join(storage.root, "music"), exist_ok=True)
+        os.makedirs(os.path.join(storage.root, "cover"), exist_ok=True)
+        os.makedirs(os.path.join(storage.root, "lyrics"), exist_ok=True)
+    if needs_media_router(is_local):
+        app.include_router(media.router)
+    else:
+        app.mount(UPLOAD_URL_PREFIX, StaticFiles(directory=storage.root), name="uploads")
 
     # 注册路由
     app.include_router(user.router)
@@ -84,7 +125,26 @@ def create_app():
     # 健康检查端点
     @app.get("/health")
     def health_check():
-        return {"status": "healthy"}
+        return {"status": "healthy", "cache": cache.stats(), "coalesce": single_flight.get_stats(),
+                "delete_jobs": jobs.stats(), "logging": logging_config.stats(),
+                "tracing": tracing.exporter.stats()}
+
+    # Prometheus 指标端点
+    if metrics.METRICS_ENABLED:
+        @app.get("/metrics", include_in_schema=False)
+        def metrics_endpoint():
+            return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+    # 持续采样分析的热点调用栈（折叠栈格式）
+    @app.get("/debug/profile", include_in_schema=False)
+    def continuous_profile(request: Request, reset: bool = False):
+        if not profiler.check_token(request.headers.get("X-Profile-Token")):
+            raise StarletteHTTPException(status_code=403, detail="无效的分析令牌")
+        sampler = profiler.continuous_sampler
+        content, samples = sampler.folded(), sampler.samples
+        if reset:
+            sampler.reset()
+        return PlainTextResponse(content, headers={"X-Profile-Samples": str(samples)})
 
     @app.exception_handler(Exception)
     async def global_exception_handler(request: Request, exc: Exception):
@@ -118,10 +178,29 @@ def create_app():
             content={
                 "code": 422,
                 "msg": "请求参数验证失败",
-                "data": exc.errors()
+                "data": jsonable_encoder(exc.errors())
             }
         )
 
+    # OpenAPI 文档在第一次请求 /openapi.json（或 /docs）时才生成，不占用启动时间
+    default_openapi = app.openapi
+
+    def openapi_with_security():
+        if app.openapi_schema is None:
+            # 设置安全方案
+            openapi_schema = default_openapi()
+            openapi_schema["components"] = openapi_schema.get("components", {})
+            openapi_schema["components"]["securitySchemes"] = {
+                "BearerAuth": {
+                    "type": "http",
+                    "scheme": "bearer",
+                    "bearerFormat": "JWT"
+                }
+            }
+        return app.openapi_schema
+
+    app.openapi = openapi_with_security
+
     return app
 
 
@@ -129,6 +208,9 @@ def create_app():
 app = create_app()
 
 if __name__ == "__main__":
+    # 只在直接运行时导入 uvicorn，以 uvicorn main:app 或其他方式加载应用时不需要
+    import uvicorn
+
     uvicorn.run(
         "main:app",
         host="192.168.31.137",
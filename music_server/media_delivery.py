@@ -0,0 +1,95 @@
+# media_delivery.py
+"""媒体文件分发
+
+MEDIA_DELIVERY 控制 /uploads 下文件的分发方式：
+
+- static:     由 Python 进程直接返回文件（默认，与之前的 StaticFiles 行为一致）
+- x-accel:    应用只做鉴权，返回 X-Accel-Redirect 头，由 Nginx 从内部 location 读取文件
+- x-sendfile: 同上，返回 X-Sendfile 头（Apache mod_xsendfile / Lighttpd）
+
+开启 MEDIA_SIGNED_URLS 后，接口返回的文件地址会带上 md5 和 expires 参数，
+签名格式与 Nginx secure_link 模块一致，前端代理可以直接校验而不需要回调应用：
+
+    location /uploads/ {
+        secure_link $arg_md5,$arg_expires;
+        secure_link_md5 "$secure_link_expires$uri <media_secret()>";
+        if ($secure_link = "")  { return 403; }
+        if ($secure_link = "0") { return 410; }
+        alias /path/to/uploads/;
+    }
+
+    location /protected_uploads/ {
+        internal;
+        alias /path/to/uploads/;
+    }
+"""
+import base64
+import hashlib
+import hmac
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from auth import SECRET_KEY
+
+# 加载环境变量
+load_dotenv()
+
+# 媒体分发配置
+MEDIA_DELIVERY = os.getenv("MEDIA_DELIVERY", "static")  # static / x-accel / x-sendfile
+MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/protected_uploads")  # Nginx internal location
+MEDIA_SIGNED_URLS = os.getenv("MEDIA_SIGNED_URLS", "false").lower() == "true"
+MEDIA_URL_EXPIRE_SECONDS = int(os.getenv("MEDIA_URL_EXPIRE_SECONDS", 6 * 60 * 60))  # 签名地址有效期
+MEDIA_URL_EXPIRE_BUCKET = int(os.getenv("MEDIA_URL_EXPIRE_BUCKET", 10 * 60))  # 过期时间取整粒度
+
+MEDIA_DELIVERY_MODES = ("static", "x-accel", "x-sendfile")
+UPLOAD_URL_PREFIX = "/uploads"
+
+
+def media_secret() -> str:
+    """由 SECRET_KEY 派生的媒体签名密钥（配置到代理中，避免暴露 JWT 密钥）"""
+    return hmac.new(SECRET_KEY.encode(), b"media-url-signing", hashlib.sha256).hexdigest()
+
+
+def _signature(path: str, expires: int) -> str:
+    """计算 Nginx secure_link_md5 "$secure_link_expires$uri secret" 格式的签名"""
+    digest = hashlib.md5(f"{expires}{path} {media_secret()}".encode()).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def _expires_at(expires_in: int) -> int:
+    # 过期时间向上取整，同一时间段内生成的地址保持不变，便于客户端和 CDN 缓存
+    expires = int(time.time()) + expires_in
+    if MEDIA_URL_EXPIRE_BUCKET > 0:
+        expires = -(-expires // MEDIA_URL_EXPIRE_BUCKET) * MEDIA_URL_EXPIRE_BUCKET
+    return expires
+
+
+def sign_media_url(url: Optional[str], expires_in: int = MEDIA_URL_EXPIRE_SECONDS) -> Optional[str]:
+    """为 /uploads 下的文件地址添加过期签名，未开启签名时原样返回"""
+    if not MEDIA_SIGNED_URLS or not url or not url.startswith(f"{UPLOAD_URL_PREFIX}/") or "?" in url:
+        return url
+
+    expires = _expires_at(expires_in)
+    return f"{url}?md5={_signature(url, expires)}&expires={expires}"
+
+
+def signature_epoch() -> int:
+    """当前签名地址使用的过期时间（未开启签名时为0），用于计算 ETag"""
+    return _expires_at(MEDIA_URL_EXPIRE_SECONDS) if MEDIA_SIGNED_URLS else 0
+
+
+def verify_media_signature(path: str, md5: Optional[str], expires: Optional[str]) -> bool:
+    """校验文件地址签名是否有效且未过期"""
+    if not md5 or not expires or not expires.isdigit():
+        return False
+    if int(expires) < time.time():
+        return False
+    return hmac.compare_digest(_signature(path, int(expires)), md5)
+
+
+def needs_media_router(storage_is_local: bool) -> bool:
+    """是否需要由应用接管 /uploads（否则直接挂载 StaticFiles）"""
+    return not storage_is_local or MEDIA_SIGNED_URLS or MEDIA_DELIVERY != "static"
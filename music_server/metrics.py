@@ -0,0 +1,287 @@
+# metrics.py
+"""Prometheus 文本格式的运行指标
+
+每个指标按线程分片保存：线程第一次写入时登记自己的字典，之后只有该线程修改它，
+记录指标时不需要加锁；/metrics 被抓取时再把所有线程的分片累加起来。
+
+- http_requests_total / http_request_duration_seconds：按路由模板（如 /playlists/{playlist_id}）和状态码统计
+- db_queries_total / db_query_duration_seconds：按语句类型统计
+- db_pool_checkout_wait_seconds：从连接池获取连接的等待时间
+- cache_*：缓存命中统计（抓取时读取 cache.stats()）
+- upload_bytes_total：上传文件的字节数
+- log_records_total：日志队列接收、丢弃和采样掉的记录数
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+import cache
+from config import logging_config
+
+# 加载环境变量
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """按线程分片保存数值的指标基类"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _values(self) -> dict:
+        values = getattr(self._local, "values", None)
+        if values is None:
+            values = {}
+            self._local.values = values
+            with self._lock:
+                self._shards.append(values)
+        return values
+
+    def _snapshots(self) -> List[dict]:
+        with self._lock:
+            shards = list(self._shards)
+        return [dict(shard) for shard in shards]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        values = self._values()
+        values[labelvalues] = values.get(labelvalues, 0) + amount
+
+    def collect(self) -> Dict[tuple, float]:
+        totals: Dict[tuple, float] = {}
+        for snapshot in self._snapshots():
+            for labelvalues, value in snapshot.items():
+                totals[labelvalues] = totals.get(labelvalues, 0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labelvalues, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, amount: float, *labelvalues):
+        values = self._values()
+        state = values.get(labelvalues)
+        if state is None:
+            # 各桶计数（最后一个为 +Inf）、总和、次数
+            state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            values[labelvalues] = state
+        state[0][bisect.bisect_left(self.buckets, amount)] += 1
+        state[1] += amount
+        state[2] += 1
+
+    def collect(self) -> Dict[tuple, list]:
+        totals: Dict[tuple, list] = {}
+        for snapshot in self._snapshots():
+            for labelvalues, (counts, total, count) in snapshot.items():
+                merged = totals.setdefault(labelvalues, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return totals
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        bucket_names = self.labelnames + ("le",)
+        for labelvalues, (counts, total, count) in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(bucket_names, labelvalues + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class GaugeCallback:
+    """抓取时才计算数值的指标"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Iterable[Tuple[tuple, float]]], metric_type: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.type = metric_type
+        registry.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labelvalues, value in self.callback():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+registry: list = []
+
+
+def render() -> str:
+    """生成 Prometheus 文本格式的全部指标"""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ==================== HTTP 请求 ====================
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route template and status",
+                        ("method", "route", "status"))
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency by route template",
+                                  ("method", "route"), REQUEST_BUCKETS)
+
+
+def observe_request(method: str, route: str, status: int, duration: float):
+    HTTP_REQUESTS.inc(method, route, status)
+    HTTP_REQUEST_DURATION.observe(duration, method, route)
+
+
+# ==================== 数据库 ====================
+
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed", ("database", "statement"))
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "SQL statement execution time",
+                              ("database", "statement"), DB_BUCKETS)
+DB_POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection",
+                         ("database",), DB_BUCKETS)
+
+_instrumented_pools: List[tuple] = []
+
+
+def _statement_type(statement: str) -> str:
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def database_label(engine) -> str:
+    return os.path.basename(engine.url.database or "") or engine.url.get_backend_name()
+
+
+def observe_query(database: str, statement: str, duration: float):
+    """记录一条语句（由 database.py 的语句钩子调用）"""
+    if not METRICS_ENABLED:
+        return
+    statement_type = _statement_type(statement)
+    DB_QUERIES.inc(database, statement_type)
+    DB_QUERY_DURATION.observe(duration, database, statement_type)
+
+
+def instrument_pool(engine):
+    """统计从连接池获取连接的等待时间"""
+    if not METRICS_ENABLED:
+        return
+    database = database_label(engine)
+
+    # 连接池没有“开始等待”事件，包装 _do_get 计时
+    pool = engine.pool
+    do_get = pool._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started, database)
+
+    pool._do_get = timed_do_get
+    _instrumented_pools.append((database, pool))
+
+
+def _pool_checked_out():
+    for database, pool in _instrumented_pools:
+        checkedout = getattr(pool, "checkedout", None)
+        if checkedout is not None:
+            yield (database,), checkedout()
+
+
+GaugeCallback("db_pool_checked_out_connections", "Connections currently checked out of the pool",
+              ("database",), _pool_checked_out)
+
+
+# ==================== 缓存 ====================
+
+def _cache_results():
+    stats = cache.stats()
+    yield ("hit",), stats["hits"]
+    yield ("miss",), stats["misses"]
+    yield ("error",), stats["errors"]
+
+
+GaugeCallback("cache_requests_total", "Cache lookups by result", ("result",), _cache_results, "counter")
+GaugeCallback("cache_hit_ratio", "Cache hit ratio since process start", (),
+              lambda: [((), cache.stats()["hit_ratio"])])
+
+
+# ==================== 上传 ====================
+
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes written to storage by uploads", ("file_type",))
+UPLOADS = Counter("uploads_total", "Uploaded files", ("file_type",))
+
+
+def observe_upload(file_type: str, size: int):
+    UPLOADS.inc(file_type)
+    UPLOAD_BYTES.inc(file_type, amount=size)
+
+
+# ==================== 日志 ====================
+
+def _log_records():
+    stats = logging_config.stats()
+    if stats["enabled"]:
+        for result in ("queued", "dropped", "sampled_out"):
+            yield (result,), stats[result]
+
+
+GaugeCallback("log_records_total", "Log records by outcome", ("result",), _log_records, "counter")
@@ -1,9 +1,21 @@
 import logging
+import re
 import time
+import uuid
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
 
+import query_stats
+from config.logging_config import request_id_var
+
 logger = logging.getLogger("music_server.request")
+# 请求开始日志单独使用子记录器，可以通过 LOG_SAMPLE_RATES=music_server.request.start=0.1 只采样这一条
+start_logger = logging.getLogger("music_server.request.start")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+DB_QUERIES_HEADER = "X-DB-Queries"
+# 只接受客户端传入的合法请求ID，避免把任意内容写进日志
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
 
 
 class RequestLoggingMiddleware(BaseHTTPMiddleware):
@@ -11,36 +23,62 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
 
     async def dispatch(self, request: Request, call_next):
         # 记录请求开始时间
-        start_time = time.time()
+        start_time = time.perf_counter()
 
-        # 记录请求信息
-        logger.info(f"Request: {request.method} {request.url} - Client: {request.client.host}")
+        # 沿用客户端或网关传入的请求ID，否则生成一个新的
+        request_id = request.headers.get(REQUEST_ID_HEADER)
+        if not request_id or not _REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        # 统计本请求执行的 SQL 语句
+        queries, queries_token = query_stats.start()
+
+        # 记录请求信息（使用 % 参数，被过滤或采样掉的记录不会格式化）
+        client = request.client.host if request.client else None
+        start_logger.info("Request: %s %s - Client: %s", request.method, request.url.path, client,
+                          extra={"method": request.method, "path": request.url.path, "client": client})
 
         try:
             # 处理请求
             response = await call_next(request)
 
             # 计算处理时间
-            process_time = time.time() - start_time
+            process_time = time.perf_counter() - start_time
+            response.headers[REQUEST_ID_HEADER] = request_id
+            if query_stats.DB_QUERY_HEADER:
+                response.headers[DB_QUERIES_HEADER] = str(queries.count)
 
             # 记录响应信息
             logger.info(
-                f"Response: {response.status_code} - "
-                f"Process time: {process_time:.4f}s - "
-                f"Method: {request.method} - "
-                f"Path: {request.url.path}"
+                "Response: %s - Process time: %.4fs - DB queries: %d (%.1fms) - Method: %s - Path: %s",
+                response.status_code, process_time, queries.count, queries.duration * 1000,
+                request.method, request.url.path,
+                extra={"method": request.method, "path": request.url.path, "status": response.status_code,
+                       "duration_ms": round(process_time * 1000, 2), "client": client,
+                       "db_queries": queries.count, "db_time_ms": round(queries.duration * 1000, 2)}
             )
 
+            # 同一请求中重复执行的相同语句（可能是 N+1 查询）
+            for statement, count in queries.repeated():
+                logger.warning(
+                    "Repeated query: %d times in %s %s - %s", count, request.method, request.url.path, statement,
+                    extra={"method": request.method, "path": request.url.path, "repeat_count": count,
+                           "statement": statement}
+                )
+
             return response
 
         except Exception as e:
             # 记录异常信息
-            process_time = time.time() - start_time
+            process_time = time.perf_counter() - start_time
             logger.error(
-                f"Error processing request: {str(e)} - "
-                f"Process time: {process_time:.4f}s - "
-                f"Method: {request.method} - "
-                f"Path: {request.url.path}",
+                "Error processing request: %s - Process time: %.4fs - Method: %s - Path: %s",
+                e, process_time, request.method, request.url.path,
+                extra={"method": request.method, "path": request.url.path,
+                       "duration_ms": round(process_time * 1000, 2), "client": client},
                 exc_info=True
             )
             raise
+        finally:
+            query_stats.finish(queries_token)
+            request_id_var.reset(token)
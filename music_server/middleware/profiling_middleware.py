@@ -0,0 +1,75 @@
+import logging
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import profiler
+from config.logging_config import request_id_var
+
+logger = logging.getLogger("music_server.profiler")
+
+PROFILE_MODES = ("store", "return")
+
+
+class ProfilingMiddleware:
+    """按需对单个请求进行采样分析（需要 X-Profile-Token）"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not profiler.is_enabled():
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        mode = headers.get("x-profile") or QueryParams(scope.get("query_string", b"")).get("_profile")
+        if mode not in PROFILE_MODES:
+            await self.app(scope, receive, send)
+            return
+        if not profiler.check_token(headers.get("x-profile-token")):
+            logger.warning("Profile requested with invalid token: %s %s", scope["method"], scope["path"])
+            await self.app(scope, receive, send)
+            return
+
+        label = f"{scope['method']}-{scope['path'].strip('/') or 'root'}-{request_id_var.get() or ''}"
+        filename = profiler.profile_filename(label)
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if mode == "store":
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-profile-file", filename.encode())]
+            if mode == "store":
+                await send(message)
+
+        sampler = profiler.StackSampler(profiler.PROFILER_INTERVAL, name="request-profiler")
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            folded = sampler.folded()
+            logger.info("Profiled %s %s: %d samples", scope["method"], scope["path"], sampler.samples)
+
+        if mode == "store":
+            await run_in_threadpool(profiler.save_profile, filename, folded)
+            return
+
+        # return 模式：丢弃原响应，返回折叠栈文本
+        body = folded.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-profile-samples", str(sampler.samples).encode()),
+                (b"x-profile-status", str(status_code).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
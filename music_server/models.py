@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, Index
 from database import Base
 from datetime import datetime
 
@@ -14,10 +14,15 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = Column(Boolean, default=False)  # 逻辑删除标记
+    deleted_at = Column(DateTime, nullable=True)  # 压缩任务首次发现该记录已删除的时间（用于计算保留期）
 
 
 class Music(Base):
     __tablename__ = "musics"
+    __table_args__ = (
+        # 按上传者查询音乐列表、级联删除用户的音乐
+        Index("ix_musics_uploader_id", "uploader_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
@@ -28,10 +33,15 @@ class Music(Base):
     uploader_id = Column(Integer)  # 上传者ID
     created_at = Column(DateTime, default=datetime.utcnow)
     is_deleted = Column(Boolean, default=False)  # 逻辑删除标记
+    deleted_at = Column(DateTime, nullable=True)  # 压缩任务首次发现该记录已删除的时间（用于计算保留期）
 
 
 class Playlist(Base):
     __tablename__ = "playlists"
+    __table_args__ = (
+        # 按创建者查询歌单列表和版本信息、级联删除用户的歌单
+        Index("ix_playlists_creator_id", "creator_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
@@ -41,13 +51,41 @@ class Playlist(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = Column(Boolean, default=False)  # 逻辑删除标记
+    deleted_at = Column(DateTime, nullable=True)  # 压缩任务首次发现该记录已删除的时间（用于计算保留期）
     music_count = Column(Integer, default=0)  # 歌曲数量统计
 
 class PlaylistMusic(Base):
     __tablename__ = "playlist_musics"
+    __table_args__ = (
+        # 歌单歌曲按位置分页、查找相邻歌曲都走这个索引
+        Index("ix_playlist_musics_playlist_position", "playlist_id", "position"),
+        # 按歌曲查找关联（删除音乐的级联任务、压缩任务）
+        Index("ix_playlist_musics_music_id", "music_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     playlist_id = Column(Integer)
     music_id = Column(Integer)
+    position = Column(Float)  # 歌曲在歌单中的排序位置（分数排序，移动时取相邻两首的中间值）
     added_at = Column(DateTime, default=datetime.utcnow)
     is_deleted = Column(Boolean, default=False)  # 逻辑删除标记
+    deleted_at = Column(DateTime, nullable=True)  # 压缩任务首次发现该记录已删除的时间（用于计算保留期）
+
+
+class DeleteJob(Base):
+    """后台级联删除任务（删除用户或音乐后，由后台线程分批处理关联数据）"""
+    __tablename__ = "delete_jobs"
+    __table_args__ = (
+        Index("ix_delete_jobs_status_run_at", "status", "run_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String)  # user / music
+    target_id = Column(Integer)
+    status = Column(String, default="pending")  # pending / running / done / failed
+    processed = Column(Integer, default=0)  # 已处理的关联记录数
+    attempts = Column(Integer, default=0)  # 失败次数
+    last_error = Column(String, nullable=True)
+    run_at = Column(DateTime, default=datetime.utcnow)  # 下次可执行时间（失败后延迟重试）
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,146 @@
+# profiler.py
+"""采样分析器
+
+定时读取所有线程的调用栈（sys._current_frames()），按折叠栈格式（frame;frame;frame 次数）聚合，
+输出可直接交给 flamegraph.pl、speedscope 等工具生成火焰图。
+
+- 单个请求：请求头带上 X-Profile-Token（与 PROFILER_TOKEN 一致）和 X-Profile: store / return
+  （或查询参数 _profile=store / return），由 ProfilingMiddleware 在请求期间以 PROFILER_INTERVAL 采样；
+  store 把结果写入 PROFILER_DIR 并在 X-Profile-File 响应头返回文件名，return 直接返回折叠栈文本
+- 持续采样：PROFILER_CONTINUOUS=true 时后台线程以较低频率（PROFILER_CONTINUOUS_INTERVAL）持续采样，
+  通过 GET /debug/profile 获取热点调用栈
+
+采样的是整个进程，并发的其他请求也会出现在单个请求的结果中；空闲等待中的线程会被忽略。
+"""
+import hmac
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")  # 为空时关闭按需分析和 /debug/profile
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", 0.001))  # 单个请求的采样间隔（秒）
+PROFILER_DIR = os.getenv("PROFILER_DIR", "profiles")
+PROFILER_CONTINUOUS = os.getenv("PROFILER_CONTINUOUS", "false").lower() == "true"
+PROFILER_CONTINUOUS_INTERVAL = float(os.getenv("PROFILER_CONTINUOUS_INTERVAL", 0.05))  # 持续采样间隔（秒）
+PROFILER_MAX_STACKS = int(os.getenv("PROFILER_MAX_STACKS", 10000))  # 最多保留的不同调用栈数
+MAX_STACK_DEPTH = 128
+
+# 线程阻塞等待时栈顶所在的函数，这些样本不计入结果
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+TRUNCATED_STACK = "[other stacks]"
+
+
+def is_enabled() -> bool:
+    return bool(PROFILER_TOKEN)
+
+
+def check_token(token: Optional[str]) -> bool:
+    """校验分析令牌"""
+    return bool(PROFILER_TOKEN) and token is not None and hmac.compare_digest(token, PROFILER_TOKEN)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def fold_stack(frame) -> Optional[str]:
+    """把调用栈转换为从外到内、以分号分隔的一行，线程空闲时返回 None"""
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+        return None
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+class StackSampler:
+    """在后台线程中定时采样所有线程的调用栈"""
+
+    def __init__(self, interval: float, max_stacks: int = PROFILER_MAX_STACKS, name: str = "stack-sampler"):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.name = name
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self._stacks: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(exclude=own_id)
+
+    def sample(self, exclude: Optional[int] = None):
+        """采样一次所有非空闲线程"""
+        frames = sys._current_frames()
+        with self._lock:
+            self.samples += 1
+            for thread_id, frame in frames.items():
+                if thread_id == exclude:
+                    continue
+                stack = fold_stack(frame)
+                if stack is None:
+                    continue
+                if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    stack = TRUNCATED_STACK
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+
+    def folded(self) -> str:
+        """折叠栈文本，按样本数从多到少排列"""
+        with self._lock:
+            stacks = sorted(self._stacks.items(), key=lambda item: item[1], reverse=True)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.started_at = time.time()
+
+
+def profile_filename(label: str) -> str:
+    """生成分析结果的文件名"""
+    safe_label = "".join(char if char.isalnum() or char in "-_." else "_" for char in label)[:100]
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}.folded"
+
+
+def save_profile(filename: str, folded: str):
+    """把折叠栈写入 PROFILER_DIR"""
+    os.makedirs(PROFILER_DIR, exist_ok=True)
+    with open(os.path.join(PROFILER_DIR, filename), "w", encoding="utf-8") as f:
+        f.write(folded)
+
+
+continuous_sampler = StackSampler(PROFILER_CONTINUOUS_INTERVAL, name="continuous-profiler")
@@ -0,0 +1,86 @@
+# query_stats.py
+"""按请求统计 SQL 语句
+
+RequestLoggingMiddleware 在每个请求开始时调用 start()，之后该请求（包括线程池中执行的同步路由）
+执行的每条语句都会计入当前请求的 RequestQueries：
+
+- 请求结束时把语句数和耗时写入请求日志，并通过 X-DB-Queries 响应头返回（DB_QUERY_HEADER=false 关闭）
+- 同一请求中相同 SQL（参数不同）执行次数达到 DB_REPEATED_QUERY_THRESHOLD 时记录警告，通常是 N+1 查询
+- 单条语句超过 DB_SLOW_QUERY_MS 时记录慢查询日志（包含绑定参数），请求外（后台任务）的语句同样记录
+"""
+import contextvars
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger("music_server.sql")
+
+DB_QUERY_HEADER = os.getenv("DB_QUERY_HEADER", "true").lower() == "true"  # 是否返回 X-DB-Queries 响应头
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 100))  # 慢查询阈值（毫秒）
+DB_REPEATED_QUERY_THRESHOLD = int(os.getenv("DB_REPEATED_QUERY_THRESHOLD", 5))  # 相同语句重复多少次视为 N+1
+MAX_LOGGED_PARAMS_LENGTH = 1000  # 日志中绑定参数的最大长度
+
+
+class RequestQueries:
+    """一个请求执行的语句"""
+
+    __slots__ = ("count", "duration", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Dict[str, int] = {}
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+
+    def repeated(self, threshold: int = DB_REPEATED_QUERY_THRESHOLD) -> List[Tuple[str, int]]:
+        """重复执行次数达到阈值的语句"""
+        if threshold <= 0:
+            return []
+        return sorted(((statement, count) for statement, count in self.statements.items() if count >= threshold),
+                      key=lambda item: item[1], reverse=True)
+
+
+_current: contextvars.ContextVar[Optional[RequestQueries]] = contextvars.ContextVar("request_queries", default=None)
+
+
+def start() -> Tuple[RequestQueries, contextvars.Token]:
+    """开始统计当前请求的语句"""
+    queries = RequestQueries()
+    return queries, _current.set(queries)
+
+
+def finish(token: contextvars.Token):
+    _current.reset(token)
+
+
+def current() -> Optional[RequestQueries]:
+    return _current.get()
+
+
+def _format_params(parameters) -> str:
+    text = repr(parameters)
+    if len(text) > MAX_LOGGED_PARAMS_LENGTH:
+        text = text[:MAX_LOGGED_PARAMS_LENGTH] + "..."
+    return text
+
+
+def record_query(statement: str, parameters, duration: float):
+    """计入当前请求并检查慢查询（由 database.py 的语句钩子调用）"""
+    queries = _current.get()
+    if queries is not None:
+        queries.record(statement, duration)
+    if duration * 1000 >= DB_SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query: %.1fms - %s - params: %s", duration * 1000, statement, _format_params(parameters),
+            extra={"duration_ms": round(duration * 1000, 2), "statement": statement,
+                   "params": _format_params(parameters)}
+        )
@@ -0,0 +1,88 @@
+# responses.py
+"""快速 JSON 响应
+
+默认路径下，路由把 ORM 对象包装成 ResponseModel[...]（校验一次），FastAPI 再按 response_model
+校验并序列化一次，最后由标准库 json 编码。开启 FAST_JSON 后，列表接口改为：
+
+1. 使用预先构建的 TypeAdapter 把 ORM 对象校验为 schemas 模型（只校验一次）
+2. 由 pydantic-core 直接序列化为 JSON 字节（MediaUrl 等序列化器照常生效）
+3. 拼接统一的 {"code", "msg", "data"} 外层结构，直接返回 Response，跳过 response_model 的重复校验
+
+直接返回 Response 时 FastAPI 不会合并路由参数中注入的 response 上设置的响应头（例如 ETag），
+需要通过 headers 参数传入（通常是 response.headers）。
+
+外层拼接和非模型数据使用 orjson 编码（requirements.txt 中已包含）；未安装 orjson 时退回标准库 json，
+仍然可用但没有加速效果。响应内容与默认路径一致，可以用 benchmarks/bench_serialization.py 对比两种路径的耗时。
+"""
+import json
+import os
+from typing import Any, List, Mapping, Optional
+
+from dotenv import load_dotenv
+from pydantic import TypeAdapter
+from starlette.responses import JSONResponse, Response
+
+from schemas import (
+    Music, Playlist, User, MusicSearchResult, PlaylistPaginationResult, PlaylistMusicPaginationResult, ResponseModel,
+    MusicBatchResult
+)
+
+try:
+    import orjson
+except ImportError:  # requirements.txt 已包含 orjson，未安装时退回标准库（编码较慢）
+    orjson = None
+
+# 加载环境变量
+load_dotenv()
+
+# 是否启用快速序列化路径
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() == "true"
+
+# 预先构建的 TypeAdapter（构建开销较大，只在导入时创建一次）
+MUSIC_LIST = TypeAdapter(List[Music])
+PLAYLIST_LIST = TypeAdapter(List[Playlist])
+USER_LIST = TypeAdapter(List[User])
+MUSIC_SEARCH_RESULT = TypeAdapter(MusicSearchResult)
+MUSIC_BATCH_RESULT = TypeAdapter(MusicBatchResult)
+PLAYLIST_PAGINATION_RESULT = TypeAdapter(PlaylistPaginationResult)
+PLAYLIST_MUSIC_PAGINATION_RESULT = TypeAdapter(PlaylistMusicPaginationResult)
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 orjson 编码的 JSON 响应，未安装 orjson 时退回标准库"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def envelope(data_json: bytes, code: int = 200, msg: str = "success",
+             headers: Optional[Mapping[str, str]] = None) -> Response:
+    """把已经序列化好的 data 拼接成统一响应结构，headers 为需要带上的响应头"""
+    body = b'{"code":%d,"msg":%s,"data":%s}' % (code, _dumps(msg), data_json)
+    response = Response(content=body, media_type="application/json")
+    if headers:
+        for name, value in headers.items():
+            if name.lower() not in ("content-length", "content-type"):
+                response.headers[name] = value
+    return response
+
+
+def respond(adapter: TypeAdapter, data: Any, code: int = 200, msg: str = "success",
+            headers: Optional[Mapping[str, str]] = None):
+    """返回列表接口的成功响应，开启 FAST_JSON 时走快速序列化路径
+
+    headers 只用于快速路径；默认路径返回 ResponseModel，由 FastAPI 合并注入的 response 上的响应头。
+    """
+    if not FAST_JSON:
+        return ResponseModel(code=code, msg=msg, data=data)
+
+    validated = adapter.validate_python(data, from_attributes=True)
+    return envelope(adapter.dump_json(validated), code=code, msg=msg, headers=headers)
@@ -0,0 +1,40 @@
+# routes/media.py
+from fastapi import APIRouter, Request
+from starlette.responses import RedirectResponse, FileResponse, Response, JSONResponse
+
+from media_delivery import MEDIA_DELIVERY, MEDIA_ACCEL_PREFIX, MEDIA_SIGNED_URLS, verify_media_signature
+from storage import get_storage, LocalStorage, StorageError, UPLOAD_URL_PREFIX
+
+# 需要应用接管 /uploads 时使用（签名校验、X-Accel-Redirect/X-Sendfile、非本地存储），
+# 否则 main.py 直接挂载 StaticFiles
+router = APIRouter(prefix=UPLOAD_URL_PREFIX, tags=["media"])
+
+
+@router.get("/{key:path}", include_in_schema=False)
+def serve_media(key: str, request: Request):
+    """鉴权后分发媒体文件"""
+    # 校验签名
+    if MEDIA_SIGNED_URLS and not verify_media_signature(
+            request.url.path, request.query_params.get("md5"), request.query_params.get("expires")):
+        return JSONResponse(status_code=403, content={"code": 403, "msg": "文件地址无效或已过期", "data": None})
+
+    storage = get_storage()
+
+    # 非本地存储：重定向到存储后端的预签名地址
+    if not isinstance(storage, LocalStorage):
+        return RedirectResponse(storage.presign(key), status_code=307)
+
+    try:
+        path = storage.path(key)
+    except StorageError:
+        return JSONResponse(status_code=404, content={"code": 404, "msg": "文件不存在", "data": None})
+
+    # 交给前端代理读取文件，Python 进程只返回响应头
+    if MEDIA_DELIVERY == "x-accel":
+        return Response(headers={"X-Accel-Redirect": f"{MEDIA_ACCEL_PREFIX}/{key}"})
+    if MEDIA_DELIVERY == "x-sendfile":
+        return Response(headers={"X-Sendfile": path})
+
+    if not storage.exists(key):
+        return JSONResponse(status_code=404, content={"code": 404, "msg": "文件不存在", "data": None})
+    return FileResponse(path)
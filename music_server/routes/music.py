@@ -1,27 +1,23 @@
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header
-import os
-import uuid
-from database import SessionLocal
+from database import get_db, get_read_db, is_replica
 from crud import (
     get_music, get_musics, create_music, update_music, delete_music,
-    search_musics, get_musics_by_uploader
+    search_musics, get_musics_by_uploader, get_music_cached, get_musics_by_ids_cached
 )
 from models import User
 from middleware.auth_middleware import get_current_user_from_request
-from schemas import MusicCreate, MusicUpdate, Music, SearchRequest, ResponseModel, MusicResponse, MusicSearchResult
+from storage import save_upload
+import tracing
+from singleflight import coalesce
+from responses import respond, MUSIC_LIST, MUSIC_SEARCH_RESULT, MUSIC_BATCH_RESULT
+from fieldsets import FieldsQuery, FieldsError, parse_fields, sparse_response
+from schemas import MusicCreate, MusicUpdate, Music, SearchRequest, ResponseModel, MusicResponse, MusicSearchResult, \
+    MusicBatchRequest, MusicBatchResult
 
 router = APIRouter(prefix="/musics", tags=["musics"])
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 
 # 修改路由装饰器，添加认证依赖
 @router.post("/", response_model=ResponseModel[Music])
@@ -51,20 +47,17 @@ def create_new_music(
             return ResponseModel(code=400, msg="封面图片文件过大或格式不支持", data=None)
 
         # 保存音乐文件
-        music_filename = save_file(music_file, "music")
-        music_url = f"/uploads/music/{music_filename}"
+        music_url = save_upload(music_file, "music")
 
         # 保存封面文件（如果有）
         cover_url = None
         if cover_file and cover_file.size > 0:
-            cover_filename = save_file(cover_file, "cover")
-            cover_url = f"/uploads/cover/{cover_filename}"
+            cover_url = save_upload(cover_file, "cover")
 
         # 保存歌词文件（如果有）
         lyric_url = None
         if lyric_file and lyric_file.size > 0:
-            lyric_filename = save_file(lyric_file, "lyric")
-            lyric_url = f"/uploads/lyric/{lyric_filename}"
+            lyric_url = save_upload(lyric_file, "lyric")
 
         # 创建音乐记录
         music_create = MusicCreate(title=title, artist=artist)
@@ -81,6 +74,7 @@ def create_new_music(
         return ResponseModel(code=500, msg=str(e), data=None)
 
 
+@tracing.traced()
 def validate_music_file(file: UploadFile) -> bool:
     """验证音乐文件"""
     # 支持的音乐格式
@@ -106,6 +100,7 @@ def validate_music_file(file: UploadFile) -> bool:
     return True
 
 
+@tracing.traced()
 def validate_image_file(file: UploadFile) -> bool:
     """验证图片文件"""
     allowed_types = ["image/jpeg", "image/png", "image/gif"]
@@ -120,29 +115,10 @@ def validate_image_file(file: UploadFile) -> bool:
     return True
 
 
-def save_file(file: UploadFile, file_type: str) -> str:
-    """保存文件到服务器"""
-    # 创建目录
-    upload_dir = f"uploads/{file_type}"
-    os.makedirs(upload_dir, exist_ok=True)
-
-    # 生成较短的 UUID 文件名（取前8位）
-    short_uuid = str(uuid.uuid4())[:8]
-    file_extension = file.filename.split(".")[-1] if "." in file.filename else ""
-    filename = f"{short_uuid}.{file_extension}"
-    file_path = os.path.join(upload_dir, filename)
-
-    # 保存文件
-    with open(file_path, "wb") as buffer:
-        content = file.file.read()
-        buffer.write(content)
-
-    return filename
-
 @router.get("/{music_id}", response_model=ResponseModel[Music])
-def read_music(music_id: int, db: Session = Depends(get_db)):
+def read_music(music_id: int, db: Session = Depends(get_read_db)):
     try:
-        db_music = get_music(db, music_id=music_id)
+        db_music = coalesce("music", (music_id, is_replica(db)), lambda: get_music_cached(db, music_id=music_id))
         if db_music is None:
             return ResponseModel(code=404, msg="Music not found", data=None)
         return ResponseModel(code=200, msg="success", data=db_music)
@@ -150,29 +126,56 @@ def read_music(music_id: int, db: Session = Depends(get_db)):
         return ResponseModel(code=500, msg=str(e), data=None)
 
 @router.get("/", response_model=ResponseModel[List[Music]])
-def read_musics(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_musics(skip: int = 0, limit: int = 100, fields: Optional[str] = FieldsQuery,
+                db: Session = Depends(get_read_db)):
     try:
-        musics = get_musics(db, skip=skip, limit=limit)
-        return ResponseModel(code=200, msg="success", data=musics)
+        selected = parse_fields(fields, Music)
+        musics = get_musics(db, skip=skip, limit=limit, fields=selected)
+        if selected:
+            return sparse_response(Music, selected, musics)
+        return respond(MUSIC_LIST, musics)
+    except FieldsError as e:
+        return ResponseModel(code=400, msg=str(e), data=[])
     except Exception as e:
         return ResponseModel(code=500, msg=str(e), data=[])
 
 @router.get("/uploader/{uploader_id}", response_model=ResponseModel[List[Music]])
-def read_musics_by_uploader(uploader_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_musics_by_uploader(uploader_id: int, skip: int = 0, limit: int = 100, fields: Optional[str] = FieldsQuery,
+                            db: Session = Depends(get_read_db)):
     try:
-        musics = get_musics_by_uploader(db, uploader_id=uploader_id, skip=skip, limit=limit)
-        return ResponseModel(code=200, msg="success", data=musics)
+        selected = parse_fields(fields, Music)
+        musics = get_musics_by_uploader(db, uploader_id=uploader_id, skip=skip, limit=limit, fields=selected)
+        if selected:
+            return sparse_response(Music, selected, musics)
+        return respond(MUSIC_LIST, musics)
+    except FieldsError as e:
+        return ResponseModel(code=400, msg=str(e), data=[])
     except Exception as e:
         return ResponseModel(code=500, msg=str(e), data=[])
 
 @router.post("/search", response_model=ResponseModel[MusicSearchResult])
-def search_music(request: SearchRequest, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def search_music(request: SearchRequest, skip: int = 0, limit: int = 100, fields: Optional[str] = FieldsQuery,
+                 db: Session = Depends(get_read_db)):
     try:
-        musics = search_musics(db, keyword=request.keyword, skip=skip, limit=limit)
-        return ResponseModel(code=200, msg="success", data=musics)
+        selected = parse_fields(fields, Music)
+        musics = search_musics(db, keyword=request.keyword, skip=skip, limit=limit, fields=selected)
+        if selected:
+            return sparse_response(Music, selected, musics, list_key="musics")
+        return respond(MUSIC_SEARCH_RESULT, musics)
+    except FieldsError as e:
+        return ResponseModel(code=400, msg=str(e), data=None)
     except Exception as e:
         return ResponseModel(code=500, msg=str(e), data=[])
 
+@router.post("/batch", response_model=ResponseModel[MusicBatchResult])
+def read_musics_batch(request: MusicBatchRequest, db: Session = Depends(get_read_db)):
+    """批量获取音乐（优先读缓存，未命中的部分一次IN查询）"""
+    try:
+        result = get_musics_by_ids_cached(db, music_ids=request.ids)
+        return respond(MUSIC_BATCH_RESULT, result)
+    except Exception as e:
+        return ResponseModel(code=500, msg=str(e), data=None)
+
 @router.put("/{music_id}", response_model=ResponseModel[Music])
 def update_music_info(music_id: int, music_update: MusicUpdate, db: Session = Depends(get_db)):
     try:
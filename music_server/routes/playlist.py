@@ -1,31 +1,30 @@
 # routes/playlist.py
-from fastapi import APIRouter, Depends, HTTPException,Form, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException,Form, File, UploadFile, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
-from database import SessionLocal
+from typing import List, Optional
+from database import get_db, get_read_db, is_replica
 from crud import (
     get_playlist, get_playlists, create_playlist, update_playlist, delete_playlist,
     add_music_to_playlist, remove_music_from_playlist, get_playlist_musics, get_music, get_user,
-    get_playlists_by_creator_with_pagination
+    get_playlists_by_creator_with_pagination, get_playlist_cached, get_playlist_musics_cached, get_playlist_version,
+    add_musics_to_playlist, remove_musics_from_playlist, reorder_playlist_musics, move_playlist_music
 )
+from storage import save_upload
+from singleflight import coalesce
+from etag import make_etag, is_not_modified, not_modified, with_etag
+import cache
+from responses import respond, PLAYLIST_LIST, PLAYLIST_MUSIC_PAGINATION_RESULT
+from fieldsets import FieldsQuery, FieldsError, parse_fields, sparse_response
 from middleware.auth_middleware import get_current_user_from_request
 from models import User, Music, PlaylistMusic
 from schemas import PlaylistCreate, PlaylistUpdate, Playlist, ResponseModel, PlaylistMusicInfo, \
-    PlaylistPaginationResult, PlaylistMusicPaginationResult
-import os
-import uuid
+    PlaylistPaginationResult, PlaylistMusicPaginationResult, PlaylistMusicsBulkRequest, PlaylistMusicsBulkResult, \
+    PlaylistMusicMoveRequest
 
 router = APIRouter(prefix="/playlists", tags=["playlists"])
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
-# 添加文件验证和保存函数（可复用 user.py 中的实现）
+# 添加文件验证函数（可复用 user.py 中的实现）
 def validate_image_file(file: UploadFile) -> bool:
     """验证图片文件"""
     allowed_types = ["image/jpeg", "image/png", "image/gif"]
@@ -39,24 +38,6 @@ def validate_image_file(file: UploadFile) -> bool:
 
     return True
 
-def save_file(file: UploadFile, file_type: str) -> str:
-    """保存文件到服务器"""
-    # 创建目录
-    upload_dir = f"uploads/{file_type}"
-    os.makedirs(upload_dir, exist_ok=True)
-
-    # 生成较短的 UUID 文件名（取前8位）
-    short_uuid = str(uuid.uuid4())[:8]
-    file_extension = file.filename.split(".")[-1] if "." in file.filename else ""
-    filename = f"{short_uuid}.{file_extension}"
-    file_path = os.path.join(upload_dir, filename)
-
-    # 保存文件
-    with open(file_path, "wb") as buffer:
-        content = file.file.read()
-        buffer.write(content)
-
-    return filename
 
 
 @router.post("/", response_model=ResponseModel[Playlist])
@@ -83,8 +64,7 @@ async def create_new_playlist_with_cover(
         if cover_file and cover_file.size > 0:
             if not validate_image_file(cover_file):
                 return ResponseModel(code=400, msg="封面图片文件过大或格式不支持", data=None)
-            cover_filename = save_file(cover_file, "cover")
-            cover_url = f"/uploads/cover/{cover_filename}"
+            cover_url = save_upload(cover_file, "cover")
         else:
             cover_url = f"/uploads/cover/loveSongs.png"
 
@@ -99,9 +79,10 @@ async def create_new_playlist_with_cover(
 
 
 @router.get("/{playlist_id}", response_model=ResponseModel[Playlist])
-def read_playlist(playlist_id: int, db: Session = Depends(get_db)):
+def read_playlist(playlist_id: int, db: Session = Depends(get_read_db)):
     try:
-        db_playlist = get_playlist(db, playlist_id=playlist_id)
+        db_playlist = coalesce("playlist", (playlist_id, is_replica(db)),
+                               lambda: get_playlist_cached(db, playlist_id=playlist_id))
         if db_playlist is None:
             return ResponseModel(code=404, msg="Playlist not found", data=None)
         return ResponseModel(code=200, msg="success", data=db_playlist)
@@ -109,10 +90,16 @@ def read_playlist(playlist_id: int, db: Session = Depends(get_db)):
         return ResponseModel(code=500, msg=str(e), data=None)
 
 @router.get("/", response_model=ResponseModel[List[Playlist]])
-def read_playlists(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_playlists(skip: int = 0, limit: int = 100, fields: Optional[str] = FieldsQuery,
+                   db: Session = Depends(get_read_db)):
     try:
-        playlists = get_playlists(db, skip=skip, limit=limit)
-        return ResponseModel(code=200, msg="success", data=playlists)
+        selected = parse_fields(fields, Playlist)
+        playlists = get_playlists(db, skip=skip, limit=limit, fields=selected)
+        if selected:
+            return sparse_response(Playlist, selected, playlists)
+        return respond(PLAYLIST_LIST, playlists)
+    except FieldsError as e:
+        return ResponseModel(code=400, msg=str(e), data=[])
     except Exception as e:
         return ResponseModel(code=500, msg=str(e), data=[])
 
@@ -145,8 +132,7 @@ async def update_playlist_info_with_cover(
             if not validate_image_file(cover_file):
                 return ResponseModel(code=400, msg="封面图片文件过大或格式不支持", data=None)
 
-            cover_filename = save_file(cover_file, "cover")
-            cover_url = f"/uploads/cover/{cover_filename}"
+            cover_url = save_upload(cover_file, "cover")
             update_data["cover_url"] = cover_url
 
         # 如果没有任何更新内容
@@ -176,6 +162,89 @@ def delete_playlist_info(
     except Exception as e:
         return ResponseModel(code=500, msg=str(e), data=None)
 
+def _bulk_playlist_operation(operation, playlist_id: int, music_ids: List[int], current_user: User, db: Session,
+                             msg: str):
+    """执行歌单批量操作（只有歌单创建者可以操作）"""
+    db_playlist = get_playlist(db, playlist_id=playlist_id)
+    if not db_playlist or db_playlist.creator_id != current_user.id:
+        return ResponseModel(code=403, msg="只能修改自己创建的歌单", data=None)
+
+    result = operation(db, playlist_id=playlist_id, music_ids=music_ids)
+    db.refresh(db_playlist)
+    result["music_count"] = db_playlist.music_count
+    return ResponseModel(code=200, msg=msg, data=result)
+
+
+# 批量路由需要定义在 /{playlist_id}/musics/{music_id} 之前，避免被当作 music_id 匹配
+@router.post("/{playlist_id}/musics/bulk-add", response_model=ResponseModel[PlaylistMusicsBulkResult])
+def bulk_add_musics_to_playlist_route(
+        playlist_id: int,
+        request: PlaylistMusicsBulkRequest,
+        current_user: User = Depends(get_current_user_from_request),
+        db: Session = Depends(get_db)
+):
+    """批量向歌单添加音乐（单个事务）"""
+    try:
+        return _bulk_playlist_operation(add_musics_to_playlist, playlist_id, request.music_ids, current_user, db,
+                                        "Musics added to playlist successfully")
+    except Exception as e:
+        return ResponseModel(code=500, msg=str(e), data=None)
+
+
+@router.post("/{playlist_id}/musics/bulk-remove", response_model=ResponseModel[PlaylistMusicsBulkResult])
+def bulk_remove_musics_from_playlist_route(
+        playlist_id: int,
+        request: PlaylistMusicsBulkRequest,
+        current_user: User = Depends(get_current_user_from_request),
+        db: Session = Depends(get_db)
+):
+    """批量从歌单移除音乐（单个事务）"""
+    try:
+        return _bulk_playlist_operation(remove_musics_from_playlist, playlist_id, request.music_ids, current_user, db,
+                                        "Musics removed from playlist successfully")
+    except Exception as e:
+        return ResponseModel(code=500, msg=str(e), data=None)
+
+
+@router.put("/{playlist_id}/musics/order", response_model=ResponseModel[PlaylistMusicsBulkResult])
+def reorder_playlist_musics_route(
+        playlist_id: int,
+        request: PlaylistMusicsBulkRequest,
+        current_user: User = Depends(get_current_user_from_request),
+        db: Session = Depends(get_db)
+):
+    """按给定顺序重排歌单中的音乐"""
+    try:
+        return _bulk_playlist_operation(reorder_playlist_musics, playlist_id, request.music_ids, current_user, db,
+                                        "Playlist reordered successfully")
+    except Exception as e:
+        return ResponseModel(code=500, msg=str(e), data=None)
+
+
+@router.put("/{playlist_id}/musics/{music_id}/position", response_model=ResponseModel[dict])
+def move_playlist_music_route(
+        playlist_id: int,
+        music_id: int,
+        request: PlaylistMusicMoveRequest,
+        current_user: User = Depends(get_current_user_from_request),
+        db: Session = Depends(get_db)
+):
+    """移动歌单中的一首歌曲（只更新这一首歌曲的位置）"""
+    try:
+        db_playlist = get_playlist(db, playlist_id=playlist_id)
+        if not db_playlist or db_playlist.creator_id != current_user.id:
+            return ResponseModel(code=403, msg="只能修改自己创建的歌单", data=None)
+
+        result = move_playlist_music(db, playlist_id=playlist_id, music_id=music_id,
+                                     after_music_id=request.after_music_id,
+                                     before_music_id=request.before_music_id)
+        if result is None:
+            return ResponseModel(code=404, msg="歌曲不在歌单中", data=None)
+        return ResponseModel(code=200, msg="Music moved successfully", data={"result": True})
+    except Exception as e:
+        return ResponseModel(code=500, msg=str(e), data=None)
+
+
 @router.post("/{playlist_id}/musics/{music_id}", response_model=ResponseModel[dict])
 def add_music_to_playlist_route(playlist_id: int, music_id: int, db: Session = Depends(get_db)):
     try:
@@ -199,53 +268,33 @@ def remove_music_from_playlist_route(playlist_id: int, music_id: int, db: Sessio
 
 
 @router.get("/{playlist_id}/musics", response_model=ResponseModel[PlaylistMusicPaginationResult])
-def get_playlist_musics_route(playlist_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_playlist_musics_route(playlist_id: int, request: Request, response: Response,
+                              skip: int = 0, limit: int = 100, fields: Optional[str] = FieldsQuery,
+                              db: Session = Depends(get_read_db)):
     try:
-        # 计算总记录数
-        total_count = db.query(PlaylistMusic).join(
-            Music, PlaylistMusic.music_id == Music.id
-        ).filter(
-            PlaylistMusic.playlist_id == playlist_id,
-            PlaylistMusic.is_deleted == False,
-            Music.is_deleted == False
-        ).count()
-
-        # 计算总页数
-        total_pages = (total_count + limit - 1) // limit if limit > 0 else 0
-
-        # 获取当前页数据
-        query_result = db.query(PlaylistMusic, Music).join(
-            Music, PlaylistMusic.music_id == Music.id
-        ).filter(
-            PlaylistMusic.playlist_id == playlist_id,
-            PlaylistMusic.is_deleted == False,
-            Music.is_deleted == False
-        ).order_by(Music.id).offset(skip).limit(limit).all()
-
-        # 构造音乐信息列表
-        musics = []
-        for pm, music in query_result:
-            music_info = PlaylistMusicInfo(
-                id=music.id,
-                title=music.title,
-                artist=music.artist,
-                music_url=music.music_url,
-                cover_url=music.cover_url,
-                lyric_url=music.lyric_url,
-                created_at=music.created_at,
-            )
-            musics.append(music_info)
-
-        # 构造分页结果
-        result = PlaylistMusicPaginationResult(
-            musics=musics,
-            total_count=total_count,
-            total_pages=total_pages,
-            current_page=skip // limit + 1 if limit > 0 else 1,
-            page_size=limit
+        selected = parse_fields(fields, PlaylistMusicInfo)
+
+        # 根据歌单版本和音乐版本计算 ETag，未变化时直接返回 304
+        etag = None
+        version = get_playlist_version(db, playlist_id=playlist_id)
+        if version is not None:
+            etag = make_etag("playlist_musics", playlist_id, *version, cache.version(f"playlist:{playlist_id}"),
+                             cache.version("musics"), skip, limit, selected)
+            if is_not_modified(request, etag):
+                return not_modified(etag)
+
+        # 热门歌单被大量客户端同时请求时，只执行一次查询
+        result = coalesce(
+            "playlist_musics", (playlist_id, skip, limit, selected, is_replica(db)),
+            lambda: get_playlist_musics_cached(db, playlist_id=playlist_id, skip=skip, limit=limit, fields=selected)
         )
-
-        return ResponseModel(code=200, msg="success", data=result)
+        if selected:
+            body = sparse_response(PlaylistMusicInfo, selected, result, list_key="musics", headers=response.headers)
+        else:
+            body = respond(PLAYLIST_MUSIC_PAGINATION_RESULT, result, headers=response.headers)
+        return with_etag(body, response, etag)
+    except FieldsError as e:
+        return ResponseModel(code=400, msg=str(e), data=None)
     except Exception as e:
         return ResponseModel(code=500, msg=str(e), data=None)
 
@@ -1,17 +1,20 @@
 # routes/user.py
-import os
 import re
-import uuid
 
-from fastapi import APIRouter, Depends, UploadFile, File, Form
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
-from database import SessionLocal
+from typing import List, Optional
+from database import get_db, get_read_db
 from crud import get_user, get_users, create_user, update_user, delete_user, get_user_by_email, \
-    get_playlists_by_creator, get_playlists_by_creator_with_pagination
+    get_playlists_by_creator, get_playlists_by_creator_with_pagination, get_playlists_version
 from schemas import UserCreate, UserUpdate, User, ResponseModel, LoginRequest, LoginResponse, \
     UserWithPlaylists, LoginRequestModel, PlaylistPaginationResult
 from auth import send_verification_code, verify_code, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, is_code_expired
+from storage import save_upload
+from etag import make_etag, is_not_modified, not_modified, with_etag
+from responses import respond, USER_LIST, PLAYLIST_PAGINATION_RESULT
+from fieldsets import FieldsQuery, FieldsError, parse_fields, sparse_response
+from schemas import Playlist
 from middleware.auth_middleware import get_current_user_from_request
 from models import User as UserModel
 from datetime import timedelta
@@ -20,15 +23,6 @@ from datetime import timedelta
 router = APIRouter(prefix="/users", tags=["users"])
 
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.post("/send-code", response_model=ResponseModel[bool])
 def send_code(request: LoginRequest):
     """发送验证码"""
@@ -100,9 +94,16 @@ def login(req:LoginRequestModel, db: Session = Depends(get_db)):
 # 使用中间件认证，移除手动token验证
 @router.get("/me", response_model=ResponseModel[UserWithPlaylists],
             dependencies=[Depends(get_current_user_from_request)])
-def read_current_user(current_user: User = Depends(get_current_user_from_request), db: Session = Depends(get_db)):
+def read_current_user(request: Request, response: Response,
+                      current_user: User = Depends(get_current_user_from_request), db: Session = Depends(get_read_db)):
     """获取当前用户信息及关联的歌单数据"""
     try:
+        # 用户信息和歌单列表都未变化时直接返回 304
+        etag = make_etag("me", current_user.id, current_user.updated_at,
+                         *get_playlists_version(db, creator_id=current_user.id))
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+
         # 查询用户的所有歌单
         user_playlists = get_playlists_by_creator(db, creator_id=current_user.id, skip=0, limit=100)
 
@@ -116,7 +117,7 @@ def read_current_user(current_user: User = Depends(get_current_user_from_request
             playlists=user_playlists
         )
 
-        return ResponseModel(code=200, msg="success", data=user_with_playlists)
+        return with_etag(ResponseModel(code=200, msg="success", data=user_with_playlists), response, etag)
     except Exception as e:
         return ResponseModel(code=500, msg=str(e), data=None)
 
@@ -136,7 +137,7 @@ def create_new_user(user: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/{user_id}", response_model=ResponseModel[User])
-def read_user(user_id: int, current_user: UserModel = Depends(get_current_user_from_request), db: Session = Depends(get_db)):
+def read_user(user_id: int, current_user: UserModel = Depends(get_current_user_from_request), db: Session = Depends(get_read_db)):
     try:
         db_user = get_user(db, user_id=user_id)
         if db_user is None:
@@ -148,10 +149,10 @@ def read_user(user_id: int, current_user: UserModel = Depends(get_current_user_f
 
 
 @router.get("/", response_model=ResponseModel[List[User]])
-def read_users(skip: int = 0, limit: int = 100, current_user: UserModel = Depends(get_current_user_from_request), db: Session = Depends(get_db)):
+def read_users(skip: int = 0, limit: int = 100, current_user: UserModel = Depends(get_current_user_from_request), db: Session = Depends(get_read_db)):
     try:
         users = get_users(db, skip=skip, limit=limit)
-        return ResponseModel(code=200, msg="success", data=users)
+        return respond(USER_LIST, users)
     except Exception as e:
         return ResponseModel(code=500, msg=str(e), data=[])
 
@@ -188,8 +189,7 @@ def update_user_profile(
             if not validate_image_file(avatar_file):
                 return ResponseModel(code=400, msg="头像图片文件过大或格式不支持", data=None)
 
-            avatar_filename = save_file(avatar_file,"avatar")
-            avatar_url = f"/uploads/avatar/{avatar_filename}"
+            avatar_url = save_upload(avatar_file, "avatar")
             update_data["avatar_url"] = avatar_url
 
         # 如果没有提供任何更新数据，返回错误
@@ -220,24 +220,6 @@ def validate_image_file(file: UploadFile) -> bool:
 
     return True
 
-def save_file(file: UploadFile, file_type: str) -> str:
-    """保存文件到服务器"""
-    # 创建目录
-    upload_dir = f"uploads/{file_type}"
-    os.makedirs(upload_dir, exist_ok=True)
-
-    # 生成较短的 UUID 文件名（取前8位）
-    short_uuid = str(uuid.uuid4())[:8]
-    file_extension = file.filename.split(".")[-1] if "." in file.filename else ""
-    filename = f"{short_uuid}.{file_extension}"
-    file_path = os.path.join(upload_dir, filename)
-
-    # 保存文件
-    with open(file_path, "wb") as buffer:
-        content = file.file.read()
-        buffer.write(content)
-
-    return filename
 
 
 @router.delete("/{user_id}", response_model=ResponseModel[User])
@@ -263,20 +245,38 @@ def delete_user_info(
 @router.get("/{user_id}/playlists", response_model=ResponseModel[PlaylistPaginationResult])
 def read_user_playlists_pagination(
         user_id: int,
+        request: Request,
+        response: Response,
         skip: int = 0,
         limit: int = 10,
+        fields: Optional[str] = FieldsQuery,
         current_user: User = Depends(get_current_user_from_request),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
     """分页获取用户创建的歌单列表，包含分页信息"""
     try:
+        selected = parse_fields(fields, Playlist)
+
         # 检查用户是否存在
         db_user = get_user(db, user_id=user_id)
         if db_user is None:
             return ResponseModel(code=404, msg="User not found", data=None)
 
+        # 歌单列表未变化时直接返回 304
+        etag = make_etag("user_playlists", user_id, *get_playlists_version(db, creator_id=user_id), skip, limit,
+                         selected)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+
         # 获取用户创建的歌单列表（分页）及分页信息
-        result = get_playlists_by_creator_with_pagination(db, creator_id=user_id, skip=skip, limit=limit)
-        return ResponseModel(code=200, msg="success", data=result)
+        result = get_playlists_by_creator_with_pagination(db, creator_id=user_id, skip=skip, limit=limit,
+                                                          fields=selected)
+        if selected:
+            body = sparse_response(Playlist, selected, result, list_key="playlists", headers=response.headers)
+        else:
+            body = respond(PLAYLIST_PAGINATION_RESULT, result, headers=response.headers)
+        return with_etag(body, response, etag)
+    except FieldsError as e:
+        return ResponseModel(code=400, msg=str(e), data=None)
     except Exception as e:
         return ResponseModel(code=500, msg=str(e), data=None)
\ No newline at end of file
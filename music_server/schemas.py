@@ -1,11 +1,18 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
-from pydantic import field_validator
+from pydantic import field_validator, model_validator, PlainSerializer
 import re
 # 在文件开头的导入部分添加 TypeVar 的导入
-from typing import Optional, List, TypeVar, Generic  # 确保包含 TypeVar 和 Generic
+from typing import Optional, List, TypeVar, Generic, Annotated  # 确保包含 TypeVar 和 Generic
+from media_delivery import sign_media_url
 
 T = TypeVar("T")
+
+MUSIC_BATCH_MAX_IDS = 100  # 批量获取音乐的最大数量
+PLAYLIST_BULK_MAX_IDS = 1000  # 歌单批量操作的最大歌曲数量
+
+# 媒体文件地址 - 输出时按配置添加过期签名
+MediaUrl = Annotated[str, PlainSerializer(sign_media_url, return_type=str)]
 # ==================== 用户相关模型 ====================
 
 # 用户基础模型 - 定义用户的基本信息字段
@@ -42,7 +49,7 @@ class UserUpdate(BaseModel):
 # 用户数据库基础模型 - 从数据库读取用户信息时的结构
 class UserInDBBase(UserBase):
     id: int  # 用户唯一标识符
-    avatar_url: Optional[str] = None  # 用户头像URL
+    avatar_url: Optional[MediaUrl] = None  # 用户头像URL
     created_at: datetime  # 用户创建时间
 
     # Pydantic配置项，允许从ORM模型中读取数据
@@ -108,9 +115,9 @@ class MusicUpdate(BaseModel):
 # 音乐数据库基础模型 - 从数据库读取音乐信息时的结构
 class MusicInDBBase(MusicBase):
     id: int  # 音乐唯一标识符
-    cover_url: Optional[str] = None  # 音乐封面图片URL
-    music_url: str  # 音乐文件URL
-    lyric_url: Optional[str] = None  # 歌词文件URL
+    cover_url: Optional[MediaUrl] = None  # 音乐封面图片URL
+    music_url: MediaUrl  # 音乐文件URL
+    lyric_url: Optional[MediaUrl] = None  # 歌词文件URL
     uploader_id: int  # 上传者用户ID
     created_at: datetime  # 音乐上传时间
 
@@ -136,6 +143,23 @@ class MusicResponse(BaseModel):
         orm_mode = True
 
 
+# 批量获取音乐请求模型 - 客户端恢复播放队列时一次获取多首歌曲
+class MusicBatchRequest(BaseModel):
+    ids: List[int]
+
+    @field_validator('ids')
+    def validate_ids(cls, v):
+        if len(v) > MUSIC_BATCH_MAX_IDS:
+            raise ValueError(f'一次最多获取{MUSIC_BATCH_MAX_IDS}首歌曲')
+        return v
+
+
+# 批量获取音乐结果模型 - musics 与请求顺序一致，missing_ids 为不存在或已删除的歌曲
+class MusicBatchResult(BaseModel):
+    musics: List[Music]
+    missing_ids: List[int]
+
+
 class MusicSearchResult(BaseModel):
     musics: List[Music]
     total_count: int
@@ -201,7 +225,7 @@ class PlaylistBase(BaseModel):
 
 class PlaylistInDBBase(PlaylistBase):
     id: int  # 歌单唯一标识符
-    cover_url: Optional[str] = None  # 歌单封面URL
+    cover_url: Optional[MediaUrl] = None  # 歌单封面URL
     creator_id: int  # 创建者用户ID
     created_at: datetime  # 歌单创建时间
     updated_at: datetime  # 歌单最后更新时间
@@ -257,9 +281,9 @@ class PlaylistMusicInfo(BaseModel):
     id: int
     title: str
     artist: str
-    music_url: str
-    cover_url: Optional[str] = None
-    lyric_url: Optional[str] = None
+    music_url: MediaUrl
+    cover_url: Optional[MediaUrl] = None
+    lyric_url: Optional[MediaUrl] = None
     created_at: datetime
 
     class Config:
@@ -277,6 +301,40 @@ class PlaylistMusicPaginationResult(BaseModel):
         from_attributes = True
 
 
+# 歌单批量操作请求模型 - 批量添加、移除、重排歌曲
+class PlaylistMusicsBulkRequest(BaseModel):
+    music_ids: List[int]
+
+    @field_validator('music_ids')
+    def validate_music_ids(cls, v):
+        if not v:
+            raise ValueError('歌曲列表不能为空')
+        if len(v) > PLAYLIST_BULK_MAX_IDS:
+            raise ValueError(f'一次最多操作{PLAYLIST_BULK_MAX_IDS}首歌曲')
+        return v
+
+
+# 歌单批量操作结果模型 - music_ids 为实际生效的歌曲，skipped_ids 为已在歌单中的歌曲，
+# missing_ids 为不存在、已删除或不在歌单中的歌曲
+class PlaylistMusicsBulkResult(BaseModel):
+    music_ids: List[int]
+    skipped_ids: List[int]
+    missing_ids: List[int]
+    music_count: int
+
+
+# 歌单歌曲移动请求模型 - 移动到 after_music_id 之后或 before_music_id 之前（二选一）
+class PlaylistMusicMoveRequest(BaseModel):
+    after_music_id: Optional[int] = None
+    before_music_id: Optional[int] = None
+
+    @model_validator(mode='after')
+    def validate_anchor(self):
+        if (self.after_music_id is None) == (self.before_music_id is None):
+            raise ValueError('after_music_id 和 before_music_id 必须且只能提供一个')
+        return self
+
+
 # ==================== 其他功能模型 ====================
 
 # 搜索请求模型 - 用户搜索音乐时的数据结构
@@ -325,7 +383,7 @@ class LoginResponse(BaseModel):
 class ResponseModel(BaseModel, Generic[T]):
     code: int = 200
     msg: str = "success"
-    data: T = None
+    data: Optional[T] = None
 
     class Config:
         from_attributes = True
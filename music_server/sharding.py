@@ -0,0 +1,211 @@
+# sharding.py
+"""按用户分库
+
+SQLite 同一时间只允许一个写入者，所有用户共用一个 music.db 时写入吞吐量有上限。
+设置 SHARD_COUNT > 1 后，用户相关的数据按用户分散到多个数据库文件（分片）中：
+
+- users 按用户ID、playlists 按创建者ID、playlist_musics 按歌单ID 路由到 shard_{id % SHARD_COUNT}
+- musics、delete_jobs 等全局数据保存在 catalog（即 DATABASE_URL 指向的主库）
+
+为了只根据主键就能找到分片，ID 由 catalog 中的 id_sequences 表全局分配：
+用户ID直接使用序号；歌单ID与创建者ID、歌单歌曲ID与歌单ID对 SHARD_COUNT 同余，
+因此三种记录无论按哪个路由列查询，都会落在同一个分片上。
+
+查询条件中没有路由列（例如按音乐查找包含它的歌单）时，查询会发送到所有分片并合并结果（scatter-gather）。
+分库只适用于新部署，不会迁移已有的单库数据；SHARD_COUNT=1（默认）时不启用。
+"""
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.ext.horizontal_shard import set_shard_id
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+from sqlalchemy.sql.schema import Column, Table
+from sqlalchemy.sql.util import find_tables
+
+# 加载环境变量
+load_dotenv()
+
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+SHARD_URL_TEMPLATE = os.getenv("SHARD_URL_TEMPLATE", "sqlite:///./music_shard_{index}.db")
+
+CATALOG_SHARD = "catalog"
+SHARD_IDS = [f"shard_{index}" for index in range(SHARD_COUNT)]
+
+# 分片表的路由列（这些列的值对 SHARD_COUNT 取余即为分片序号）
+ROUTING_COLUMNS = {
+    "users": ("id",),
+    "playlists": ("id", "creator_id"),
+    "playlist_musics": ("id", "playlist_id"),
+}
+# 分配ID时需要与之同余的列（None 表示直接使用序号）
+ID_ALIGN_COLUMNS = {
+    "users": None,
+    "playlists": "creator_id",
+    "playlist_musics": "playlist_id",
+}
+
+
+def is_enabled() -> bool:
+    return SHARD_COUNT > 1
+
+
+def shard_urls() -> Dict[str, str]:
+    return {shard_id: SHARD_URL_TEMPLATE.format(index=index) for index, shard_id in enumerate(SHARD_IDS)}
+
+
+def shard_for(value) -> str:
+    """路由列的值对应的分片"""
+    return SHARD_IDS[int(value) % SHARD_COUNT]
+
+
+class IdAllocator:
+    """在 catalog 库中为分片表分配全局唯一的ID"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _ensure_table(self, conn):
+        if not self._ready:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS id_sequences (name VARCHAR PRIMARY KEY, next_value INTEGER NOT NULL)"
+            ))
+            self._ready = True
+
+    def allocate(self, table: str, align_value=None, count: int = 1) -> List[int]:
+        """分配 count 个ID，align_value 不为空时ID与其对 SHARD_COUNT 同余"""
+        with self._lock, self.engine.begin() as conn:
+            self._ensure_table(conn)
+            conn.execute(text(
+                "INSERT INTO id_sequences (name, next_value) VALUES (:name, 1) ON CONFLICT (name) DO NOTHING"
+            ), {"name": table})
+            end = conn.execute(text(
+                "UPDATE id_sequences SET next_value = next_value + :count WHERE name = :name RETURNING next_value"
+            ), {"name": table, "count": count}).scalar()
+
+        sequences = range(end - count, end)
+        if align_value is None:
+            return list(sequences)
+        residue = int(align_value) % SHARD_COUNT
+        return [sequence * SHARD_COUNT + residue for sequence in sequences]
+
+
+class ShardRouter:
+    """ShardedSession 的路由回调"""
+
+    def __init__(self, allocator: IdAllocator):
+        self.allocator = allocator
+
+    def assign_ids(self, table: str, rows: List[dict]):
+        """为批量插入中还没有ID的记录分配ID（按同余列的值分组，每组只访问一次 id_sequences）"""
+        align = ID_ALIGN_COLUMNS[table]
+        groups: Dict[Optional[int], List[dict]] = {}
+        for row in rows:
+            if row.get("id") is None:
+                groups.setdefault(row[align] if align else None, []).append(row)
+        for align_value, group in groups.items():
+            for row, row_id in zip(group, self.allocator.allocate(table, align_value, count=len(group))):
+                row["id"] = row_id
+
+    def shard_chooser(self, mapper, instance, clause=None, **kw) -> str:
+        table = mapper.local_table.name if mapper is not None else None
+        if table not in ROUTING_COLUMNS:
+            return CATALOG_SHARD
+        if instance is None:
+            shards = _shards_from_statement(clause, table) if clause is not None else None
+            return shards[0] if shards else SHARD_IDS[0]
+
+        if instance.id is None:
+            align = ID_ALIGN_COLUMNS[table]
+            instance.id = self.allocator.allocate(table, getattr(instance, align) if align else None)[0]
+        return shard_for(instance.id)
+
+    def identity_chooser(self, mapper, primary_key, **kw) -> List[str]:
+        if mapper.local_table.name in ROUTING_COLUMNS:
+            return [shard_for(primary_key[0])]
+        return [CATALOG_SHARD]
+
+    def execute_chooser(self, orm_context) -> List[str]:
+        statement = orm_context.statement
+        tables = {table.name for table in find_tables(statement, include_crud=True, check_columns=True)
+                  if isinstance(table, Table)}
+        routed = tables & ROUTING_COLUMNS.keys()
+        if not routed:
+            return [CATALOG_SHARD]
+        table = next(iter(routed)) if len(routed) == 1 else None
+
+        values: Set[int] = set()
+        parameters = orm_context.parameters
+        if table is not None and parameters:
+            rows = parameters if isinstance(parameters, list) else [parameters]
+            if orm_context.is_insert:
+                self.assign_ids(table, rows)
+            for row in rows:
+                values.update(row[column] for column in ROUTING_COLUMNS[table] if row.get(column) is not None)
+
+        shards = _shards_from_statement(statement, table) if table is not None and not values else None
+        if values:
+            shards = sorted({shard_for(value) for value in values})
+        if orm_context.is_insert and (shards is None or len(shards) > 1):
+            raise ValueError(f"批量插入 {table} 的记录必须属于同一个分片")
+        return shards or SHARD_IDS
+
+
+def _routing_values(clause, table: str) -> Optional[Set[int]]:
+    """从 column == value / column IN (...) 条件中取出路由列的值"""
+    if not isinstance(clause, BinaryExpression) or not isinstance(clause.left, Column):
+        return None
+    column = clause.left
+    if column.table.name != table or column.name not in ROUTING_COLUMNS[table]:
+        return None
+    if not isinstance(clause.right, BindParameter):
+        return None
+    value = clause.right.effective_value
+    if clause.operator is operators.eq and value is not None:
+        return {int(value)}
+    if clause.operator is operators.in_op and value:
+        return {int(item) for item in value}
+    return None
+
+
+def _conjuncts(whereclause) -> Iterable:
+    if isinstance(whereclause, BooleanClauseList) and whereclause.operator is operators.and_:
+        return whereclause.clauses
+    return [whereclause]
+
+
+def _shards_from_statement(statement, table: str) -> Optional[List[str]]:
+    """根据 WHERE 中顶层 AND 条件里的路由列确定分片（count() 等会把条件放在子查询中）"""
+    whereclause = getattr(statement, "whereclause", None)
+    if whereclause is not None:
+        for clause in _conjuncts(whereclause):
+            values = _routing_values(clause, table)
+            if values:
+                return sorted({shard_for(value) for value in values})
+
+    for from_clause in getattr(statement, "get_final_froms", lambda: [])():
+        # 子查询可能被包装成多层别名（Query.count() 生成 Alias(Subquery(Select))）
+        element = getattr(from_clause, "element", None)
+        while element is not None and not hasattr(element, "whereclause"):
+            element = getattr(element, "element", None)
+        if element is not None:
+            shards = _shards_from_statement(element, table)
+            if shards:
+                return shards
+    return None
+
+
+def scatter_gather(query, skip: int, limit: int, key) -> list:
+    """跨分片分页：每个分片取前 skip + limit 条，按 key 合并排序后再分页"""
+    if not is_enabled():
+        return query.offset(skip).limit(limit).all()
+    rows = []
+    for shard_id in SHARD_IDS:
+        rows.extend(query.options(set_shard_id(shard_id)).limit(skip + limit).all())
+    rows.sort(key=key)
+    return rows[skip:skip + limit]
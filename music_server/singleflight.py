@@ -0,0 +1,102 @@
+# singleflight.py
+"""相同请求合并（single-flight）
+
+多个线程同时请求同一个键时，只有第一个线程真正执行计算，其余线程等待并共享结果。
+同步路由运行在线程池中，所以这里使用线程同步原语。
+
+按路由配置是否启用，例如 COALESCE_ROUTES=playlist_musics,music,playlist；
+设置为 * 表示全部启用，留空表示全部关闭。
+"""
+import os
+import threading
+from typing import Any, Callable, Dict
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 合并配置
+COALESCE_ROUTES = {
+    name.strip() for name in os.getenv("COALESCE_ROUTES", "playlist_musics,playlist,music").split(",") if name.strip()
+}
+COALESCE_WAIT_SECONDS = float(os.getenv("COALESCE_WAIT_SECONDS", 30))  # 等待其他线程结果的最长时间
+
+
+class _Call:
+    """一次正在进行的计算"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """相同键的并发调用只执行一次"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def do(self, route: str, key: str, fn: Callable[[], Any]) -> Any:
+        if not is_enabled(route):
+            return fn()
+
+        call_key = f"{route}:{key}"
+        with self._lock:
+            stats = self.stats.setdefault(route, {"calls": 0, "executions": 0, "shared": 0})
+            stats["calls"] += 1
+            call = self._calls.get(call_key)
+            if call is not None:
+                # 已有线程在计算，等待其结果
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[call_key] = call
+                stats["executions"] += 1
+                leader = True
+
+        if not leader:
+            if not call.done.wait(COALESCE_WAIT_SECONDS):
+                # 等待超时则自己执行，不影响正确性（计为一次执行，不算共享）
+                with self._lock:
+                    stats["executions"] += 1
+                return fn()
+            if call.error is not None:
+                raise call.error
+            # 复用了第一个线程的结果才算节省了一次调用
+            with self._lock:
+                stats["shared"] += 1
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(call_key, None)
+            call.done.set()
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """各路由的合并统计，shared 即节省的数据库调用次数"""
+        with self._lock:
+            return {route: dict(stats) for route, stats in self.stats.items()}
+
+
+def is_enabled(route: str) -> bool:
+    return "*" in COALESCE_ROUTES or route in COALESCE_ROUTES
+
+
+single_flight = SingleFlight()
+
+
+def coalesce(route: str, key: Any, fn: Callable[[], Any]) -> Any:
+    """合并相同路由、相同参数的并发读请求"""
+    return single_flight.do(route, str(key), fn)
@@ -0,0 +1,253 @@
+# storage.py
+"""文件存储后端抽象
+
+所有上传文件（音乐、封面、歌词、头像）都通过这里读写，路由层只关心对象键（key），
+例如 ``music/1a2b3c4d.mp3``，数据库中保存的则是与后端无关的 ``/uploads/<key>`` 地址。
+
+- local: 默认后端，写入本地 ``uploads/`` 目录，由 main.py 挂载 StaticFiles 提供访问
+- s3:    S3 兼容对象存储（AWS S3 / MinIO 等），多个 API 节点共享同一份媒体文件，
+         ``/uploads/<key>`` 请求会被重定向到预签名地址，字节流不再经过 Python 进程
+"""
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Iterator, Optional
+
+from dotenv import load_dotenv
+from fastapi import UploadFile
+
+import metrics
+import tracing
+
+# 加载环境变量
+load_dotenv()
+
+# 存储配置
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")  # local 或 s3
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")  # 本地存储根目录
+UPLOAD_URL_PREFIX = "/uploads"  # 数据库中保存的文件地址前缀
+PRESIGN_EXPIRE_SECONDS = int(os.getenv("PRESIGN_EXPIRE_SECONDS", 3600))  # 预签名地址有效期
+STREAM_CHUNK_SIZE = 64 * 1024  # 流式读取的块大小
+
+# S3 兼容存储配置（本地测试可以使用 MinIO：S3_ENDPOINT_URL=http://127.0.0.1:9000）
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_BUCKET = os.getenv("S3_BUCKET", "music-server")
+S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY") or None
+S3_SECRET_KEY = os.getenv("S3_SECRET_KEY") or None
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ADDRESSING_STYLE = os.getenv("S3_ADDRESSING_STYLE", "path")  # MinIO 需要 path 风格
+
+
+class StorageError(Exception):
+    """存储后端异常"""
+
+
+class StorageBackend(ABC):
+    """存储后端接口，所有后端都需要实现以下方法"""
+
+    name = "base"
+
+    @abstractmethod
+    def put(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None) -> int:
+        """写入文件，返回写入的字节数"""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """读取整个文件"""
+
+    @abstractmethod
+    def stream(self, key: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """按块读取文件"""
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """删除文件，文件不存在时返回False"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """判断文件是否存在"""
+
+    @abstractmethod
+    def presign(self, key: str, expires_in: int = PRESIGN_EXPIRE_SECONDS) -> str:
+        """生成客户端可以直接访问的地址"""
+
+
+class LocalStorage(StorageBackend):
+    """本地文件系统存储"""
+
+    name = "local"
+
+    def __init__(self, root: str = UPLOAD_DIR):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        """将对象键转换为本地路径，禁止跳出存储根目录"""
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root or path == self.root:
+            raise StorageError(f"非法的文件路径: {key}")
+        return path
+
+    @tracing.traced("storage.put")
+    def put(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None) -> int:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # 先写临时文件再原子替换，避免读到写了一半的文件
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp_path, "wb") as buffer:
+                shutil.copyfileobj(fileobj, buffer, STREAM_CHUNK_SIZE)
+                size = buffer.tell()
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return size
+
+    @tracing.traced("storage.get")
+    def get(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def stream(self, key: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self.path(key), "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    @tracing.traced("storage.delete")
+    def delete(self, key: str) -> bool:
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def presign(self, key: str, expires_in: int = PRESIGN_EXPIRE_SECONDS) -> str:
+        # 本地文件由 StaticFiles 直接提供访问
+        return f"{UPLOAD_URL_PREFIX}/{key}"
+
+
+class S3Storage(StorageBackend):
+    """S3 兼容对象存储（依赖 boto3，只有启用时才需要安装）"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+                 access_key: Optional[str] = S3_ACCESS_KEY, secret_key: Optional[str] = S3_SECRET_KEY,
+                 region: str = S3_REGION, addressing_style: str = S3_ADDRESSING_STYLE):
+        try:
+            import boto3
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise StorageError("使用S3存储需要先安装boto3: pip install boto3") from e
+
+        self.bucket = bucket
+        self._client_error = ClientError
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region,
+            config=Config(signature_version="s3v4", s3={"addressing_style": addressing_style}),
+        )
+        # 对象存储请求带上 traceparent
+        self.client.meta.events.register("before-send.s3", tracing.inject_botocore_headers)
+
+    @tracing.traced("storage.put", "CLIENT")
+    def put(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None) -> int:
+        start = fileobj.tell() if fileobj.seekable() else 0
+        extra_args = {"ContentType": content_type} if content_type else None
+        self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra_args)
+        return fileobj.tell() - start if fileobj.seekable() else 0
+
+    @tracing.traced("storage.get", "CLIENT")
+    def get(self, key: str) -> bytes:
+        return self._get_object(key)["Body"].read()
+
+    def stream(self, key: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        body = self._get_object(key)["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    @tracing.traced("storage.delete", "CLIENT")
+    def delete(self, key: str) -> bool:
+        if not self.exists(key):
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        return True
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def presign(self, key: str, expires_in: int = PRESIGN_EXPIRE_SECONDS) -> str:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=expires_in,
+        )
+
+    def _get_object(self, key: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(key) from e
+            raise
+
+
+# 可用的存储后端
+STORAGE_BACKENDS = {
+    LocalStorage.name: LocalStorage,
+    S3Storage.name: S3Storage,
+}
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """获取当前配置的存储后端（进程内单例）"""
+    global _storage
+    if _storage is None:
+        backend_cls = STORAGE_BACKENDS.get(STORAGE_BACKEND)
+        if backend_cls is None:
+            raise StorageError(f"不支持的存储后端: {STORAGE_BACKEND}")
+        _storage = backend_cls()
+    return _storage
+
+
+def save_upload(file: UploadFile, file_type: str) -> str:
+    """保存上传文件到存储后端，返回文件访问地址"""
+    # 生成较短的 UUID 文件名（取前8位）
+    short_uuid = str(uuid.uuid4())[:8]
+    file_extension = file.filename.split(".")[-1] if "." in file.filename else ""
+    key = f"{file_type}/{short_uuid}.{file_extension}"
+
+    size = get_storage().put(key, file.file, file.content_type)
+    metrics.observe_upload(file_type, size)
+    return f"{UPLOAD_URL_PREFIX}/{key}"
+
+
+def key_from_url(url: Optional[str]) -> Optional[str]:
+    """从 /uploads/<key> 地址中解析出对象键"""
+    prefix = f"{UPLOAD_URL_PREFIX}/"
+    if not url or not url.startswith(prefix):
+        return None
+    return url[len(prefix):]
@@ -0,0 +1,57 @@
+# tools/backup.py
+"""数据库备份与恢复命令
+
+用法（在 music_server 目录下执行）：
+    python -m tools.backup create                     # 立即备份（并按 BACKUP_KEEP 清理旧备份）
+    python -m tools.backup list
+    python -m tools.backup restore backups/music-20240101-000000.manifest.json
+    python -m tools.backup restore <清单> --target /tmp/music.db   # 恢复到其他位置用于检查
+"""
+import argparse
+import json
+import os
+import sys
+
+import backup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库备份与恢复")
+    parser.add_argument("--backup-dir", default=backup.BACKUP_DIR, help="备份目录")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create_parser = subparsers.add_parser("create", help="立即备份")
+    create_parser.add_argument("--no-compress", action="store_true", help="不压缩快照")
+    create_parser.add_argument("--keep", type=int, default=backup.BACKUP_KEEP, help="保留最近几份备份")
+
+    subparsers.add_parser("list", help="列出备份")
+
+    restore_parser = subparsers.add_parser("restore", help="校验并恢复备份（恢复前请停止服务）")
+    restore_parser.add_argument("manifest", help="备份清单文件（*.manifest.json）")
+    restore_parser.add_argument("--target", help="恢复到的数据库路径，默认为当前数据库")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        try:
+            manifest = backup.create_backup(args.backup_dir, compress=not args.no_compress)
+        except backup.BackupError as e:
+            print(f"备份失败: {e}", file=sys.stderr)
+            sys.exit(1)
+        pruned = backup.prune_backups(args.backup_dir, keep=args.keep)
+        manifest = {key: value for key, value in manifest.items() if key != "uploads"}
+        manifest["pruned"] = pruned
+        print(json.dumps(manifest, ensure_ascii=False, indent=2))
+    elif args.command == "list":
+        for manifest_path in backup.list_backups(args.backup_dir):
+            print(os.path.basename(manifest_path))
+    else:
+        try:
+            result = backup.restore_backup(args.manifest, target_path=args.target)
+        except backup.BackupError as e:
+            print(f"恢复失败: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
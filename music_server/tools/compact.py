@@ -0,0 +1,220 @@
+# tools/compact.py
+"""压缩逻辑删除的数据
+
+所有表都使用 is_deleted 逻辑删除，已删除的记录会一直留在表中，每个查询都要过滤掉它们。
+这个任务把超过保留期的已删除记录分批移到归档库（或直接删除），然后回收空闲页并更新统计信息：
+
+1. 标记：为 deleted_at 为空的已删除记录写入当前时间，保留期从第一次被发现时开始计算
+   （恢复歌单歌曲时会清空 deleted_at）
+2. 归档：按主键分批把 deleted_at 早于保留期的记录复制到归档库（ATTACH 的 music_archive.db）
+   并从主库删除，每批一个短事务。仍有未删除的关联数据（级联删除任务未完成）的音乐、歌单和用户会跳过
+3. 回收：auto_vacuum=INCREMENTAL 时分步执行 incremental_vacuum，最后执行 ANALYZE
+
+只处理 DATABASE_URL 指向的单个数据库。开启分片（SHARD_COUNT > 1）后歌单歌曲保存在各分片中，
+catalog 中的关联检查不可靠（会归档仍被引用的音乐），因此拒绝执行。
+
+用法（在 music_server 目录下执行）：
+    python -m tools.compact                          # 归档超过 30 天的已删除记录
+    python -m tools.compact --retention-days 7 --mode delete
+    python -m tools.compact --enable-incremental-vacuum   # 第一次使用时切换 auto_vacuum（需要完整 VACUUM）
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import Column, MetaData, Table, inspect
+
+import sharding
+from database import Base, engine, init_db
+import models  # noqa: F401  注册所有表，init_db 和 Base.metadata 依赖
+
+# 加载环境变量
+load_dotenv()
+
+COMPACT_RETENTION_DAYS = int(os.getenv("COMPACT_RETENTION_DAYS", 30))  # 已删除记录的保留天数
+COMPACT_BATCH_SIZE = int(os.getenv("COMPACT_BATCH_SIZE", 500))  # 每个事务处理的记录数
+COMPACT_ARCHIVE_PATH = os.getenv("COMPACT_ARCHIVE_PATH", "music_archive.db")  # 归档库路径
+VACUUM_STEP_PAGES = 1000  # 每次 incremental_vacuum 回收的页数
+
+# 按依赖顺序压缩：先删除关联记录，再删除被引用的记录
+COMPACT_TABLES = [
+    ("playlist_musics", ""),
+    ("playlists", "AND NOT EXISTS (SELECT 1 FROM playlist_musics pm "
+                  "WHERE pm.playlist_id = t.id AND pm.is_deleted = 0)"),
+    ("musics", "AND NOT EXISTS (SELECT 1 FROM playlist_musics pm "
+               "WHERE pm.music_id = t.id AND pm.is_deleted = 0)"),
+    ("users", "AND NOT EXISTS (SELECT 1 FROM musics m WHERE m.uploader_id = t.id AND m.is_deleted = 0) "
+              "AND NOT EXISTS (SELECT 1 FROM playlists p WHERE p.creator_id = t.id AND p.is_deleted = 0)"),
+]
+
+
+def _batches(conn, sql: str, params: dict, batch_size: int):
+    """按主键顺序分批读取记录ID"""
+    last_id = 0
+    while True:
+        ids = [row[0] for row in conn.exec_driver_sql(
+            sql + " AND t.id > :last_id ORDER BY t.id LIMIT :limit",
+            {**params, "last_id": last_id, "limit": batch_size}
+        )]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def _in_clause(ids) -> str:
+    return ",".join(str(int(item_id)) for item_id in ids)
+
+
+def mark_deleted(conn, table: str, now: datetime, batch_size: int) -> int:
+    """为还没有删除时间的已删除记录写入当前时间"""
+    marked = 0
+    sql = f"SELECT t.id FROM {table} t WHERE t.is_deleted = 1 AND t.deleted_at IS NULL"
+    for ids in _batches(conn, sql, {}, batch_size):
+        conn.exec_driver_sql(f"UPDATE {table} SET deleted_at = ? WHERE id IN ({_in_clause(ids)})", (now,))
+        conn.commit()
+        marked += len(ids)
+    return marked
+
+
+def ensure_archive_tables(conn):
+    """在归档库中创建（或补齐列）与主库同名的表，不带唯一约束和索引"""
+    archive = MetaData(schema="archive")
+    for table in Base.metadata.sorted_tables:
+        Table(table.name, archive,
+              *(Column(column.name, column.type, primary_key=column.primary_key) for column in table.columns))
+    archive.create_all(conn, checkfirst=True)
+
+    inspector = inspect(conn)
+    for table in archive.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name, schema="archive")}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE archive.{table.name} ADD COLUMN {column.name} {column_type}")
+    conn.commit()
+
+
+def compact_table(conn, table: str, condition: str, cutoff: datetime, archive: bool, batch_size: int) -> int:
+    """归档（或删除）一张表中超过保留期的已删除记录"""
+    columns = ", ".join(column.name for column in Base.metadata.tables[table].columns)
+    sql = f"SELECT t.id FROM {table} t WHERE t.is_deleted = 1 AND t.deleted_at < :cutoff {condition}"
+    moved = 0
+    for ids in _batches(conn, sql, {"cutoff": cutoff}, batch_size):
+        in_clause = _in_clause(ids)
+        if archive:
+            conn.exec_driver_sql(
+                f"INSERT OR REPLACE INTO archive.{table} ({columns}) "
+                f"SELECT {columns} FROM main.{table} WHERE id IN ({in_clause})"
+            )
+        conn.exec_driver_sql(f"DELETE FROM main.{table} WHERE id IN ({in_clause})")
+        conn.commit()
+        moved += len(ids)
+    return moved
+
+
+def purge_delete_jobs(conn, cutoff: datetime, batch_size: int) -> int:
+    """删除已完成且超过保留期的级联删除任务"""
+    sql = "SELECT t.id FROM delete_jobs t WHERE t.status = 'done' AND t.updated_at < :cutoff"
+    purged = 0
+    for ids in _batches(conn, sql, {"cutoff": cutoff}, batch_size):
+        conn.exec_driver_sql(f"DELETE FROM delete_jobs WHERE id IN ({_in_clause(ids)})")
+        conn.commit()
+        purged += len(ids)
+    return purged
+
+
+def page_stats(conn) -> dict:
+    page_size = conn.exec_driver_sql("PRAGMA main.page_size").scalar()
+    page_count = conn.exec_driver_sql("PRAGMA main.page_count").scalar()
+    freelist_count = conn.exec_driver_sql("PRAGMA main.freelist_count").scalar()
+    return {
+        "page_size": page_size,
+        "page_count": page_count,
+        "freelist_count": freelist_count,
+        "file_bytes": page_size * page_count,
+    }
+
+
+def reclaim_space(conn, enable_incremental: bool) -> str:
+    """回收空闲页：auto_vacuum=INCREMENTAL 时分步回收，否则只在明确要求时执行一次完整 VACUUM"""
+    auto_vacuum = conn.exec_driver_sql("PRAGMA main.auto_vacuum").scalar()
+    if auto_vacuum != 2:
+        if not enable_incremental:
+            return "skipped (auto_vacuum is not INCREMENTAL, run with --enable-incremental-vacuum once)"
+        # 切换 auto_vacuum 模式需要一次完整 VACUUM（会阻塞写入，应在低峰期执行）
+        conn.exec_driver_sql("PRAGMA main.auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM main")
+        return "full vacuum (auto_vacuum switched to INCREMENTAL)"
+
+    # 每次只回收一部分页，避免长时间持有写锁
+    while conn.exec_driver_sql("PRAGMA main.freelist_count").scalar():
+        conn.exec_driver_sql(f"PRAGMA main.incremental_vacuum({VACUUM_STEP_PAGES})")
+    return "incremental vacuum"
+
+
+def compact(retention_days: int = COMPACT_RETENTION_DAYS, archive: bool = True,
+            archive_path: str = COMPACT_ARCHIVE_PATH, batch_size: int = COMPACT_BATCH_SIZE,
+            enable_incremental_vacuum: bool = False) -> dict:
+    """执行一次压缩，返回各表处理的记录数和回收的空间"""
+    if sharding.is_enabled():
+        raise RuntimeError("tools.compact 不支持分片部署（SHARD_COUNT > 1）")
+
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=retention_days)
+    report = {"retention_days": retention_days, "mode": "archive" if archive else "delete", "tables": {}}
+
+    with engine.connect() as conn:
+        before = page_stats(conn)
+        if archive:
+            conn.exec_driver_sql("ATTACH DATABASE ? AS archive", (archive_path,))
+            ensure_archive_tables(conn)
+        try:
+            for table, condition in COMPACT_TABLES:
+                report["tables"][table] = {
+                    "marked": mark_deleted(conn, table, now, batch_size),
+                    "compacted": compact_table(conn, table, condition, cutoff, archive, batch_size),
+                }
+            report["delete_jobs_purged"] = purge_delete_jobs(conn, cutoff, batch_size)
+        finally:
+            if archive:
+                conn.commit()
+                conn.exec_driver_sql("DETACH DATABASE archive")
+
+        report["vacuum"] = reclaim_space(conn, enable_incremental_vacuum)
+        conn.exec_driver_sql("ANALYZE main")
+        conn.commit()
+        after = page_stats(conn)
+
+    report["before"] = before
+    report["after"] = after
+    report["reclaimed_bytes"] = before["file_bytes"] - after["file_bytes"]
+    report["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压缩逻辑删除的数据")
+    parser.add_argument("--retention-days", type=int, default=COMPACT_RETENTION_DAYS, help="已删除记录的保留天数")
+    parser.add_argument("--mode", choices=("archive", "delete"), default="archive", help="归档到归档库或直接删除")
+    parser.add_argument("--archive-path", default=COMPACT_ARCHIVE_PATH, help="归档库路径")
+    parser.add_argument("--batch-size", type=int, default=COMPACT_BATCH_SIZE, help="每个事务处理的记录数")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="把 auto_vacuum 切换为 INCREMENTAL（执行一次完整 VACUUM）")
+    args = parser.parse_args()
+
+    if sharding.is_enabled():
+        parser.error("不支持分片部署（SHARD_COUNT > 1）")
+    init_db()
+    report = compact(retention_days=args.retention_days, archive=args.mode == "archive",
+                     archive_path=args.archive_path, batch_size=args.batch_size,
+                     enable_incremental_vacuum=args.enable_incremental_vacuum)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# tools/reconcile_counts.py
+"""核对并修正歌单的歌曲数量（playlists.music_count）
+
+正常情况下各写操作都会在数据库中原子地维护 music_count，这个任务用于定期（例如每天一次的 cron）
+核对历史数据或异常中断造成的偏差，并输出偏差报告。
+
+用法（在 music_server 目录下执行）：
+    python -m tools.reconcile_counts            # 核对并修正
+    python -m tools.reconcile_counts --dry-run  # 只输出偏差，不修改数据
+"""
+import argparse
+import json
+import sys
+
+from crud import reconcile_music_counts
+from database import SessionLocal, init_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="核对并修正歌单的歌曲数量")
+    parser.add_argument("--dry-run", action="store_true", help="只输出偏差，不修改数据")
+    parser.add_argument("--batch-size", type=int, default=500, help="每条 UPDATE 语句修正的歌单数量")
+    parser.add_argument("--limit", type=int, default=100, help="报告中最多列出的歌单数量")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        report = reconcile_music_counts(db, fix=not args.dry_run, batch_size=args.batch_size)
+    finally:
+        db.close()
+
+    report["playlists"] = report["playlists"][:args.limit]
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    # 仅核对时，存在偏差则以非零状态退出，便于在定时任务中告警
+    if args.dry_run and report["drifted"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
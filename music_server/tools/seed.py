@@ -0,0 +1,355 @@
+# tools/seed.py
+"""生成大规模测试数据
+
+init_db 之后表是空的，本地无法复现线上规模下的分页、搜索和索引表现。这个工具按给定规模批量生成
+用户、音乐、歌单和歌单歌曲，用于在接近线上的数据量下测量：
+
+- 标题和歌手由中英文词表组合而成，搜索关键字能命中不同数量的结果
+- 热度有偏：少数歌曲出现在大量歌单中（近似 Zipf 分布），少数用户上传了大部分歌曲、创建了大部分歌单
+- 按 --deleted-fraction 逻辑删除一部分记录（写入 deleted_at），已删除用户的音乐和歌单、
+  已删除音乐和歌单中的歌单歌曲同样标记为删除，与级联删除任务完成后的状态一致
+- 每个用户都有默认歌单“我喜欢的歌曲”，music_count 与未删除的歌单歌曲数一致
+- 可选生成少量占位媒体文件（写入当前存储后端），音乐的 music_url / cover_url / lyric_url 轮流引用它们
+
+使用 Core 批量 INSERT（每批一个事务，写入期间关闭 synchronous），新数据的 ID 从各表当前最大 ID 之后开始，
+可以在已有数据上追加。只支持单库，开启分片（SHARD_COUNT > 1）时拒绝执行；
+PostgreSQL 等使用序列的数据库，生成后需要把各表的序列调整到最大 ID 之后。
+
+用法（在 music_server 目录下执行）：
+    python -m tools.seed                                       # 默认规模：1 万用户、10 万音乐
+    python -m tools.seed --users 1000000 --musics 2000000 --playlists 500000 --tracks 40
+    python -m tools.seed --users 100 --musics 1000 --media-files 20 --seed 7
+"""
+import argparse
+import io
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+from sqlalchemy import func, insert, select
+
+import sharding
+from database import engine, init_db
+from models import Music, Playlist, PlaylistMusic, User
+
+DEFAULT_BATCH_SIZE = 10000  # 每个事务插入的行数
+MAX_TRACKS_PER_PLAYLIST = 1000  # 单个歌单的最大歌曲数
+TIME_SPAN_DAYS = 730  # 创建时间分布在最近两年内
+
+DEFAULT_AVATAR_URL = "/uploads/cover/default.jpg"
+DEFAULT_PLAYLIST_NAME = "我喜欢的歌曲"
+DEFAULT_PLAYLIST_DESCRIPTION = "默认创建的歌单"
+DEFAULT_PLAYLIST_COVER = "/uploads/cover/loveSongs.png"
+
+ZH_WORDS = [
+    "夜空", "星星", "晴天", "雨季", "海风", "远方", "时光", "青春", "梦想", "月光", "故乡", "夏天", "秋日",
+    "城市", "旅行", "告白", "回忆", "孤单", "温柔", "勇气", "微笑", "眼泪", "黎明", "黄昏", "花开", "雪落",
+    "心跳", "约定", "思念", "自由", "未来", "少年", "彩虹", "森林", "灯火", "河流", "晚安", "你好", "再见",
+]
+EN_WORDS = [
+    "Love", "Night", "Summer", "Dream", "Heart", "Light", "Rain", "Fire", "Blue", "Golden", "River", "Moon",
+    "Star", "Road", "Home", "Wild", "Young", "Forever", "Midnight", "Ocean", "Shadow", "Echo", "Sky", "City",
+    "Dance", "Sweet", "Lonely", "Paradise", "Electric", "Silver", "Morning", "Heartbeat", "Stranger", "Memory",
+]
+ZH_SURNAMES = ["陈", "林", "王", "李", "张", "刘", "周", "吴", "赵", "孙", "黄", "许", "郑", "梁", "何", "罗"]
+ZH_GIVEN = ["子", "小", "嘉", "依", "宇", "晨", "雨", "欣", "浩", "杰", "琳", "婷", "俊", "然", "思", "一"]
+EN_FIRST = ["Taylor", "Alex", "Sam", "Jordan", "Chris", "Morgan", "Jamie", "Riley", "Casey", "Avery", "Quinn"]
+EN_LAST = ["Swift", "Lee", "Brown", "Stone", "Rivers", "Hart", "Knight", "Wood", "Fox", "Gray", "Bell"]
+BAND_SUFFIXES = ["乐队", "组合", " Band", " & Friends", " Trio"]
+PLAYLIST_TEMPLATES = ["{}精选", "{}的歌", "我的{}", "{} Mix", "{} Vibes", "深夜{}", "{}循环", "Best of {}"]
+
+# 1x1 PNG，作为占位封面
+PLACEHOLDER_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+class SkewedPicker:
+    """按近似 Zipf（s=1）分布在 1..n 中取值
+
+    rank = (n+1)^u - 1 的分布近似 1/rank；再乘以一个与 n 互质的数打散，热门的记录不会都集中在最小的 ID 上。
+    不需要为每个取值保存权重，规模到千万也只占常数内存。
+    """
+
+    def __init__(self, rng: random.Random, n: int):
+        self.rng = rng
+        self.n = n
+        multiplier = 2654435761 % n if n > 1 else 1
+        while n > 1 and math.gcd(multiplier, n) != 1:
+            multiplier += 1
+        self.multiplier = multiplier or 1
+
+    def pick(self) -> int:
+        rank = min(int((self.n + 1) ** self.rng.random()) - 1, self.n - 1)
+        return rank * self.multiplier % self.n + 1
+
+
+def _random_time(rng: random.Random, now: datetime, after: datetime = None) -> datetime:
+    start = after or now - timedelta(days=TIME_SPAN_DAYS)
+    return start + timedelta(seconds=rng.random() * max((now - start).total_seconds(), 0))
+
+
+def _title(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.5:
+        return "".join(rng.sample(ZH_WORDS, rng.randint(1, 3)))
+    if roll < 0.85:
+        return " ".join(rng.sample(EN_WORDS, rng.randint(1, 3)))
+    return f"{rng.choice(ZH_WORDS)} {rng.choice(EN_WORDS)}"
+
+
+def _artist(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.45:
+        return rng.choice(ZH_SURNAMES) + "".join(rng.sample(ZH_GIVEN, rng.randint(1, 2)))
+    if roll < 0.85:
+        return f"{rng.choice(EN_FIRST)} {rng.choice(EN_LAST)}"
+    return rng.choice(ZH_WORDS + EN_WORDS) + rng.choice(BAND_SUFFIXES)
+
+
+def seed_email(user_id: int) -> str:
+    """生成的用户的邮箱（压测客户端按用户ID构造登录邮箱）"""
+    return f"seed{user_id}@example.com"
+
+
+def _max_id(conn, model) -> int:
+    return conn.execute(select(func.max(model.id))).scalar() or 0
+
+
+def _insert_batches(conn, table, rows: Iterator[dict], batch_size: int, label: str, total: int) -> int:
+    """分批插入，每批一个事务"""
+    inserted = 0
+    batch: List[dict] = []
+    started = time.perf_counter()
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.execute(insert(table), batch)
+            conn.commit()
+            inserted += len(batch)
+            batch = []
+            rate = inserted / max(time.perf_counter() - started, 1e-9)
+            print(f"\r{label}: {inserted}/{total or '?'} ({rate:.0f} rows/s)", end="", file=sys.stderr, flush=True)
+    if batch:
+        conn.execute(insert(table), batch)
+        conn.commit()
+        inserted += len(batch)
+    print(f"\r{label}: {inserted} rows in {time.perf_counter() - started:.1f}s", " " * 20, file=sys.stderr)
+    return inserted
+
+
+def write_media_files(count: int, size: int, rng: random.Random) -> List[dict]:
+    """写入占位媒体文件，返回每组文件的地址"""
+    from storage import UPLOAD_URL_PREFIX, get_storage
+
+    storage = get_storage()
+    media = []
+    for index in range(count):
+        keys = {
+            "music_url": (f"music/seed-{index}.mp3", rng.randbytes(size), "audio/mpeg"),
+            "cover_url": (f"cover/seed-{index}.png", PLACEHOLDER_PNG, "image/png"),
+            "lyric_url": (f"lyric/seed-{index}.lrc", f"[00:00.00]seed lyric {index}\n".encode("utf-8"),
+                          "text/plain"),
+        }
+        urls = {}
+        for field, (key, content, content_type) in keys.items():
+            storage.put(key, io.BytesIO(content), content_type)
+            urls[field] = f"{UPLOAD_URL_PREFIX}/{key}"
+        media.append(urls)
+    return media
+
+
+def seed(users: int = 10000, musics: int = 100000, playlists: int = 20000, tracks: int = 30,
+         deleted_fraction: float = 0.05, media_files: int = 0, media_bytes: int = 4096,
+         batch_size: int = DEFAULT_BATCH_SIZE, seed_value: int = 42) -> dict:
+    """生成测试数据，返回各表插入的行数和耗时
+
+    playlists 是默认歌单之外额外生成的歌单数，tracks 是每个歌单的平均歌曲数（对数正态分布）。
+    """
+    if sharding.is_enabled():
+        raise RuntimeError("tools.seed 不支持分片部署（SHARD_COUNT > 1）")
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    report = {"seed": seed_value, "deleted_fraction": deleted_fraction, "tables": {}}
+
+    init_db()
+    media = write_media_files(media_files, media_bytes, rng) if media_files else []
+    report["media_files"] = len(media) * 3
+
+    is_sqlite = engine.dialect.name == "sqlite"
+    with engine.connect() as conn:
+        if is_sqlite:
+            # 批量写入期间不等待落盘，结束后恢复（连接会回到连接池）
+            synchronous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+            conn.exec_driver_sql("PRAGMA synchronous = OFF")
+        user_base = _max_id(conn, User)
+        music_base = _max_id(conn, Music)
+        playlist_base = _max_id(conn, Playlist)
+
+        # 记录哪些用户、音乐被删除，用于级联标记
+        deleted_users = bytearray(users + 1)
+        deleted_musics = bytearray(musics + 1)
+        user_created = {}
+
+        def user_rows():
+            for index in range(1, users + 1):
+                created_at = _random_time(rng, now)
+                is_deleted = rng.random() < deleted_fraction
+                deleted_users[index] = is_deleted
+                # 只保留少量创建时间用于后续记录，避免在千万规模下占用大量内存
+                if index <= 100000:
+                    user_created[index] = created_at
+                yield {
+                    "id": user_base + index, "email": seed_email(user_base + index),
+                    "nickname": _artist(rng) if rng.random() < 0.3 else f"用户{rng.randint(0, 999999):06d}",
+                    "avatar_url": DEFAULT_AVATAR_URL, "created_at": created_at, "updated_at": created_at,
+                    "is_deleted": is_deleted, "deleted_at": _random_time(rng, now, created_at) if is_deleted else None,
+                }
+
+        report["tables"]["users"] = _insert_batches(conn, User.__table__, user_rows(), batch_size, "users", users)
+
+        uploader_picker = SkewedPicker(rng, users)
+
+        def music_rows():
+            for index in range(1, musics + 1):
+                uploader = uploader_picker.pick()
+                created_at = _random_time(rng, now, user_created.get(uploader))
+                is_deleted = deleted_users[uploader] or rng.random() < deleted_fraction
+                deleted_musics[index] = is_deleted
+                urls = media[index % len(media)] if media else {
+                    "music_url": f"/uploads/music/seed-{index}.mp3", "cover_url": None, "lyric_url": None,
+                }
+                yield {
+                    "id": music_base + index, "title": _title(rng), "artist": _artist(rng),
+                    "uploader_id": user_base + uploader, "created_at": created_at, **urls,
+                    "is_deleted": is_deleted, "deleted_at": _random_time(rng, now, created_at) if is_deleted else None,
+                }
+
+        report["tables"]["musics"] = _insert_batches(conn, Music.__table__, music_rows(), batch_size,
+                                                     "musics", musics)
+
+        # 每个用户一个默认歌单（ID 与用户一一对应），其余歌单的创建者有偏
+        creator_picker = SkewedPicker(rng, users)
+        total_playlists = users + playlists
+        sigma = 1.0
+        mu = math.log(max(tracks, 1)) - sigma * sigma / 2
+        music_picker = SkewedPicker(rng, musics)
+
+        def playlist_tracks(playlist_index: int, playlist_deleted: bool, created_at: datetime):
+            """生成一个歌单的歌曲，返回 (行列表, 未删除的歌曲数)"""
+            if not musics:
+                return [], 0
+            count = min(int(rng.lognormvariate(mu, sigma)), MAX_TRACKS_PER_PLAYLIST, musics)
+            chosen = set()
+            attempts = 0
+            while len(chosen) < count and attempts < count * 4:
+                chosen.add(music_picker.pick())
+                attempts += 1
+            rows = []
+            active = 0
+            for position, music_index in enumerate(chosen, start=1):
+                is_deleted = playlist_deleted or deleted_musics[music_index] or rng.random() < deleted_fraction
+                added_at = _random_time(rng, now, created_at)
+                active += not is_deleted
+                rows.append({
+                    "playlist_id": playlist_base + playlist_index, "music_id": music_base + music_index,
+                    "position": float(position), "added_at": added_at, "is_deleted": bool(is_deleted),
+                    "deleted_at": _random_time(rng, now, added_at) if is_deleted else None,
+                })
+            return rows, active
+
+        # 歌单和歌单歌曲交替写入：music_count 要在生成歌曲之后才知道
+        playlist_batch: List[dict] = []
+        track_batch: List[dict] = []
+        inserted_playlists = inserted_tracks = 0
+        phase_started = time.perf_counter()
+
+        def flush():
+            nonlocal playlist_batch, track_batch, inserted_playlists, inserted_tracks
+            if playlist_batch:
+                conn.execute(insert(Playlist.__table__), playlist_batch)
+            if track_batch:
+                conn.execute(insert(PlaylistMusic.__table__), track_batch)
+            conn.commit()
+            inserted_playlists += len(playlist_batch)
+            inserted_tracks += len(track_batch)
+            playlist_batch, track_batch = [], []
+            rate = (inserted_playlists + inserted_tracks) / max(time.perf_counter() - phase_started, 1e-9)
+            print(f"\rplaylists: {inserted_playlists}/{total_playlists}, playlist_musics: {inserted_tracks} "
+                  f"({rate:.0f} rows/s)", end="", file=sys.stderr, flush=True)
+
+        for index in range(1, total_playlists + 1):
+            if index <= users:
+                creator = index
+                name, description, cover_url = DEFAULT_PLAYLIST_NAME, DEFAULT_PLAYLIST_DESCRIPTION, DEFAULT_PLAYLIST_COVER
+            else:
+                creator = creator_picker.pick()
+                template = rng.choice(PLAYLIST_TEMPLATES)
+                name = template.format(rng.choice(ZH_WORDS if rng.random() < 0.5 else EN_WORDS))
+                description = rng.choice(["", "", _title(rng)])
+                cover_url = media[index % len(media)]["cover_url"] if media else None
+            created_at = _random_time(rng, now, user_created.get(creator))
+            # 默认歌单不能单独删除，只随用户一起删除
+            is_deleted = bool(deleted_users[creator]) or (index > users and rng.random() < deleted_fraction)
+            rows, active = playlist_tracks(index, is_deleted, created_at)
+            playlist_batch.append({
+                "id": playlist_base + index, "name": name, "description": description, "cover_url": cover_url,
+                "creator_id": user_base + creator, "created_at": created_at,
+                "updated_at": max([created_at] + [row["added_at"] for row in rows]),
+                "is_deleted": is_deleted, "deleted_at": _random_time(rng, now, created_at) if is_deleted else None,
+                "music_count": active,
+            })
+            track_batch.extend(rows)
+            if len(playlist_batch) + len(track_batch) >= batch_size:
+                flush()
+        flush()
+        print(f"\rplaylists: {inserted_playlists}, playlist_musics: {inserted_tracks} rows in "
+              f"{time.perf_counter() - phase_started:.1f}s", " " * 20, file=sys.stderr)
+        report["tables"]["playlists"] = inserted_playlists
+        report["tables"]["playlist_musics"] = inserted_tracks
+
+        conn.exec_driver_sql("ANALYZE")
+        conn.commit()
+        if is_sqlite:
+            conn.exec_driver_sql(f"PRAGMA synchronous = {int(synchronous)}")
+
+    elapsed = time.perf_counter() - started
+    total_rows = sum(report["tables"].values())
+    report["elapsed_seconds"] = round(elapsed, 3)
+    report["rows_per_second"] = round(total_rows / elapsed) if elapsed > 0 else None
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成大规模测试数据")
+    parser.add_argument("--users", type=int, default=10000, help="用户数")
+    parser.add_argument("--musics", type=int, default=100000, help="音乐数")
+    parser.add_argument("--playlists", type=int, default=20000, help="默认歌单之外的歌单数")
+    parser.add_argument("--tracks", type=int, default=30, help="每个歌单的平均歌曲数")
+    parser.add_argument("--deleted-fraction", type=float, default=0.05, help="逻辑删除的比例")
+    parser.add_argument("--media-files", type=int, default=0, help="生成的占位媒体文件组数（0 表示不生成）")
+    parser.add_argument("--media-bytes", type=int, default=4096, help="每个占位音乐文件的大小（字节）")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每个事务插入的行数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    if args.users < 1:
+        parser.error("--users 至少为 1")
+    if not 0 <= args.deleted_fraction < 1:
+        parser.error("--deleted-fraction 应在 [0, 1) 之间")
+
+    report = seed(users=args.users, musics=args.musics, playlists=args.playlists, tracks=args.tracks,
+                  deleted_fraction=args.deleted_fraction, media_files=args.media_files,
+                  media_bytes=args.media_bytes, batch_size=args.batch_size, seed_value=args.seed)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+# tracing.py
+"""轻量级分布式追踪
+
+TracingMiddleware 为每个请求创建根 span（读取 W3C traceparent 请求头，延续调用方的 trace），
+之后同一请求中的操作都会创建子 span：
+
+- 每个中间件（trace_middleware 包装）
+- 每条 SQL 语句（database.py 的语句钩子调用 start_query_span）
+- 文件读写（storage 的 put/get/delete，traced 装饰器）
+- Redis 命令（instrument_redis）和发送邮件
+- 对 S3 的请求会带上 traceparent 请求头
+
+span 使用 Zipkin v2 JSON 格式，由后台线程批量导出：TRACING_EXPORTER=file 时每行一个 span 写入 TRACING_FILE，
+zipkin 时 POST 到 TRACING_ZIPKIN_URL（Zipkin、Jaeger、OpenTelemetry Collector 都能接收）。
+TRACING_ENABLED=false（默认）时不创建任何 span，也不包装中间件。
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+logger = logging.getLogger("music_server.tracing")
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "music-server")
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", 1.0))  # 没有上游 trace 时的采样比例
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "file")  # file 或 zipkin
+TRACING_FILE = os.getenv("TRACING_FILE", "logs/traces.jsonl")
+TRACING_ZIPKIN_URL = os.getenv("TRACING_ZIPKIN_URL", "http://localhost:9411/api/v2/spans")
+TRACING_QUEUE_SIZE = int(os.getenv("TRACING_QUEUE_SIZE", 10000))  # 等待导出的最大 span 数
+TRACING_BATCH_SIZE = 200
+TRACING_FLUSH_SECONDS = 1.0
+MAX_TAG_LENGTH = 1000
+
+_TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    """一次操作，结束后放入导出队列"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start", "duration", "tags")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, kind: Optional[str] = None,
+                 tags: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.tags: Dict[str, str] = {}
+        for key, value in (tags or {}).items():
+            self.set_tag(key, value)
+
+    def set_tag(self, key: str, value: Any):
+        if value is not None:
+            self.tags[key] = str(value)[:MAX_TAG_LENGTH]
+
+    def child(self, name: str, kind: Optional[str] = None, **tags) -> "Span":
+        return Span(name, self.trace_id, self.span_id, kind, tags)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def finish(self, duration: Optional[float] = None):
+        if self.duration is None:
+            self.duration = time.time() - self.start if duration is None else duration
+            exporter.export(self)
+
+    def to_zipkin(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "traceId": self.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": int(self.start * 1_000_000),
+            "duration": max(int((self.duration or 0) * 1_000_000), 1),
+            "localEndpoint": {"serviceName": TRACING_SERVICE_NAME},
+            "tags": self.tags,
+        }
+        if self.parent_id:
+            data["parentId"] = self.parent_id
+        if self.kind:
+            data["kind"] = self.kind
+        return data
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def parse_traceparent(header: Optional[str]):
+    """解析 W3C traceparent，返回 (trace_id, parent_id, sampled)，格式不正确时返回 None"""
+    if not header:
+        return None
+    match = _TRACEPARENT_PATTERN.match(header.strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, **tags) -> Optional[Span]:
+    """创建根 span，未被采样时返回 None"""
+    parsed = parse_traceparent(traceparent)
+    if parsed is not None:
+        trace_id, parent_id, sampled = parsed
+    else:
+        trace_id, parent_id = "%032x" % random.getrandbits(128), None
+        sampled = random.random() < TRACING_SAMPLE_RATE
+    if not sampled:
+        return None
+    return Span(name, trace_id, parent_id, "SERVER", tags)
+
+
+@contextlib.contextmanager
+def activate(span: Optional[Span]):
+    """把 span 设为当前 span，退出时结束它"""
+    if span is None:
+        yield None
+        return
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set_tag("error", type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        span.finish()
+
+
+def span(name: str, kind: Optional[str] = None, **tags):
+    """在当前 span 下创建子 span（没有当前 span 时不做任何事）"""
+    parent = _current.get()
+    return activate(parent.child(name, kind, **tags) if parent is not None else None)
+
+
+def traced(name: Optional[str] = None, kind: Optional[str] = None):
+    """为函数调用创建子 span 的装饰器"""
+
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(span_name, kind):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ==================== 中间件 ====================
+
+class TracingMiddleware:
+    """为每个请求创建根 span，并在响应头中返回 traceresponse"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        root = start_trace(f"{scope['method']} {scope['path']}", traceparent,
+                           **{"http.method": scope["method"], "http.path": scope["path"]})
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set_tag("http.status_code", message["status"])
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"traceresponse", root.traceparent().encode())
+                ]
+            await send(message)
+
+        with activate(root):
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # 使用路由模板命名，便于按接口聚合
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    root.name = f"{scope['method']} {route}"
+                    root.set_tag("http.route", route)
+
+
+def trace_middleware(middleware_cls):
+    """包装中间件类，使其每次调用都创建一个 span（未启用追踪时原样返回）"""
+    if not TRACING_ENABLED:
+        return middleware_cls
+
+    class TracedMiddleware:
+        def __init__(self, app, *args, **kwargs):
+            self.inner = middleware_cls(app, *args, **kwargs)
+
+        async def __call__(self, scope, receive, send):
+            if scope["type"] != "http" or _current.get() is None:
+                await self.inner(scope, receive, send)
+                return
+            with span(f"middleware {middleware_cls.__name__}"):
+                await self.inner(scope, receive, send)
+
+    TracedMiddleware.__name__ = TracedMiddleware.__qualname__ = middleware_cls.__name__
+    return TracedMiddleware
+
+
+# ==================== 数据库、Redis、S3 ====================
+
+def start_query_span(system: str, database: str, statement: str) -> Optional[Span]:
+    """为一条 SQL 语句创建 span（由 database.py 的语句钩子调用，结束时传入钩子测得的耗时）"""
+    parent = _current.get() if TRACING_ENABLED else None
+    if parent is None:
+        return None
+    return parent.child("db.query", "CLIENT", **{"db.system": system, "db.name": database, "db.statement": statement})
+
+
+def instrument_redis(client):
+    """为 Redis 命令和 pipeline 创建 span"""
+    if not TRACING_ENABLED:
+        return client
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def traced_execute_command(*args, **options):
+        if _current.get() is None:
+            return execute_command(*args, **options)
+        with span(f"redis {args[0]}", "CLIENT", **{"db.system": "redis"}):
+            return execute_command(*args, **options)
+
+    def traced_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def traced_execute(*exec_args, **exec_kwargs):
+            if _current.get() is None:
+                return execute(*exec_args, **exec_kwargs)
+            with span("redis pipeline", "CLIENT", **{"db.system": "redis", "redis.commands": len(pipe)}):
+                return execute(*exec_args, **exec_kwargs)
+
+        pipe.execute = traced_execute
+        return pipe
+
+    client.execute_command = traced_execute_command
+    client.pipeline = traced_pipeline
+    return client
+
+
+def inject_botocore_headers(request, **kwargs):
+    """botocore before-send 事件：为请求加上 traceparent"""
+    current = _current.get()
+    if current is not None:
+        request.headers["traceparent"] = current.traceparent()
+
+
+# ==================== 导出 ====================
+
+class SpanExporter:
+    """后台线程批量导出 span，队列满时丢弃"""
+
+    def __init__(self, max_size: int = TRACING_QUEUE_SIZE):
+        self.queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self.exported = 0
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def export(self, finished: Span):
+        try:
+            self.queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(TRACING_FLUSH_SECONDS)
+            while not self.queue.empty():
+                self.flush()
+            if stopping:
+                return
+
+    def flush(self):
+        batch: List[Dict[str, Any]] = []
+        while len(batch) < TRACING_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait().to_zipkin())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+        try:
+            if TRACING_EXPORTER == "zipkin":
+                request = urllib.request.Request(TRACING_ZIPKIN_URL, data=json.dumps(batch).encode("utf-8"),
+                                                 headers={"Content-Type": "application/json"}, method="POST")
+                with urllib.request.urlopen(request, timeout=5):
+                    pass
+            else:
+                os.makedirs(os.path.dirname(TRACING_FILE) or ".", exist_ok=True)
+                with open(TRACING_FILE, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(item, ensure_ascii=False) + "\n" for item in batch))
+            self.exported += len(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.warning("导出追踪数据失败（丢弃 %d 个 span）: %s", len(batch), e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": TRACING_ENABLED, "exporter": TRACING_EXPORTER, "exported": self.exported,
+                "dropped": self.dropped, "pending": self.queue.qsize()}
+
+
+exporter = SpanExporter()